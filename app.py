@@ -2,6 +2,8 @@
 Точка входа для разового запуска парсинга Etsy магазинов
 """
 from core.monitor import EtsyMonitor
+from services.sheets_export_queue import flush_sheets_exports
+from utils.http_session import close_shared_sessions
 
 def main():
     """Главная функция для разового парсинга"""
@@ -23,6 +25,9 @@ def main():
         print(f"\n❌ Ошибка при парсинге: {e}")
         
     finally:
+        # Дожидаемся выгрузки в Google Sheets, поставленной в очередь за цикл
+        flush_sheets_exports()
+        close_shared_sessions()
         print("👋 До свидания!")
 
 if __name__ == "__main__":
@@ -14,6 +14,7 @@ from bot.handlers import router
 from bot.notifications import NotificationService
 from bot.scheduler_integration import BotScheduler
 from bot.analytics_scheduler import AnalyticsScheduler
+from utils.http_session import close_shared_sessions
 
 async def setup_bot_database(db: BotDatabase):
     """Настройка базы данных бота"""
@@ -103,8 +104,9 @@ async def main():
         await scheduler.stop_scheduler()
         await analytics_scheduler.stop_scheduler()
         
-        # Закрываем сессию бота
+        # Закрываем сессию бота и общие HTTP-сессии (keep-alive соединения EverBee)
         await bot.session.close()
+        close_shared_sessions()
         logging.info("Бот остановлен")
 
 if __name__ == "__main__":
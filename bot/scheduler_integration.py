@@ -62,7 +62,10 @@ class ParserLock:
             with open(self.config_file, 'w', encoding='utf-8') as f:
                 for k, v in existing_data.items():
                     f.write(f"{k}={v}\n")
-                
+            
+            from config.settings import invalidate_config_cache
+            invalidate_config_cache(self.config_file)
+            
         except Exception as e:
             logging.error(f"Ошибка обновления config-main.txt: {e}")
     
@@ -181,7 +184,15 @@ class LoggingEtsyMonitor:
                 )
             
             # Сохраняем финальные результаты
-            final_results_file = self.monitor.data_service.save_results_with_new_products(all_shop_products, new_products_dict)
+            new_products_shops = {
+                product.listing_id: shop_name
+                for shop_name, products in all_shop_products.items()
+                for product in products
+                if product.listing_id in new_products_dict
+            }
+            final_results_file = self.monitor.data_service.save_results_with_new_products(
+                all_shop_products, new_products_dict, shop_names=new_products_shops
+            )
             
             # Формируем результаты для бота
             comparison_results = []
@@ -225,37 +236,44 @@ class LoggingEtsyMonitor:
             return []
     
     def parse_all_shops_with_logging(self, urls):
-        """Парсит все магазины в одном браузере по очереди"""
+        """Парсит все магазины (параллельно при config.etsy.max_workers > 1)"""
+        from config.settings import is_parser_working
         all_shop_products = {}
         
-        for i, url in enumerate(urls, 1):
-            # Проверяем, не был ли парсинг остановлен принудительно
-            from config.settings import is_parser_working
-            if not is_parser_working():
-                self.log_sync("🛑 Парсинг остановлен пользователем")
-                break
-            
-            try:
-                shop_name = self.monitor.parser.get_shop_name_from_url(url)
+        # Остановку пользователем проверяет iter_shop_results (should_continue)
+        results = self.monitor.iter_shop_results(urls, should_continue=is_parser_working)
+        parsed = 0
+        try:
+            for i, (url, products, error) in enumerate(results, 1):
+                parsed = i
+                shop_name = self.monitor.parser.get_shop_name_from_url(url) if url else "Unknown"
                 self.log_sync(f"🔄 [{i}/{len(urls)}] Парсим: {shop_name}")
                 
-                # Парсим магазин (только первую страницу)
-                products = self.monitor.parser.parse_shop_page(url)
-                
-                if products:
-                    all_shop_products[shop_name] = products
+                if error:
+                    self.log_sync(f"❌ Ошибка в {shop_name}: {str(error)[:50]}")
+                    logging.error(f"Ошибка парсинга {url}: {error}")
+                    continue
+            
+                try:
+                    if products:
+                        all_shop_products[shop_name] = products
                     
-                    # Сохраняем данные
-                    filename = self.monitor.data_service.save_products_to_excel(products, shop_name)
+                        # Сохраняем данные
+                        filename = self.monitor.data_service.save_products_to_excel(products, shop_name)
                     
-                    self.log_sync(f"✅ {shop_name}: {len(products)} товаров (первая страница)")
-                else:
-                    self.log_sync(f"⚠️ {shop_name}: не удалось получить товары")
+                        self.log_sync(f"✅ {shop_name}: {len(products)} товаров (первая страница)")
+                    else:
+                        self.log_sync(f"⚠️ {shop_name}: не удалось получить товары")
                 
-            except Exception as e:
-                shop_name = self.monitor.parser.get_shop_name_from_url(url) if url else "Unknown"
-                self.log_sync(f"❌ Ошибка в {shop_name}: {str(e)[:50]}")
-                logging.error(f"Ошибка парсинга {url}: {e}")
+                except Exception as e:
+                    self.log_sync(f"❌ Ошибка в {shop_name}: {str(e)[:50]}")
+                    logging.error(f"Ошибка парсинга {url}: {e}")
+        finally:
+            # Отменяет ещё не начатые задачи пула, даже если обработка упала
+            results.close()
+        
+        if parsed < len(urls):
+            self.log_sync("🛑 Парсинг остановлен пользователем")
         
         # Закрываем браузер после всех магазинов
         if hasattr(self.monitor.parser, 'close_browser'):
@@ -583,6 +601,10 @@ class BotScheduler:
             # Очищаем расписание
             schedule.clear()
             
+            # Выгружаем в Google Sheets то, что ещё стоит в очереди
+            from services.sheets_export_queue import flush_sheets_exports
+            await asyncio.get_running_loop().run_in_executor(None, flush_sheets_exports)
+            
             logging.info("Планировщик остановлен")
             
             # Уведомляем администраторов об остановке
@@ -2,26 +2,77 @@
 Конфигурация приложения
 """
 import os
+import threading
 from dataclasses import dataclass
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 
-def read_config_file() -> Dict[str, str]:
-    """Читает конфигурацию из config-main.txt"""
+CONFIG_FILE = "config-main.txt"
+
+# Разобранные файлы конфигурации: абсолютный путь -> ((mtime_ns, size), данные)
+_config_cache: Dict[str, Tuple[Tuple[int, int], Dict[str, str]]] = {}
+_config_cache_lock = threading.Lock()
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _parse_config_file(path: str) -> Optional[Dict[str, str]]:
+    """Разбирает файл конфигурации. None - если файл не удалось прочитать"""
     config_data = {}
-    config_file = "config-main.txt"
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and '=' in line:
+                    key, value = line.split('=', 1)
+                    config_data[key.strip()] = value.strip()
+    except Exception as e:
+        print(f"Ошибка чтения {os.path.basename(path)}: {e}")
+        return None
+    return config_data
+
+
+def read_config_file(config_file: str = CONFIG_FILE) -> Dict[str, str]:
+    """Читает конфигурацию из config-main.txt.
     
-    if os.path.exists(config_file):
-        try:
-            with open(config_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and '=' in line:
-                        key, value = line.split('=', 1)
-                        config_data[key.strip()] = value.strip()
-        except Exception as e:
-            print(f"Ошибка чтения config-main.txt: {e}")
+    Файл разбирается заново только при изменении mtime/размера, иначе возвращается копия из кэша.
+    Неудачное чтение не кэшируется: возвращается последняя удачно прочитанная версия (или {}).
+    """
+    path = os.path.abspath(config_file)
+    signature = _file_signature(path)
+    if signature is None:
+        return {}
     
-    return config_data
+    with _config_cache_lock:
+        cached = _config_cache.get(path)
+        if cached is not None and cached[0] == signature:
+            return dict(cached[1])
+    
+    config_data = _parse_config_file(path)
+    if config_data is None:
+        # Например, файл занят другим процессом на время записи - попробуем при следующем вызове
+        return dict(cached[1]) if cached is not None else {}
+    
+    # Кэшируем, только если файл не изменился, пока мы его читали
+    if _file_signature(path) == signature:
+        with _config_cache_lock:
+            _config_cache[path] = (signature, config_data)
+    return dict(config_data)
+
+
+def invalidate_config_cache(config_file: Optional[str] = None):
+    """Сбрасывает кэш конфигурации (вызывать после записи в файл)"""
+    with _config_cache_lock:
+        if config_file is None:
+            _config_cache.clear()
+        else:
+            _config_cache.pop(os.path.abspath(config_file), None)
+
 
 def is_parser_working() -> bool:
     """Проверяет, запущен ли парсер согласно config-main.txt"""
@@ -35,6 +86,33 @@ class EtsyConfig:
     request_delay: int = 2  # Задержка между страницами
     max_retries: int = 3    # Количество попыток перезагрузки браузера
     page_load_timeout: int = 90  # Таймаут ожидания загрузки страницы (1.5 минуты)
+    max_workers: int = 1    # Количество потоков парсинга магазинов (1 = последовательно)
+    min_request_interval: Optional[float] = None  # Общий интервал между запросами всех потоков (None = request_delay)
+    browser_workers: int = 1  # Количество независимых браузеров в EtsyParser.parse_shops
+    browser_use_proxy: bool = False  # Запускать браузеры через прокси из proxies.txt (у каждого воркера свой)
+    browser_warm_standby: bool = False  # Держать заранее запущенный резервный браузер для мгновенного перезапуска (вдвое больше процессов Chrome)
+    cdp_network_events: bool = True  # Получать статус страницы через подписку CDP, а не опросом performance-логов
+    http_fetch_mode: bool = False  # После успешной загрузки в браузере грузить магазины по HTTP с его cookies (опционально)
+    http_fetch_timeout: float = 30  # Таймаут HTTP-загрузки страницы магазина (сек)
+
+@dataclass
+class EverBeeConfig:
+    """Конфигурация HTTP-клиента EverBee API"""
+    pool_size: int = 10           # Максимум keep-alive соединений в общем пуле
+    connect_timeout: float = 10   # Таймаут установки соединения (сек)
+    read_timeout: float = 30      # Таймаут ожидания ответа (сек)
+    requests_per_second: float = 5.0  # Общий лимит запросов к EverBee для всего процесса
+    burst: int = 5                # Сколько запросов можно отправить подряд без ожидания
+    max_retries: int = 4          # Повторы при 429/5xx и сетевых ошибках
+    backoff_base: float = 1.0     # Базовая задержка экспоненциального backoff (сек)
+    backoff_max: float = 60.0     # Максимальная задержка между повторами (сек)
+    shop_page_size: int = 50      # Листингов на страницу при загрузке магазина
+    shop_max_pages: int = 10      # Максимум страниц магазина за один цикл
+    max_listing_age_months: int = 2  # Листинги этого возраста и старше не считаются новинками
+    stats_cache_ttl: Optional[float] = None  # Время жизни кэша статистики листингов (None = до конца цикла)
+    batch_chunk_size: int = 64    # Листингов в одном пакетном запросе
+    batch_max_workers: int = 4    # Сколько пакетов отправлять параллельно
+    batch_chunk_retries: int = 2  # Повторы для пакетов, которые не удалось получить
 
 @dataclass
 class AppConfig:
@@ -65,9 +143,12 @@ class AppConfig:
     telegram_notifications_enabled: bool = True
     
     etsy: EtsyConfig = None
+    everbee: EverBeeConfig = None
     
     def __post_init__(self):
         if self.etsy is None:
             self.etsy = EtsyConfig()
+        if self.everbee is None:
+            self.everbee = EverBeeConfig()
 
 config = AppConfig()
\ No newline at end of file
@@ -3,12 +3,17 @@
 """
 import time
 import logging
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Callable, Iterator, Tuple
 from config.settings import config
 from parsers.everbee_parser import EverBeeParser
 from services.data_service import DataService
 from services.tops_service import TopsService
 from models.product import Product
+from utils.rate_limiter import RateLimiter
+
+# Маркер магазина, пропущенного из-за остановки парсера
+_SKIPPED = object()
 
 class EtsyMonitor:
     """Основной класс для мониторинга магазинов Etsy"""
@@ -16,8 +21,16 @@ class EtsyMonitor:
     def __init__(self):
         self.config = config
         self.parser = EverBeeParser(config)
-        self.data_service = DataService(config)
-        self.tops_service = TopsService(self.data_service.tops_dir)
+        # Один EverBee клиент (токен + пул соединений) на все сервисы монитора
+        everbee_client = self.parser.everbee_client
+        self.data_service = DataService(config, everbee_client=everbee_client)
+        self.tops_service = TopsService(self.data_service.tops_dir, everbee_client=everbee_client)
+        
+        # Общий лимит запросов для всех потоков парсинга
+        min_interval = config.etsy.min_request_interval
+        if min_interval is None:
+            min_interval = config.etsy.request_delay
+        self.rate_limiter = RateLimiter(min_interval)
     
     def parse_single_shop(self, shop_url: str, compare_with_previous: bool = True) -> str:
         """Парсит один магазин и сохраняет результат"""
@@ -43,6 +56,43 @@ class EtsyMonitor:
         
         return filename
     
+    def iter_shop_results(self, urls: List[str],
+                          should_continue: Optional[Callable[[], bool]] = None
+                          ) -> Iterator[Tuple[str, Optional[List[Product]], Optional[Exception]]]:
+        """Парсит магазины в пуле потоков и отдаёт (url, products, error) в исходном порядке.
+        
+        Количество потоков задаётся config.etsy.max_workers, частота запросов
+        ограничивается общим RateLimiter. Если should_continue() возвращает False,
+        новые магазины не запускаются.
+        """
+        workers = max(1, self.config.etsy.max_workers or 1)
+        
+        # Уже виденные листинги позволяют парсеру не загружать лишние страницы
+        if hasattr(self.parser, 'set_known_listings'):
+            self.parser.set_known_listings(self.data_service.seen_listings)
+        
+        def fetch(url: str):
+            if should_continue and not should_continue():
+                return _SKIPPED
+            self.rate_limiter.acquire()
+            return self.parser.parse_shop_page(url)
+        
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shop-parser")
+        try:
+            futures = [(url, executor.submit(fetch, url)) for url in urls]
+            for url, future in futures:
+                try:
+                    products = future.result()
+                except Exception as e:
+                    yield url, None, e
+                    continue
+                
+                if products is _SKIPPED:
+                    return
+                yield url, products, None
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
     def parse_all_shops(self, compare_with_previous: bool = True) -> Dict[str, List[Product]]:
         """Парсит все магазины"""
         urls = self.data_service.load_shop_urls()
@@ -52,50 +102,36 @@ class EtsyMonitor:
             return {}
         
         all_shop_products = {}
-        i = 0
         
-        while i < len(urls):
-            url = urls[i]
+        for i, (url, products, error) in enumerate(self.iter_shop_results(urls), 1):
             shop_name = self.parser.get_shop_name_from_url(url)
-            print(f"\n--- Парсинг магазина {i+1}/{len(urls)}: {shop_name} ({url}) ---")
+            print(f"\n--- Парсинг магазина {i}/{len(urls)}: {shop_name} ({url}) ---")
             
-            try:
-                products = self.parser.parse_shop_page(url)
-                
-                if products:
-                    # Сохраняем в Excel
-                    excel_file = self.data_service.save_products_to_excel(products, shop_name)
-                    
-                    # Добавляем в общий словарь
-                    all_shop_products[shop_name] = products
-                    
-                    print(f"✅ Магазин {shop_name} успешно обработан ({len(products)} товаров)")
-                    
-                    # Сравниваем с предыдущими данными если нужно
-                    if compare_with_previous:
-                        comparison = self.data_service.compare_shop_data(products, shop_name)
-                        if comparison:
-                            self.data_service.print_comparison_results(comparison)
-                            
-                            if comparison.has_changes:
-                                print(f"🔔 Обнаружены изменения в магазине {shop_name}!")
-                    
-                    # Переходим к следующему магазину
-                    i += 1
-                    
-                    # Пауза между запросами
-                    if i < len(urls):
-                        print(f"Пауза {self.config.etsy.request_delay} сек...")
-                        time.sleep(self.config.etsy.request_delay)
-                else:
-                    print(f"⚠️ Магазин {shop_name} не удалось обработать, переходим к следующему")
-                    i += 1
-                    
-            except Exception as e:
-                print(f"❌ Критическая ошибка при парсинге {url}: {e}")
+            if error:
+                print(f"❌ Критическая ошибка при парсинге {url}: {error}")
                 print("🔄 Переходим к следующему магазину")
-                i += 1
                 continue
+            
+            if not products:
+                print(f"⚠️ Магазин {shop_name} не удалось обработать, переходим к следующему")
+                continue
+            
+            # Сохраняем в Excel
+            excel_file = self.data_service.save_products_to_excel(products, shop_name)
+            
+            # Добавляем в общий словарь
+            all_shop_products[shop_name] = products
+            
+            print(f"✅ Магазин {shop_name} успешно обработан ({len(products)} товаров)")
+            
+            # Сравниваем с предыдущими данными если нужно
+            if compare_with_previous:
+                comparison = self.data_service.compare_shop_data(products, shop_name)
+                if comparison:
+                    self.data_service.print_comparison_results(comparison)
+                    
+                    if comparison.has_changes:
+                        print(f"🔔 Обнаружены изменения в магазине {shop_name}!")
         
         return all_shop_products
     
@@ -136,17 +172,19 @@ class EtsyMonitor:
         logging.debug(f"🔍 DEBUG: new_products_dict length = {len(new_products_dict) if new_products_dict else 0}")
         logging.debug(f"🔍 DEBUG: new_products_dict bool = {bool(new_products_dict)}")
         
-        # Находим полные данные новых товаров
+        # Полные данные и магазин каждого нового товара - за один проход по результатам
         new_products_full_data = {}
-        for listing_id in new_products_dict:
-            for shop_name, products in all_shop_products.items():
-                for product in products:
-                    if product.listing_id == listing_id:
-                        new_products_full_data[listing_id] = product
-                        break
+        new_products_shops = {}
+        for shop_name, products in all_shop_products.items():
+            for product in products:
+                if product.listing_id in new_products_dict and product.listing_id not in new_products_full_data:
+                    new_products_full_data[product.listing_id] = product
+                    new_products_shops[product.listing_id] = shop_name
         
         # Сохраняем финальные результаты с новыми товарами
-        final_results_file = self.data_service.save_results_with_new_products(all_shop_products, new_products_dict, new_products_full_data)
+        final_results_file = self.data_service.save_results_with_new_products(
+            all_shop_products, new_products_dict, new_products_full_data, new_products_shops
+        )
         
         # Анализируем новые товары через EverBee
         logging.debug(f"\n🔍 DEBUG: Проверка условия для EverBee...")
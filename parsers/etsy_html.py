@@ -0,0 +1,116 @@
+"""
+Быстрый разбор HTML страниц магазинов Etsy на lxml
+Проверка блокировки и извлечение листингов по одной копии исходного кода страницы
+"""
+import re
+import logging
+from typing import List, Optional, Tuple
+from lxml import html as lxml_html
+from models.product import Product
+
+# Фразы, указывающие на блокировку (одно регулярное выражение вместо отдельного поиска каждой фразы)
+BLOCKING_PHRASES = [
+    'Вы были заблокированы',
+    'you have been blocked',
+    'access denied',
+    'нечто в поведении браузера нас насторожило',
+    'что-то блокирует работу javascript',
+    'находится робот',
+    'сверхчеловеческой скоростью',
+    'something about your browser made us think',
+    'robot in the same network',
+    'blocking javascript',
+    'superhuman speed',
+    'captcha-delivery.com',  # Капча от Etsy (включая geo./ct./static. поддомены)
+]
+_BLOCKING_RE = re.compile('|'.join(re.escape(phrase) for phrase in BLOCKING_PHRASES), re.IGNORECASE)
+
+LISTING_GRID_MARKER = 'shop_home_listing_grid'
+_LISTING_GRID_XPATH = f'//div[@data-appears-component-name="{LISTING_GRID_MARKER}"]'
+_CLASS_XPATH = './/span[contains(concat(" ", normalize-space(@class), " "), " {} ")]'
+
+ETSY_BASE_URL = 'https://www.etsy.com'
+
+
+def find_blocking_phrase(html_content: str) -> Optional[str]:
+    """Возвращает найденную фразу блокировки (или None) за один проход по странице"""
+    match = _BLOCKING_RE.search(html_content)
+    return match.group(0) if match else None
+
+
+def detect_blocking(html_content: str, current_url: str = "") -> Optional[str]:
+    """Возвращает причину блокировки или None, если страница выглядит нормально"""
+    phrase = find_blocking_phrase(html_content)
+    if phrase:
+        return f"найдена фраза: '{phrase}'"
+
+    if 'captcha-delivery.com' in current_url.lower():
+        return f"URL содержит капчу: {current_url}"
+
+    # Слишком мало контента и нет основных элементов
+    if len(html_content) < 10000 and LISTING_GRID_MARKER not in html_content:
+        return "слишком мало контента и нет основных элементов"
+
+    return None
+
+
+def _first_text(element, xpath: str) -> Optional[str]:
+    found = element.xpath(xpath)
+    if not found:
+        return None
+    return found[0].text_content().strip()
+
+
+def _parse_listing_link(link, shop_name: str) -> Product:
+    """Преобразует ссылку <a data-listing-id> в Product"""
+    product_url = link.get('href')
+    if product_url and not product_url.startswith('http'):
+        product_url = ETSY_BASE_URL + product_url
+
+    title = link.get('title')
+    if not title:
+        title = _first_text(link, './/h3') or "Без названия"
+
+    price = _first_text(link, _CLASS_XPATH.format('currency-value'))
+    currency = _first_text(link, _CLASS_XPATH.format('currency-symbol')) if price else None
+
+    img = link.find('.//img')
+    image_url = img.get('src') if img is not None else None
+
+    return Product(
+        listing_id=link.get('data-listing-id'),
+        title=title,
+        url=product_url,
+        shop_name=shop_name,
+        price=price,
+        currency=currency,
+        image_url=image_url
+    )
+
+
+def extract_listings(html_content: str, shop_name: str) -> Optional[List[Product]]:
+    """Извлекает товары из сетки листингов. None - если сетка на странице не найдена"""
+    document = lxml_html.fromstring(html_content)
+    grids = document.xpath(_LISTING_GRID_XPATH)
+    if not grids:
+        return None
+
+    products = []
+    for link in grids[0].iterfind('.//a[@data-listing-id]'):
+        try:
+            products.append(_parse_listing_link(link, shop_name))
+        except Exception as e:
+            logging.error(f"❌ Ошибка при парсинге товара: {e}")
+    return products
+
+
+def parse_shop_html(html_content: str, shop_name: str, current_url: str = "") -> Tuple[Optional[str], Optional[List[Product]]]:
+    """Проверяет страницу на блокировку и извлекает товары.
+
+    Возвращает (причина_блокировки, None) для заблокированной страницы,
+    иначе (None, товары или None, если сетка листингов не найдена).
+    """
+    reason = detect_blocking(html_content, current_url)
+    if reason:
+        return reason, None
+    return None, extract_listings(html_content, shop_name)
@@ -7,19 +7,53 @@
 """
 import re
 import time
+import queue
 import logging
-from typing import List, Optional
+import threading
+from typing import List, Optional, Iterator, Tuple, Iterable
 from bs4 import BeautifulSoup
 from parsers.base_parser import BaseParser
 from models.product import Product
+from parsers.etsy_html import parse_shop_html
 from services.browser_service import BrowserService
+from utils.proxy_manager import ProxyManager, get_shared_proxy_manager
 
 class EtsyParser(BaseParser):
-    """Парсер для магазинов Etsy только через браузер"""
+    """Парсер для магазинов Etsy только через браузер.
     
-    def __init__(self, config):
+    У каждого потока свой BrowserService, поэтому parse_shop_page можно вызывать
+    из нескольких потоков, а parse_shops запускает пул из config.etsy.browser_workers браузеров.
+    """
+    
+    def __init__(self, config, proxy_manager: Optional[ProxyManager] = None):
         super().__init__(config)
-        self.browser_service = None
+        self._local = threading.local()
+        self._workers: List[BrowserService] = []
+        self._workers_lock = threading.Lock()
+        self._proxy_manager = proxy_manager
+    
+    @property
+    def proxy_manager(self) -> ProxyManager:
+        """Общий для всех воркеров ProxyManager (создаётся при первом обращении)"""
+        with self._workers_lock:
+            if self._proxy_manager is None:
+                self._proxy_manager = get_shared_proxy_manager()
+            return self._proxy_manager
+    
+    @property
+    def browser_service(self) -> Optional[BrowserService]:
+        """Браузер текущего потока"""
+        return getattr(self._local, 'browser_service', None)
+    
+    @browser_service.setter
+    def browser_service(self, service: Optional[BrowserService]):
+        previous = self.browser_service
+        self._local.browser_service = service
+        with self._workers_lock:
+            if previous is not None and previous in self._workers:
+                self._workers.remove(previous)
+            if service is not None:
+                self._workers.append(service)
     
     def get_shop_name_from_url(self, url: str) -> str:
         """Извлекает название магазина из URL"""
@@ -42,6 +76,12 @@ class EtsyParser(BaseParser):
         
         logging.info(f"📄 Парсим первую страницу: {shop_url_with_sort}")
         
+        # Если сессия браузера уже установлена - пробуем обычный HTTP-запрос с её cookies
+        products = self._fetch_shop_over_http(shop_url_with_sort)
+        if products is not None:
+            logging.info(f"✅ Найдено товаров (HTTP): {len(products)}")
+            return products
+        
         # Инициализируем браузер если его нет
         if not self.browser_service or not self.browser_service.driver:
             if not self._initialize_browser():
@@ -65,19 +105,139 @@ class EtsyParser(BaseParser):
         
         if products:
             logging.info(f"✅ Найдено товаров: {len(products)}")
+            # Сессия браузера рабочая - следующие магазины загружаем по HTTP
+            self._start_http_session()
         else:
             logging.info("⚠️ Товары не найдены")
         
         return products if products else []
     
+    def parse_shops(self, shop_urls: Iterable[str], workers: Optional[int] = None,
+                    should_continue=None) -> Iterator[Tuple[str, List[Product], Optional[Exception]]]:
+        """Парсит магазины пулом независимых браузеров и отдаёт (url, products, error) в исходном порядке.
+        
+        Воркеры берут URL из общей очереди. Каждый воркер держит свой браузер и свой прокси,
+        поэтому блокировка и перезапуск одного браузера не останавливают остальные.
+        Если should_continue() возвращает False, воркеры не берут новые магазины.
+        """
+        urls = list(shop_urls)
+        workers = max(1, min(workers or self.config.etsy.browser_workers or 1, len(urls) or 1))
+        
+        tasks: "queue.Queue" = queue.Queue()
+        for index, url in enumerate(urls):
+            tasks.put((index, url))
+        
+        results = {}
+        results_ready = threading.Condition()
+        stop_event = threading.Event()
+        
+        def worker():
+            try:
+                while not stop_event.is_set():
+                    try:
+                        index, url = tasks.get_nowait()
+                    except queue.Empty:
+                        return
+                    
+                    if should_continue and not should_continue():
+                        stop_event.set()
+                        result = None
+                    else:
+                        try:
+                            result = (self.parse_shop_page(url), None)
+                        except Exception as e:
+                            logging.error(f"❌ Воркер {threading.current_thread().name}: ошибка при парсинге {url}: {e}")
+                            result = ([], e)
+                    
+                    with results_ready:
+                        results[index] = result
+                        results_ready.notify_all()
+            finally:
+                # Браузер воркера закрываем в его же потоке
+                self.close_browser()
+        
+        threads = [
+            threading.Thread(target=worker, name=f"browser-worker-{i + 1}", daemon=True)
+            for i in range(workers)
+        ]
+        logging.info(f"🚀 Запуск пула браузеров: {workers} воркеров на {len(urls)} магазинов")
+        for thread in threads:
+            thread.start()
+        
+        try:
+            for index, url in enumerate(urls):
+                with results_ready:
+                    while index not in results:
+                        if not any(thread.is_alive() for thread in threads):
+                            return
+                        results_ready.wait(timeout=1)
+                    result = results.pop(index)
+                
+                if result is None:
+                    return
+                products, error = result
+                yield url, products, error
+        finally:
+            stop_event.set()
+    
+    def _start_http_session(self):
+        """Создаёт HTTP-сессию потока из cookies и заголовков текущего браузера"""
+        if not self.config.etsy.http_fetch_mode or not self.browser_service:
+            return
+        self._drop_http_session()
+        self._local.http_session = self.browser_service.build_http_session()
+    
+    def _drop_http_session(self):
+        """Закрывает HTTP-сессию потока (следующая страница снова пойдёт через браузер)"""
+        session = getattr(self._local, 'http_session', None)
+        self._local.http_session = None
+        if session is not None:
+            session.close()
+    
+    def _fetch_shop_over_http(self, page_url: str) -> Optional[List[Product]]:
+        """Загружает и разбирает страницу магазина по HTTP без браузера.
+        
+        Возвращает None, если HTTP-режим недоступен или страница заблокирована - тогда
+        сессия сбрасывается и страница загружается в браузере.
+        """
+        session = getattr(self._local, 'http_session', None)
+        if session is None:
+            return None
+        
+        try:
+            response = session.get(page_url, timeout=self.config.etsy.http_fetch_timeout)
+        except Exception as e:
+            logging.warning(f"⚠️ HTTP-загрузка не удалась ({e}), переходим на браузер")
+            self._drop_http_session()
+            return None
+        
+        if response.status_code != 200:
+            logging.info(f"🚫 HTTP-загрузка вернула {response.status_code}, переходим на браузер")
+            self._drop_http_session()
+            return None
+        
+        blocking_reason, products = parse_shop_html(
+            response.text, self.get_shop_name_from_url(page_url), response.url
+        )
+        if blocking_reason or products is None:
+            logging.info(f"🚫 HTTP-страница не подходит ({blocking_reason or 'нет контейнера с товарами'}), переходим на браузер")
+            self._drop_http_session()
+            return None
+        
+        return products
+    
     def _initialize_browser(self) -> bool:
-        """Инициализирует браузер с повторными попытками и прокси"""
+        """Инициализирует браузер текущего потока с повторными попытками и прокси"""
+        use_proxy = self.config.etsy.browser_use_proxy
         if not self.browser_service:
-            self.browser_service = BrowserService(self.config)
+            self.browser_service = BrowserService(self.config, proxy_manager=self.proxy_manager)
+        
+        # Каждый воркер получает свой прокси по кругу, чтобы браузеры не делили один IP
+        proxy = self.proxy_manager.get_next_proxy() if use_proxy else None
             
         # Пытаемся запустить браузер с повторными попытками
         for attempt in range(3):
-            if self.browser_service.setup_driver(use_proxy=False):
+            if self.browser_service.setup_driver(use_proxy=use_proxy, proxy=proxy):
                 return True
             else:
                 logging.info(f"❌ Попытка {attempt + 1}/3 запуска браузера не удалась")
@@ -91,11 +251,23 @@ class EtsyParser(BaseParser):
         return False
     
     def close_browser(self):
-        """Закрывает браузер"""
+        """Закрывает браузер текущего потока"""
+        self._drop_http_session()
         if self.browser_service:
             self.browser_service.close_browser()
             self.browser_service = None
     
+    def close_all_browsers(self):
+        """Закрывает браузеры всех потоков"""
+        with self._workers_lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for service in workers:
+            service.close_browser()
+        self._local = threading.local()
+        if self._proxy_manager is not None:
+            self._proxy_manager.flush_stats()
+    
     def _load_first_page_with_browser_retry(self, shop_url: str) -> bool:
         """Загружает первую страницу с обработкой 403 ошибок и сменой прокси при необходимости"""
         max_browser_restarts = 3
@@ -185,118 +357,43 @@ class EtsyParser(BaseParser):
                         return []
                 time.sleep(1)  # Быстрая загрузка
         
-        # Проверяем на блокировку и обрабатываем её (дополнительная проверка)
-        if not self._handle_blocking_with_retries(page_url):
-            logging.info("❌ Не удалось обойти блокировку после всех попыток")
-            return None  # Сигнал для перезапуска браузера
-        
-        # Получаем HTML контент из браузера
+        # Получаем HTML контент из браузера один раз: и для проверки блокировки, и для товаров
         html_content = self.browser_service.get_page_source()
         
         if not html_content:
             logging.info("❌ Не удалось получить HTML контент")
             return []
         
-        # Парсим HTML
-        soup = BeautifulSoup(html_content, 'html.parser')
+        # Проверяем на блокировку и извлекаем товары (lxml)
+        shop_name = self.get_shop_name_from_url(page_url)
+        blocking_reason, products = parse_shop_html(
+            html_content, shop_name, self.browser_service.driver.current_url
+        )
+        
+        if blocking_reason:
+            logging.info(f"🚫 БЛОКИРОВКА ОБНАРУЖЕНА! {blocking_reason}")
+            logging.info("🔄 Требуется перезапуск браузера с новым IP/сессией")
+            self.browser_service.report_proxy_blocked()
+            return None  # Сигнал для перезапуска браузера
         
-        # Ищем контейнер с товарами
-        listing_grid = soup.find('div', {'data-appears-component-name': 'shop_home_listing_grid'})
+        logging.info("✅ Признаков блокировки не обнаружено")
         
-        if not listing_grid:
+        if products is None:
             logging.info("⚠️ Не найден контейнер с товарами")
             return []
         
-        # Ищем все ссылки с data-listing-id
-        listing_links = listing_grid.find_all('a', {'data-listing-id': True})
-        
-        products = []
-        shop_name = self.get_shop_name_from_url(page_url)
-        
-        for link in listing_links:
-            try:
-                product = self._parse_product_element(link, shop_name)
-                if product:
-                    products.append(product)
-                    
-            except Exception as e:
-                logging.error(f"❌ Ошибка при парсинге товара: {e}")
-                continue
-        
         # После парсинга товаров делаем плавный скролл к пагинации
         self._scroll_to_pagination()
         
         return products
     
-    def _handle_blocking_with_retries(self, page_url: str) -> bool:
-        """Проверяет на блокировку. При обнаружении блокировки сразу требует перезапуск браузера"""
-        if self._check_for_blocking():
-            logging.info("🚫 БЛОКИРОВКА ОБНАРУЖЕНА! Перезагрузка страницы не поможет")
-            logging.info("🔄 Требуется перезапуск браузера с новым IP/сессией")
-            return False  # Сигнал для перезапуска браузера
-        else:
-            # Блокировки нет, все в порядке
-            return True
-    
-    def _check_for_blocking(self) -> bool:
-        """Проверяет HTML страницы на наличие сообщений о блокировке"""
-        try:
-            html_content = self.browser_service.get_page_source()
-            if not html_content:
-                return False
-            
-            page_source = html_content.lower()
-            
-            # Расширенный список фраз, указывающих на блокировку
-            blocking_phrases = [
-                'Вы были заблокированы',
-                'you have been blocked',
-                'access denied',
-                'нечто в поведении браузера нас насторожило',
-                'что-то блокирует работу javascript',
-                'находится робот',
-                'сверхчеловеческой скоростью',
-                'something about your browser made us think',
-                'robot in the same network',
-                'blocking javascript',
-                'superhuman speed',
-                'captcha-delivery.com',  # Капча от Etsy
-                'geo.captcha-delivery.com',  # Геокапча
-                'ct.captcha-delivery.com',  # Капча скрипты
-                'static.captcha-delivery.com'  # Статические ресурсы капчи
-            ]
-            
-            # Проверяем фразы блокировки
-            for phrase in blocking_phrases:
-                if phrase in page_source:
-                    logging.info(f"🚫 БЛОКИРОВКА ОБНАРУЖЕНА! Найдена фраза: '{phrase}'")
-                    return True
-            
-            # Проверяем URL на наличие капчи
-            current_url = self.browser_service.driver.current_url.lower()
-            if 'captcha-delivery.com' in current_url:
-                logging.info(f"🚫 КАПЧА ОБНАРУЖЕНА! URL содержит капчу: {current_url}")
-                return True
-            
-            # Дополнительная проверка на отсутствие основного контента
-            if 'shop_home_listing_grid' not in page_source and len(page_source) < 10000:
-                logging.info("🚫 Подозрение на блокировку: слишком мало контента и нет основных элементов")
-                return True
-            
-            logging.info("✅ Признаков блокировки не обнаружено")
-            return False
-            
-        except Exception as e:
-            logging.error(f"⚠️ Ошибка при проверке блокировки: {e}")
-            return False
-    
     def _get_next_page_url_from_browser(self) -> Optional[str]:
         """Получает URL следующей страницы из пагинации через браузер"""
         if not self.browser_service or not self.browser_service.driver:
             return None
         
         html_content = self.browser_service.get_page_source()
-        soup = BeautifulSoup(html_content, 'html.parser')
+        soup = BeautifulSoup(html_content, 'lxml')
         
         # Ищем навигацию пагинации
         pagination_nav = soup.find('nav', {'data-clg-id': 'WtPagination'})
@@ -434,44 +531,3 @@ class EtsyParser(BaseParser):
             
         except Exception as e:
             logging.error(f"⚠️ Ошибка при скролле к пагинации: {e}")
-    
-    def _parse_product_element(self, link_element, shop_name: str) -> Product:
-        """Парсит элемент товара"""
-        listing_id = link_element.get('data-listing-id')
-        product_url = link_element.get('href')
-        
-        # Получаем название товара из title или из h3
-        title = link_element.get('title')
-        if not title:
-            title_element = link_element.find('h3')
-            title = title_element.get_text(strip=True) if title_element else "Без названия"
-        
-        # Формируем полную ссылку если нужно
-        if product_url and not product_url.startswith('http'):
-            product_url = 'https://www.etsy.com' + product_url
-        
-        # Пытаемся найти цену
-        price = None
-        currency = None
-        price_element = link_element.find('span', class_='currency-value')
-        if price_element:
-            price = price_element.get_text(strip=True)
-            currency_element = link_element.find('span', class_='currency-symbol')
-            if currency_element:
-                currency = currency_element.get_text(strip=True)
-        
-        # Пытаемся найти изображение
-        image_url = None
-        img_element = link_element.find('img')
-        if img_element:
-            image_url = img_element.get('src')
-        
-        return Product(
-            listing_id=listing_id,
-            title=title,
-            url=product_url,
-            shop_name=shop_name,
-            price=price,
-            currency=currency,
-            image_url=image_url
-        )
\ No newline at end of file
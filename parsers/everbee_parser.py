@@ -2,7 +2,7 @@
 Парсер для магазинов Etsy через EverBee API
 """
 import logging
-from typing import List, Optional
+from typing import Container, List, Optional
 from parsers.base_parser import BaseParser
 from models.product import Product
 from utils.everbee_client import EverBeeClient
@@ -11,9 +11,10 @@ from utils.everbee_client import EverBeeClient
 class EverBeeParser(BaseParser):
     """Парсер для магазинов Etsy через EverBee API"""
     
-    def __init__(self, config):
+    def __init__(self, config, everbee_client: Optional[EverBeeClient] = None):
         super().__init__(config)
-        self.everbee_client = EverBeeClient()
+        self.everbee_client = everbee_client or EverBeeClient()
+        self.known_listings: Container[str] = frozenset()
     
     def get_shop_name_from_url(self, url: str) -> str:
         """Извлекает название магазина из URL"""
@@ -26,9 +27,19 @@ class EverBeeParser(BaseParser):
         except:
             return "unknown_shop"
     
+    def set_known_listings(self, known_listings: Optional[Container[str]]):
+        """Задаёт уже виденные ID листингов (любой контейнер с проверкой `in`) для ранней остановки пагинации"""
+        self.known_listings = known_listings if known_listings is not None else frozenset()
+    
     def parse_shop_page(self, shop_url: str) -> List[Product]:
-        """Парсит магазин через EverBee API с сортировкой по новизне"""
+        """Парсит магазин через EverBee API с сортировкой по новизне.
+        
+        Страницы запрашиваются по очереди, пока не встретится листинг, известный
+        в прошлых циклах, листинг старше max_listing_age_months или неполная страница.
+        """
         shop_name = self.get_shop_name_from_url(shop_url)
+        everbee_config = self.config.everbee
+        known_ids = self.known_listings
         
         logging.info(f"📄 Парсим магазин через EverBee API: {shop_name}")
         
@@ -37,41 +48,66 @@ class EverBeeParser(BaseParser):
             logging.error(f"❌ Не удалось получить валидный токен для магазина {shop_name}")
             return []
         
-        # Получаем листинги отсортированные по возрасту (новые сначала)
-        response = self.everbee_client.get_shop_listings(
-            shop_name=shop_name,
-            order_by="listing_age_in_months",
-            time_range="last_1_month", 
-            order_direction="asc",
-            page=1,
-            per_page=50
-        )
-        
-        if not response:
-            logging.error(f"❌ Не удалось получить данные для магазина {shop_name}")
-            return []
-        
-        # Извлекаем листинги из ответа
-        listings = response.get('results', [])
-        
-        if not listings:
-            logging.info(f"⚠️ Нет листингов в магазине {shop_name}")
-            return []
-        
         products = []
-        for listing in listings:
-            try:
-                # Фильтруем по возрасту листинга (максимум 2 месяца)
-                listing_age = listing.get('listing_age_in_months', 0)
-                if listing_age >= 2:
-                    continue
+        seen_ids = set()
+        
+        for page in range(1, everbee_config.shop_max_pages + 1):
+            # Получаем листинги отсортированные по возрасту (новые сначала)
+            response = self.everbee_client.get_shop_listings(
+                shop_name=shop_name,
+                order_by="listing_age_in_months",
+                time_range="last_1_month", 
+                order_direction="asc",
+                page=page,
+                per_page=everbee_config.shop_page_size
+            )
+            
+            if not response:
+                if page == 1:
+                    logging.error(f"❌ Не удалось получить данные для магазина {shop_name}")
+                    return []
+                logging.warning(f"⚠️ {shop_name}: не удалось получить страницу {page}, используем уже загруженные")
+                break
+            
+            # Извлекаем листинги из ответа
+            listings = response.get('results', [])
+            
+            if not listings:
+                if page == 1:
+                    logging.info(f"⚠️ Нет листингов в магазине {shop_name}")
+                    return []
+                break
+            
+            reached_known = False
+            reached_old = False
+            
+            for listing in listings:
+                try:
+                    listing_id = str(listing.get('listing_id', ''))
+                    if listing_id in seen_ids:
+                        continue
+                    
+                    # Фильтруем по возрасту листинга
+                    listing_age = listing.get('listing_age_in_months', 0) or 0
+                    if listing_age >= everbee_config.max_listing_age_months:
+                        reached_old = True
+                        continue
                     
-                product = self._parse_listing_data(listing, shop_name)
-                if product:
-                    products.append(product)
-            except Exception as e:
-                logging.error(f"❌ Ошибка при парсинге листинга {listing.get('listing_id', 'unknown')}: {e}")
-                continue
+                    if listing_id in known_ids:
+                        reached_known = True
+                        
+                    product = self._parse_listing_data(listing, shop_name)
+                    if product:
+                        products.append(product)
+                        seen_ids.add(listing_id)
+                except Exception as e:
+                    logging.error(f"❌ Ошибка при парсинге листинга {listing.get('listing_id', 'unknown')}: {e}")
+                    continue
+            
+            if reached_known or reached_old or len(listings) < everbee_config.shop_page_size:
+                break
+            
+            logging.info(f"📄 {shop_name}: на странице {page} нет известных листингов, загружаем следующую")
         
         logging.info(f"✅ Найдено товаров: {len(products)}")
         return products
@@ -1,16 +1,16 @@
 """
-Скрипт для миграции и экспорта top-listings.json в Google Sheets
+Скрипт для миграции и экспорта топ-листингов в Google Sheets
 Добавляет расчет дневного прироста лайков/просмотров
 """
 import sys
 import os
-import json
 import logging
 
 # Add project root to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from services.google_sheets_service import GoogleSheetsService
+from services.listing_store import get_listing_store
 from config.settings import config
 
 # Setup logging
@@ -19,18 +19,11 @@ logging.basicConfig(level=logging.INFO)
 def migrate_and_export():
     print("🚀 Миграция и экспорт top-listings...")
     
-    tops_file = os.path.join(config.output_dir, "tops", "top-listings.json")
-    if not os.path.exists(tops_file):
-        print(f"❌ Файл не найден: {tops_file}")
-        return
-    
-    # Загружаем данные
-    with open(tops_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    listings = data.get("listings", {})
+    # Загружаем данные (top-listings.json импортируется в хранилище автоматически)
+    store = get_listing_store(os.path.join(config.output_dir, "tops"))
+    listings = store.load_tops().get("listings", {})
     if not listings:
-        print("❌ Нет данных в top-listings.json")
+        print(f"❌ Нет топ-листингов в {store.db_path}")
         return
     
     print(f"📋 Найдено {len(listings)} топ-листингов")
@@ -58,9 +51,8 @@ def migrate_and_export():
             print(f"✨ {listing_id}: Views/день={views_daily}, Likes/день={likes_daily}")
     
     if updated_count > 0:
-        # Сохраняем обновленный файл
-        with open(tops_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        # Сохраняем обновленные данные
+        store.save_tops(listings)
         print(f"✅ Обновлено {updated_count} листингов с расчетом дневного прироста")
     else:
         print("✅ Все листинги уже содержат данные о дневном приросте")
@@ -2,179 +2,114 @@
 Сервис для аналитики изменений листингов
 """
 import os
-import json
 import logging
 from datetime import datetime
-from typing import Dict, List, Tuple
+from typing import Dict, List, Tuple, Optional
 from utils.everbee_client import EverBeeClient
+from services.listing_store import get_listing_store, get_snapshot_index, SNAPSHOT_KEY_FORMAT
+from services.snapshot_delta import diff_snapshots
 
 
 class AnalyticsService:
     """Сервис для отслеживания изменений в статистике листингов"""
     
-    def __init__(self, tops_dir: str = "output/tops"):
+    def __init__(self, tops_dir: str = "output/tops", everbee_client: Optional[EverBeeClient] = None):
         self.tops_dir = tops_dir
-        self.everbee_client = EverBeeClient()
-        self.listings_file = os.path.join(self.tops_dir, "new_perspective_listings.json")
+        self.everbee_client = everbee_client or EverBeeClient()
         os.makedirs(self.tops_dir, exist_ok=True)
+        self.store = get_listing_store(self.tops_dir)
     
     def _load_listings_data(self) -> Dict:
         """Загружает данные листингов"""
-        if os.path.exists(self.listings_file):
-            try:
-                with open(self.listings_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                logging.error(f"Ошибка загрузки данных листингов: {e}")
-        
-        return {"listings": {}}
-    
-    def _save_listings_data(self, data: Dict):
-        """Сохраняет данные листингов"""
-        try:
-            with open(self.listings_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            logging.info(f"Данные аналитики сохранены: {self.listings_file}")
-        except Exception as e:
-            logging.error(f"Ошибка сохранения данных аналитики: {e}")
+        return self.store.load_listings()
     
     def get_all_listing_ids(self) -> List[str]:
         """Получает все ID листингов из базы"""
-        data = self._load_listings_data()
-        listing_ids = list(data.get("listings", {}).keys())
+        listing_ids = self.store.get_listing_ids()
         logging.info(f"Найдено {len(listing_ids)} листингов для аналитики")
         return listing_ids
     
     def fetch_current_stats(self, listing_ids: List[str]) -> Dict[str, Dict]:
-        """Получает текущую статистику листингов через EverBee API пакетами по 64"""
+        """Получает текущую статистику листингов через EverBee API пакетами"""
         if not listing_ids:
             logging.warning("Нет листингов для получения статистики")
             return {}
         
         logging.info(f"Запрос статистики для {len(listing_ids)} листингов...")
         
-        results = {}
-        batch_size = 64
-        
-        # Разбиваем на пакеты по 64 листинга
-        for i in range(0, len(listing_ids), batch_size):
-            batch = listing_ids[i:i + batch_size]
-            logging.info(f"Обработка пакета {i//batch_size + 1}: {len(batch)} листингов")
-            
-            response = self.everbee_client.get_listings_batch(batch)
-            
-            if response and "results" in response:
-                for listing in response.get("results", []):
-                    listing_id = str(listing.get("listing_id"))
-                    if listing_id:
-                        extracted_data = self.everbee_client.extract_listing_data(listing)
-                        results[listing_id] = extracted_data
-            else:
-                logging.error(f"Не удалось получить данные для пакета {i//batch_size + 1}")
+        raw_listings = self.everbee_client.get_listings_stats(listing_ids)
+        results = {
+            listing_id: self.everbee_client.extract_listing_data(listing)
+            for listing_id, listing in raw_listings.items()
+        }
         
         logging.info(f"Получена статистика для {len(results)} листингов")
         return results
     
     def save_analytics_snapshot(self, stats: Dict[str, Dict], timestamp: str):
         """Сохраняет снимок статистики и удаляет предыдущий снимок (кроме первого)"""
-        data = self._load_listings_data()
-        removed_count = 0
+        index = get_snapshot_index(self._load_listings_data())
+        to_delete = []
         
-        for listing_id, listing_stats in stats.items():
-            if listing_id not in data["listings"]:
-                data["listings"][listing_id] = {}
-            
-            timestamps = sorted(data["listings"][listing_id].keys(), key=lambda x: datetime.strptime(x, "%d.%m.%Y_%H.%M"))
+        for listing_id in stats:
+            timeline = index.get(listing_id, [])
             
-            # Если есть более 2 снимков, удаляем предпоследний
-            if len(timestamps) >= 2:
-                first_timestamp = timestamps[0]
-                previous_timestamp = timestamps[-1]  # Предыдущий (текущий последний)
-                
-                # Удаляем предыдущий снимок, если он не первый
-                if previous_timestamp != first_timestamp:
-                    del data["listings"][listing_id][previous_timestamp]
-                    removed_count += 1
-            
-            # Добавляем новый снимок
-            data["listings"][listing_id][timestamp] = listing_stats
-        
-        self._save_listings_data(data)
+            # Если есть 2+ снимков, удаляем предыдущий (текущий последний), если он не первый
+            if len(timeline) >= 2:
+                previous_timestamp = timeline[-1][1]
+                if previous_timestamp != timeline[0][1] and previous_timestamp != timestamp:
+                    to_delete.append((listing_id, previous_timestamp))
+        
+        # Удаление и добавление снимков - одной транзакцией
+        self.store.add_snapshots(timestamp, stats, delete=to_delete)
+        removed_count = len(to_delete)
         logging.info(f"Сохранен снимок аналитики для {len(stats)} листингов с меткой {timestamp} (удалено {removed_count} предыдущих снимков)")
         
-        # Проверяем возраст листингов
+        # Проверяем возраст листингов по актуальным данным хранилища
+        data = self._load_listings_data()
         self._check_listings_age(data, timestamp)
     
     def calculate_changes(self, listing_id: str, old_timestamp: str, new_timestamp: str) -> Dict:
         """Вычисляет изменения между двумя снимками статистики"""
-        data = self._load_listings_data()
+        listing_data = self.store.get_listing_snapshots(listing_id)
         
-        if listing_id not in data["listings"]:
+        if not listing_data:
             return {}
         
-        listing_data = data["listings"][listing_id]
-        
         if old_timestamp not in listing_data or new_timestamp not in listing_data:
             return {}
         
-        old_stats = listing_data[old_timestamp]
-        new_stats = listing_data[new_timestamp]
-        
-        changes = {}
-        
-        numeric_fields = [
-            "est_total_sales", "est_mo_sales", "listing_age_in_months",
-            "est_reviews", "est_reviews_in_months", "views", "num_favorers"
-        ]
-        
-        for field in numeric_fields:
-            old_val = old_stats.get(field, 0)
-            new_val = new_stats.get(field, 0)
-            
-            if isinstance(old_val, (int, float)) and isinstance(new_val, (int, float)):
-                diff = new_val - old_val
-                if diff != 0:
-                    changes[field] = {
-                        "old": old_val,
-                        "new": new_val,
-                        "diff": diff
-                    }
-        
-        if old_stats.get("conversion_rate") != new_stats.get("conversion_rate"):
-            changes["conversion_rate"] = {
-                "old": old_stats.get("conversion_rate", 0),
-                "new": new_stats.get("conversion_rate", 0),
-                "diff": round(new_stats.get("conversion_rate", 0) - old_stats.get("conversion_rate", 0), 2)
-            }
-        
-        return changes
+        return diff_snapshots([listing_data[old_timestamp]], [listing_data[new_timestamp]])[0]
     
     def get_all_timestamps_for_listing(self, listing_id: str) -> List[str]:
         """Получает все временные метки для листинга"""
-        data = self._load_listings_data()
+        listing_data = self.store.get_listing_snapshots(listing_id)
         
-        if listing_id not in data["listings"]:
+        if not listing_data:
             return []
         
-        timestamps = list(data["listings"][listing_id].keys())
-        timestamps.sort(key=lambda x: datetime.strptime(x, "%d.%m.%Y_%H.%M"))
-        return timestamps
+        # Хранилище отдаёт снимки уже упорядоченными по времени
+        return list(listing_data.keys())
     
     def _check_listings_age(self, data: Dict, current_date: str):
         """Проверяет возраст листингов и логирует те, что старше 1 дня"""
         try:
-            current_dt = datetime.strptime(current_date, "%d.%m.%Y_%H.%M")
+            current_dt = datetime.strptime(current_date, SNAPSHOT_KEY_FORMAT)
+            index = get_snapshot_index(data)
             
             for listing_id, snapshots in data.get("listings", {}).items():
                 if not snapshots:
                     continue
                 
-                timestamps = sorted(snapshots.keys(), key=lambda x: datetime.strptime(x, "%d.%m.%Y_%H.%M"))
-                first_ts = timestamps[0]
-                last_ts = timestamps[-1]
+                # Индекс уже отсортирован по времени: первый и последний снимки за O(1)
+                timeline = index.get(listing_id)
+                if not timeline:
+                    continue
+                first_epoch, first_ts = timeline[0]
+                last_ts = timeline[-1][1]
                 
                 try:
-                    first_dt = datetime.strptime(first_ts, "%d.%m.%Y_%H.%M")
+                    first_dt = datetime.fromtimestamp(first_epoch)
                     days_diff = (current_dt.date() - first_dt.date()).days
                     
                     if days_diff > 0:
@@ -205,6 +140,9 @@ class AnalyticsService:
         """Запускает процесс аналитики: получает текущую статистику и сохраняет"""
         timestamp = datetime.now().strftime("%d.%m.%Y_%H.%M")
         
+        # Каждый запуск аналитики получает свежую статистику
+        self.everbee_client.clear_stats_cache()
+        
         listing_ids = self.get_all_listing_ids()
         
         if not listing_ids:
@@ -221,15 +159,8 @@ class AnalyticsService:
     
     def _add_snapshot_without_cleanup(self, stats: Dict[str, Dict], timestamp: str):
         """Добавляет новый снимок БЕЗ удаления предыдущего"""
+        self.store.add_snapshots(timestamp, stats)
         data = self._load_listings_data()
-        
-        for listing_id, listing_stats in stats.items():
-            if listing_id not in data["listings"]:
-                data["listings"][listing_id] = {}
-            
-            data["listings"][listing_id][timestamp] = listing_stats
-        
-        self._save_listings_data(data)
         logging.info(f"Добавлен новый снимок для {len(stats)} листингов с меткой {timestamp}")
         
         # Проверяем возраст листингов
@@ -237,52 +168,37 @@ class AnalyticsService:
     
     def cleanup_old_snapshots(self):
         """Удаляет предыдущие снимки (кроме первого и последнего)"""
-        data = self._load_listings_data()
-        removed_count = 0
-        
-        for listing_id in data["listings"]:
-            timestamps = sorted(data["listings"][listing_id].keys(), key=lambda x: datetime.strptime(x, "%d.%m.%Y_%H.%M"))
-            
-            # Если есть более 2 снимков, удаляем все кроме первого и последнего
-            if len(timestamps) > 2:
-                first_timestamp = timestamps[0]
-                last_timestamp = timestamps[-1]
-                
-                # Удаляем все промежуточные снимки
-                for ts in timestamps[1:-1]:
-                    del data["listings"][listing_id][ts]
-                    removed_count += 1
-        
+        # Промежуточные снимки определяются и удаляются одним запросом по индексу времени
+        removed_count = self.store.delete_intermediate_snapshots()
         if removed_count > 0:
-            self._save_listings_data(data)
             logging.info(f"Удалено {removed_count} промежуточных снимков")
         
         return removed_count
     
     def generate_changes_report(self) -> List[Dict]:
-        """Генерирует отчет об изменениях для всех листингов (сравнение с предыдущим снимком)"""
-        data = self._load_listings_data()
-        report = []
+        """Генерирует отчет об изменениях для всех листингов (сравнение с предыдущим снимком).
         
-        for listing_id, timestamps_data in data["listings"].items():
-            timestamps = sorted(timestamps_data.keys(), key=lambda x: datetime.strptime(x, "%d.%m.%Y_%H.%M"))
-            
-            if len(timestamps) < 2:
-                continue
-            
-            # Сравниваем предпоследний и последний снимки
-            previous_timestamp = timestamps[-2]
-            latest_timestamp = timestamps[-1]
-            
-            changes = self.calculate_changes(listing_id, previous_timestamp, latest_timestamp)
-            
+        Пары последних снимков загружаются из хранилища одним запросом,
+        изменения по всем полям считаются одним проходом по парам.
+        """
+        pairs = self.store.load_latest_snapshot_pairs()
+        if not pairs:
+            return []
+        
+        all_changes = diff_snapshots(
+            [previous_stats for _, _, previous_stats, _, _ in pairs],
+            [latest_stats for _, _, _, _, latest_stats in pairs]
+        )
+        
+        report = []
+        for (listing_id, previous_timestamp, _, latest_timestamp, latest_stats), changes in zip(pairs, all_changes):
             if changes:
                 report.append({
                     "listing_id": listing_id,
                     "old_timestamp": previous_timestamp,
                     "new_timestamp": latest_timestamp,
                     "changes": changes,
-                    "url": timestamps_data[latest_timestamp].get("url", "")
+                    "url": latest_stats.get("url", "")
                 })
         
         return report
@@ -6,6 +6,9 @@ import json
 import os
 import tempfile
 import logging
+import threading
+import requests
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Dict, Optional, List
 try:
     from seleniumwire import webdriver as seleniumwire_webdriver
@@ -24,25 +27,93 @@ from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium_stealth import stealth
 from selenium.webdriver.chrome.service import Service
 from utils.driver_path import get_chromedriver_path
-from utils.proxy_manager import ProxyManager
+from utils.proxy_manager import ProxyManager, get_shared_proxy_manager
+from utils.http_session import create_pooled_session
+from services.cdp_network import ResponseWatcher
+
+# Шаблоны URL, которые Chrome блокирует сам (CDP Network.setBlockedURLs, * - любая подстрока)
+BLOCKED_DOMAINS = [
+    'google-analytics.com',
+    'googletagmanager.com',
+    'facebook.com',
+    'facebook.net',
+    'doubleclick.net',
+    'googlesyndication.com',
+    'adsystem.com',
+    'amazon-adsystem.com',
+    'bat.bing.com',
+    'podscribe.com',
+    'googleapis.com',
+    'pinterest.com',
+    'adsrvr.org',
+    'imrworldwide.com',
+    'tapad.com',
+    'qualtrics.com',
+    'adnxs.com',
+    'gcp.gvt2.com',
+    'clients.google.com'
+]
+# Шрифты, изображения и медиа (JS не блокируем - сайт требует)
+BLOCKED_EXTENSIONS = [
+    '.woff', '.woff2', '.ttf', '.eot', '.svg', '.png', '.jpg', '.jpeg',
+    '.gif', '.webp', '.ico', '.mp4', '.webm', '.mp3'
+]
+BLOCKED_URL_PATTERNS = (
+    [f"*{domain}*" for domain in BLOCKED_DOMAINS] +
+    [f"*{extension}" for extension in BLOCKED_EXTENSIONS]
+)
+
+# Заголовки запроса браузера, которые не переносятся в HTTP-сессию (их выставляет requests)
+HTTP_SKIP_REQUEST_HEADERS = {'cookie', 'host', 'content-length', 'connection', 'accept-encoding'}
+
+# Результат проверки установки Chrome (успешная проверка не повторяется в рамках процесса)
+_chrome_installed = False
+
+# Потоки для фонового запуска резервных браузеров
+_standby_executor: Optional[ThreadPoolExecutor] = None
+_standby_executor_lock = threading.Lock()
+
+
+def _get_standby_executor() -> ThreadPoolExecutor:
+    """Общий пул потоков для запуска резервных браузеров"""
+    global _standby_executor
+    with _standby_executor_lock:
+        if _standby_executor is None:
+            _standby_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="browser-standby")
+        return _standby_executor
+
 
 class BrowserService:
     """Сервис для работы с браузером"""
     
-    def __init__(self, config):
+    def __init__(self, config, proxy_manager: Optional[ProxyManager] = None):
         self.config = config
         self.driver = None
         self.captured_headers = {}
+        self.captured_request_headers = {}
         self.max_retries = 3
         self.wait_timeout = 90  # 1.5 минуты
-        self.proxy_manager = ProxyManager()
+        # Несколько браузеров должны делить один ProxyManager: при создании он удаляет чужие расширения прокси
+        self.proxy_manager = proxy_manager or get_shared_proxy_manager()
         self.current_proxy = None
         self.proxy_extension_path = None
+        self.use_proxy = False
+        # Резервный браузер, запускаемый в фоне с другим прокси, пока работает текущий
+        self.is_standby = False
+        self._standby_future: Optional[Future] = None
+        self._standby_lock = threading.Lock()
+        # Подписка на сетевые события текущего драйвера (None - не создана, False - недоступна)
+        self._response_watcher = None
+        self._response_watcher_driver = None
     
     def _check_chrome_installation(self) -> bool:
         """Проверяет наличие установленного Chrome"""
         import os
         import subprocess
+        global _chrome_installed
+        
+        if _chrome_installed:
+            return True
         
         logging.info("🔍 Проверяем установку Google Chrome...")
         
@@ -57,6 +128,7 @@ class BrowserService:
         for path in chrome_paths:
             if os.path.exists(path):
                 logging.info(f"✅ Chrome найден: {path}")
+                _chrome_installed = True
                 return True
         
         # Пытаемся запустить chrome через командную строку
@@ -65,6 +137,7 @@ class BrowserService:
                                   capture_output=True, text=True, timeout=5)
             if result.returncode == 0:
                 logging.info(f"✅ Chrome найден в PATH: {result.stdout.strip()}")
+                _chrome_installed = True
                 return True
         except:
             pass
@@ -74,19 +147,24 @@ class BrowserService:
         logging.error("💡 Или убедитесь, что Chrome установлен в стандартной папке")
         return False
         
-    def setup_driver(self, use_proxy: bool = False):
-        """Настройка Chrome драйвера с stealth режимом, имитацией человека и прокси"""
+    def setup_driver(self, use_proxy: bool = False, proxy: Optional[Dict[str, str]] = None):
+        """Настройка Chrome драйвера с stealth режимом, имитацией человека и прокси.
+        
+        proxy - конкретный прокси (например, закреплённый за воркером пула), иначе берётся случайный
+        """
         # Проверяем наличие Chrome
         if not self._check_chrome_installation():
             return False
         
-        # Получаем случайный рабочий прокси если нужно
+        self.use_proxy = use_proxy
+        
+        # Получаем прокси если нужно
         if use_proxy:
-            self.current_proxy = self.proxy_manager.get_random_proxy()
+            self.current_proxy = proxy or self.proxy_manager.get_random_proxy()
             if not self.current_proxy:
                 logging.error("❌ Не удалось получить прокси!")
                 return False
-            logging.info(f"🌐 Используем случайный прокси: {self.current_proxy['host']}:{self.current_proxy['port']}")
+            logging.info(f"🌐 Используем прокси: {self.current_proxy['host']}:{self.current_proxy['port']}")
         else:
             logging.info("🌐 Запуск без прокси (прокси временно отключены для тестирования на VDS)")
             self.current_proxy = None
@@ -185,7 +263,11 @@ class BrowserService:
         chrome_options.add_argument("--no-first-run")
         chrome_options.add_argument("--disable-default-apps")
         
-        # Настройка прокси
+        # Настройка прокси.
+        # selenium-wire (если установлен) остаётся только для авторизации на прокси: расширение
+        # из get_proxy_auth_extension - Manifest V2, а свежие сборки Chrome не загружают MV2 и
+        # распакованные расширения. Перехватчика запросов нет, лишние ресурсы блокирует сам Chrome
+        # через Network.setBlockedURLs (_setup_request_blocking), и они не доходят до MITM-прокси.
         seleniumwire_options = None
         use_seleniumwire = False
         
@@ -232,8 +314,6 @@ class BrowserService:
                             options=chrome_options,
                             seleniumwire_options=seleniumwire_options
                         )
-                        # Настраиваем блокировку ненужных ресурсов
-                        self._setup_request_blocking()
                     else:
                         # Используем обычный selenium без wire
                         from selenium import webdriver as s_webdriver
@@ -277,11 +357,21 @@ class BrowserService:
             # Добавляем имитацию человеческого поведения
             self._setup_human_behavior()
             
+            # Блокируем рекламу, трекеры, шрифты и медиа внутри браузера
+            self._setup_request_blocking()
+            
+            # Подписываемся на сетевые события до первой навигации
+            self._get_response_watcher()
+            
             # Проверяем IP если используем прокси
             if use_proxy and self.current_proxy:
                 self._verify_proxy_ip()
             
             logging.info("✅ Браузер успешно запущен в stealth режиме с имитацией человека")
+            
+            # Пока этот браузер работает, в фоне готовим резервный
+            if not self.is_standby:
+                self._start_standby()
             return True
             
         except Exception as e:
@@ -341,14 +431,16 @@ class BrowserService:
             logging.error(f"⚠️ Ошибка при настройке имитации человека: {e}")
     
     def _get_seleniumwire_proxy_options(self):
-        """Возвращает настройки прокси для selenium-wire"""
+        """Возвращает настройки прокси для selenium-wire (только проксирование, без записи запросов)"""
         proxy_url = self.proxy_manager.format_proxy_for_chrome(self.current_proxy)
         
         return {
             'proxy': {
                 'http': proxy_url,
                 'https': proxy_url,
-            }
+            },
+            # driver.requests нигде не читается - не храним каждый запрос в памяти
+            'disable_capture': True,
         }
     
     def _setup_proxy_options(self, chrome_options: Options):
@@ -475,8 +567,8 @@ class BrowserService:
     def _cleanup_proxy_extension(self):
         """Очищает временные файлы расширения прокси"""
         try:
-            if self.proxy_extension_path and os.path.exists(self.proxy_extension_path):
-                # Используем метод из ProxyManager для правильной очистки
+            if self.proxy_extension_path:
+                # Используем метод из ProxyManager для правильной очистки (и освобождения папки в кэше)
                 self.proxy_manager.cleanup_proxy_extension(self.proxy_extension_path)
                 self.proxy_extension_path = None
         except Exception as e:
@@ -589,16 +681,122 @@ class BrowserService:
         except Exception as e:
             print(f"⚠️ Ошибка при имитации движения мыши: {e}")
     
+    def _get_response_watcher(self) -> Optional[ResponseWatcher]:
+        """CDP-слушатель ответов для текущего драйвера (None, если подписка недоступна)"""
+        if not getattr(self.config.etsy, 'cdp_network_events', False) or not self.driver:
+            return None
+        
+        if self._response_watcher_driver is not self.driver:
+            self._stop_response_watcher()
+            self._response_watcher_driver = self.driver
+            watcher = ResponseWatcher(self.driver)
+            if watcher.start():
+                logging.info("📡 Подписка CDP на Network.responseReceived активна")
+                self._response_watcher = watcher
+            else:
+                logging.info("⚠️ CDP-подписка недоступна, используем опрос performance-логов")
+                watcher.stop()
+                self._response_watcher = False
+        
+        watcher = self._response_watcher
+        return watcher if watcher and watcher.active else None
+    
+    def _stop_response_watcher(self):
+        """Останавливает CDP-слушатель ответов"""
+        if self._response_watcher:
+            self._response_watcher.stop()
+        self._response_watcher = None
+        self._response_watcher_driver = None
+    
+    def _clear_pending_responses(self):
+        """Сбрасывает накопленные CDP-ответы перед driver.get/refresh, за которыми следует ожидание ответа"""
+        if self._response_watcher:
+            self._response_watcher.clear()
+    
+    def _handle_target_response(self, url: str, status, headers: Dict[str, str],
+                                request_headers: Optional[Dict[str, str]] = None):
+        """Обрабатывает ответ на целевой URL. Возвращает (success, status) или None, если ждём дальше"""
+        if status == 200:
+            print(f"✅ Получен успешный ответ (200) для {url}")
+            
+            # Захватываем headers ответа и запроса (последние нужны для HTTP-режима без браузера)
+            self.captured_headers = headers or {}
+            if request_headers:
+                self.captured_request_headers = request_headers
+            print(f"📋 Захвачено {len(self.captured_headers)} headers")
+            
+            return True, 200
+        elif status == 403:
+            print(f"🚫 Получен 403 ответ для {url}")
+            return False, 403
+        elif status == 429:
+            print(f"⚠️ Получен 429 (Too Many Requests) для {url}")
+            return False, 429
+        
+        print(f"⚠️ Получен {status} ответ для {url}")
+        return None
+    
+    def _refresh_inactive_page(self, inactivity_timeout: int):
+        """Перезагружает страницу, на которой нет сетевой активности"""
+        print(f"⏰ Страница бездействует {inactivity_timeout}s - принудительная перезагрузка")
+        self._clear_pending_responses()
+        self.driver.refresh()
+        self._wait_for_page_load()
+        print("🔄 Страница перезагружена, продолжаем ожидание...")
+    
     def wait_for_successful_request(self, target_url: str):
-        """Ждет успешного запроса (200) к целевому URL. Возвращает (success, status_code)"""
+        """Ждет успешного запроса (200) к целевому URL. Возвращает (success, status_code).
+        
+        Статус берётся из CDP-подписки на Network.responseReceived сразу по приходу события;
+        если подписка недоступна - опросом performance-логов.
+        """
         print(f"🔍 Ожидание успешного запроса к: {target_url}")
         
+        watcher = self._get_response_watcher()
+        if watcher is None:
+            return self._poll_for_successful_request(target_url, self.wait_timeout)
+        
+        start_time = time.time()
+        last_status = None
+        inactivity_timeout = 60  # 1 минута бездействия
+        
+        while True:
+            remaining = self.wait_timeout - (time.time() - start_time)
+            if remaining <= 0:
+                break
+            
+            try:
+                response = watcher.next_response(target_url, timeout=min(remaining, inactivity_timeout))
+                
+                if response is None:
+                    if not watcher.active:
+                        # Подписка оборвалась - досматриваем оставшееся время опросом логов
+                        return self._poll_for_successful_request(target_url, remaining)
+                    if time.time() - watcher.last_event_time > inactivity_timeout:
+                        self._refresh_inactive_page(inactivity_timeout)
+                    continue
+                
+                url, status, headers, request_headers = response
+                last_status = status
+                result = self._handle_target_response(url, status, headers, request_headers)
+                if result is not None:
+                    return result
+                
+            except Exception as e:
+                print(f"Ошибка при ожидании сетевого события: {e}")
+                time.sleep(1)
+        
+        print(f"⏰ Таймаут ожидания ({self.wait_timeout}s) для {target_url}")
+        return False, last_status or 'timeout'
+    
+    def _poll_for_successful_request(self, target_url: str, wait_timeout: float):
+        """Ожидание ответа опросом performance-логов (запасной режим без CDP-подписки)"""
         start_time = time.time()
         last_status = None
         last_activity_time = start_time
         inactivity_timeout = 60  # 1 минута бездействия
         
-        while time.time() - start_time < self.wait_timeout:
+        while time.time() - start_time < wait_timeout:
             try:
                 # Получаем логи производительности
                 logs = self.driver.get_log('performance')
@@ -608,7 +806,12 @@ class BrowserService:
                     last_activity_time = time.time()
                 
                 for log in logs:
-                    message = json.loads(log['message'])
+                    # JSON разбираем только для ответов, где может быть целевой URL
+                    raw_message = log['message']
+                    if 'Network.responseReceived' not in raw_message:
+                        continue
+                    
+                    message = json.loads(raw_message)
                     
                     # Ищем сетевые запросы
                     if message['message']['method'] == 'Network.responseReceived':
@@ -619,32 +822,17 @@ class BrowserService:
                         # Проверяем, это ли наш целевой URL
                         if target_url in url:
                             last_status = status
-                            
-                            if status == 200:
-                                print(f"✅ Получен успешный ответ (200) для {url}")
-                                
-                                # Захватываем headers
-                                self.captured_headers = response.get('headers', {})
-                                print(f"📋 Захвачено {len(self.captured_headers)} headers")
-                                
-                                return True, 200
-                            elif status == 403:
-                                print(f"🚫 Получен 403 ответ для {url}")
-                                return False, 403
-                            elif status == 429:
-                                print(f"⚠️ Получен 429 (Too Many Requests) для {url}")
-                                return False, 429
-                            else:
-                                print(f"⚠️ Получен {status} ответ для {url}")
+                            result = self._handle_target_response(
+                                url, status, response.get('headers', {}), response.get('requestHeaders')
+                            )
+                            if result is not None:
+                                return result
                 
                 # Проверяем бездействие страницы
                 current_time = time.time()
                 if current_time - last_activity_time > inactivity_timeout:
-                    print(f"⏰ Страница бездействует {inactivity_timeout}s - принудительная перезагрузка")
-                    self.driver.refresh()
-                    self._wait_for_page_load()
+                    self._refresh_inactive_page(inactivity_timeout)
                     last_activity_time = current_time
-                    print("🔄 Страница перезагружена, продолжаем ожидание...")
                 
                 time.sleep(1)  # Небольшая пауза между проверками
                 
@@ -652,11 +840,16 @@ class BrowserService:
                 print(f"Ошибка при проверке логов: {e}")
                 time.sleep(1)
         
-        print(f"⏰ Таймаут ожидания ({self.wait_timeout}s) для {target_url}")
+        print(f"⏰ Таймаут ожидания ({wait_timeout}s) для {target_url}")
         return False, last_status or 'timeout'
     
 
     
+    def report_proxy_blocked(self):
+        """Сообщает ProxyManager о блокировке текущего прокси (он уйдёт на паузу)"""
+        if self.use_proxy:
+            self.proxy_manager.report_blocked(self.current_proxy)
+    
     def load_page_with_403_handling(self, url: str) -> tuple[bool, bool]:
         """
         Загружает страницу с обработкой 403 ошибок.
@@ -672,7 +865,10 @@ class BrowserService:
             
             try:
                 # Загружаем страницу
+                load_started = time.monotonic()
+                self._clear_pending_responses()
                 self.driver.get(url)
+                load_latency = time.monotonic() - load_started
                 
                 # Ждем появления основных элементов
                 try:
@@ -688,6 +884,7 @@ class BrowserService:
                     logging.info("🤖 Обнаружена капча, пытаемся обработать...")
                     if not self._handle_captcha(max_wait_time=30):
                         logging.info("❌ Не удалось обработать капчу, требуется смена прокси")
+                        self.report_proxy_blocked()
                         return False, True
                 
                 # Имитируем человеческие действия после загрузки
@@ -698,6 +895,8 @@ class BrowserService:
                 
                 if success:
                     logging.info(f"✅ Страница {shop_name} успешно загружена!")
+                    if self.use_proxy:
+                        self.proxy_manager.report_success(self.current_proxy, load_latency)
                     return True, False
                 elif status == 403:
                     logging.info(f"🚫 Получен 403 для {shop_name} (попытка {attempt + 1}/{max_403_retries})")
@@ -705,11 +904,13 @@ class BrowserService:
                     if attempt < max_403_retries - 1:
                         logging.info("🔄 Перезагружаем страницу через 10 секунд (возможно капча)...")
                         time.sleep(10)
+                        self._clear_pending_responses()
                         self.driver.refresh()
                         self._wait_for_page_load()
                         continue
                     else:
                         logging.info("❌ Получен 403 после 3 попыток - требуется новый браузер")
+                        self.report_proxy_blocked()
                         return False, True
                 else:
                     # Другие ошибки
@@ -721,6 +922,8 @@ class BrowserService:
                 if attempt < max_403_retries - 1:
                     time.sleep(5)
                 else:
+                    if self.use_proxy:
+                        self.proxy_manager.report_failure(self.current_proxy)
                     return False, True
         
         return False, False
@@ -734,6 +937,7 @@ class BrowserService:
             
             try:
                 # Загружаем страницу
+                self._clear_pending_responses()
                 self.driver.get(url)
                 
                 # Ждем появления основных элементов
@@ -764,6 +968,7 @@ class BrowserService:
                             wait_time = 10 + (attempt * 5)  # Увеличиваем время ожидания
                             print(f"🔄 Перезагружаем страницу через {wait_time} секунд...")
                             time.sleep(wait_time)
+                            self._clear_pending_responses()
                             self.driver.refresh()
                             # Ждем полной загрузки после перезагрузки
                             self._wait_for_page_load()
@@ -774,6 +979,7 @@ class BrowserService:
                         if attempt < self.max_retries - 1:
                             print("🔄 Перезагружаем страницу через 5 секунд...")
                             time.sleep(5)
+                            self._clear_pending_responses()
                             self.driver.refresh()
                             self._wait_for_page_load()
                         continue
@@ -782,6 +988,7 @@ class BrowserService:
                         print(f"⚠️ Неизвестная ошибка: {status}")
                         if attempt < self.max_retries - 1:
                             time.sleep(5)
+                            self._clear_pending_responses()
                             self.driver.refresh()
                             self._wait_for_page_load()
                         continue
@@ -844,56 +1051,6 @@ class BrowserService:
         print(f"⏰ Таймаут ожидания товаров ({max_wait_time}s)")
         return False
     
-    def _setup_request_blocking(self):
-        """Настраивает блокировку ненужных запросов через selenium-wire"""
-        if not SELENIUM_WIRE_AVAILABLE:
-            return
-        
-        def request_interceptor(request):
-            # Список доменов и путей для блокировки
-            blocked_domains = [
-                'bat.bing.com',
-                'podscribe.com', 
-                'googleapis.com',
-                'google.com/c2dm',
-                'pinterest.com',
-                'qualtrics.com',
-                'adsrvr.org',
-                'imrworldwide.com',
-                'tapad.com',
-                'adnxs.com',
-                'gvt2.com',
-                'facebook.com',
-                'doubleclick.net',
-                'googlesyndication.com',
-                'googletagmanager.com',
-                'google-analytics.com',
-                'hotjar.com',
-                'mixpanel.com',
-                'segment.com',
-                'amplitude.com'
-            ]
-            
-            blocked_extensions = ['.js', '.woff', '.woff2', '.ttf', '.eot']
-            
-            # Проверяем домен
-            for domain in blocked_domains:
-                if domain in request.url:
-                    print(f"🚫 Блокируем запрос к {domain}")
-                    request.abort()
-                    return
-            
-            # Блокируем JS файлы (кроме основных Etsy)
-            if any(request.url.endswith(ext) for ext in blocked_extensions):
-                if 'etsy.com' not in request.url or '/include/tags.js' in request.url:
-                    print(f"🚫 Блокируем ресурс: {request.url}")
-                    request.abort()
-                    return
-        
-        # Устанавливаем перехватчик
-        self.driver.request_interceptor = request_interceptor
-        print("🛡️ Настроена блокировка ненужных запросов")
-    
     def get_page_source(self) -> str:
         """Возвращает HTML код страницы"""
         if not self.driver:
@@ -904,6 +1061,42 @@ class BrowserService:
         """Возвращает захваченные headers"""
         return self.captured_headers.copy()
     
+    def build_http_session(self) -> Optional[requests.Session]:
+        """Создаёт HTTP-сессию с cookies, заголовками запроса и прокси текущего браузера.
+        
+        Позволяет загружать следующие страницы без рендеринга в Chrome, пока сайт их отдаёт.
+        """
+        if not self.driver:
+            return None
+        
+        try:
+            session = create_pooled_session(pool_size=2)
+            
+            headers = {
+                name: value for name, value in self.captured_request_headers.items()
+                if not name.startswith(':') and name.lower() not in HTTP_SKIP_REQUEST_HEADERS
+            }
+            if not any(name.lower() == 'user-agent' for name in headers):
+                headers['User-Agent'] = self.driver.execute_script("return navigator.userAgent")
+            headers.setdefault('Accept', 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8')
+            headers.setdefault('Accept-Language', 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7')
+            session.headers.update(headers)
+            
+            for cookie in self.driver.get_cookies():
+                session.cookies.set(
+                    cookie['name'], cookie['value'],
+                    domain=cookie.get('domain'), path=cookie.get('path', '/')
+                )
+            
+            if self.use_proxy and self.current_proxy:
+                session.proxies.update(self.proxy_manager.format_proxy_for_requests(self.current_proxy))
+            
+            logging.info(f"🍪 HTTP-сессия из браузера: {len(session.cookies)} cookies, {len(headers)} заголовков")
+            return session
+        except Exception as e:
+            logging.warning(f"⚠️ Не удалось создать HTTP-сессию из браузера: {e}")
+            return None
+    
     def navigate_to_page(self, url: str) -> bool:
         """Переходит на указанную страницу"""
         try:
@@ -945,8 +1138,13 @@ class BrowserService:
         except Exception as e:
             print(f"⚠️ Не удалось открыть DevTools: {e}")
     
-    def close_browser(self):
-        """Закрывает браузер с отладочной информацией о пагинации"""
+    def close_browser(self, keep_standby: bool = False):
+        """Закрывает браузер с отладочной информацией о пагинации (и резервный, если keep_standby=False)"""
+        if not keep_standby:
+            self._discard_standby()
+        
+        self._stop_response_watcher()
+        
         if self.driver:
             try:
                 # Перед закрытием выводим отладочную информацию о пагинации
@@ -1009,85 +1207,102 @@ class BrowserService:
             print(f"⚠️ DEBUG: Ошибка при отладке пагинации: {e}")
     
     def _setup_request_blocking(self):
-        """Настраивает блокировку ненужных ресурсов через selenium-wire"""
-        if not SELENIUM_WIRE_AVAILABLE:
+        """Блокирует ненужные ресурсы средствами самого Chrome (CDP Network.setBlockedURLs)"""
+        try:
+            self.driver.execute_cdp_cmd('Network.enable', {})
+            self.driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+            logging.info(f"🛡️ Настроена блокировка ненужных ресурсов ({len(BLOCKED_URL_PATTERNS)} шаблонов)")
+        except Exception as e:
+            logging.warning(f"⚠️ Не удалось настроить блокировку ресурсов: {e}")
+    
+    def _start_standby(self):
+        """Запускает в фоне резервный браузер со следующим прокси"""
+        if not getattr(self.config.etsy, 'browser_warm_standby', False):
             return
-            
-        def request_interceptor(request):
-            # Блокируемые домены и паттерны
-            blocked_domains = [
-                'google-analytics.com',
-                'googletagmanager.com',
-                'facebook.com',
-                'facebook.net',
-                'doubleclick.net',
-                'googlesyndication.com',
-                'adsystem.com',
-                'amazon-adsystem.com',
-                'bat.bing.com',
-                'podscribe.com',
-                'googleapis.com',
-                'pinterest.com',
-                'adsrvr.org',
-                'imrworldwide.com',
-                'tapad.com',
-                'qualtrics.com',
-                'adnxs.com',
-                'gcp.gvt2.com',
-                'clients.google.com'
-            ]
-            
-            # Блокируемые типы файлов (НЕ блокируем JS - сайт требует)
-            blocked_extensions = [
-                '.woff',
-                '.woff2',
-                '.ttf',
-                '.eot',
-                '.svg',
-                '.png',
-                '.jpg',
-                '.jpeg',
-                '.gif',
-                '.webp',
-                '.ico',
-                '.mp4',
-                '.webm',
-                '.mp3'
-            ]
-            
-            # Проверяем домен
-            for domain in blocked_domains:
-                if domain in request.url:
-                    print(f"🚫 Блокируем запрос к {domain}")
-                    request.abort()
-                    return
-            
-            # Проверяем расширение файла
-            for ext in blocked_extensions:
-                if request.url.endswith(ext):
-                    print(f"🚫 Блокируем файл {ext}")
-                    request.abort()
-                    return
-            
-            # Блокируем только рекламные и трекинговые JS (разрешаем основные JS сайта)
-            if any(js_pattern in request.url.lower() for js_pattern in [
-                'analytics', 'tracking', 'gtag', 'fbevents', 'pixel',
-                'doubleclick', 'googlesyndication', 'amazon-adsystem'
-            ]) and 'etsy.com' not in request.url:
-                print(f"🚫 Блокируем рекламный JS: {request.url[:100]}...")
-                request.abort()
+        
+        with self._standby_lock:
+            if self._standby_future is not None:
                 return
-                
-            print(f"✅ Разрешаем: {request.url[:100]}...")
+            
+            standby = BrowserService(self.config, proxy_manager=self.proxy_manager)
+            standby.is_standby = True
+            proxy = self.proxy_manager.get_random_proxy() if self.use_proxy else None
+            use_proxy = self.use_proxy
+            
+            def launch():
+                return standby if standby.setup_driver(use_proxy=use_proxy, proxy=proxy) else None
+            
+            self._standby_future = _get_standby_executor().submit(launch)
+            logging.info("🧊 Запускаем резервный браузер в фоне")
+    
+    def _take_standby(self) -> bool:
+        """Переключается на резервный браузер. Возвращает False, если его нет или он не запустился"""
+        with self._standby_lock:
+            future = self._standby_future
+            self._standby_future = None
         
-        # Устанавливаем перехватчик запросов
-        self.driver.request_interceptor = request_interceptor
-        print("🛡️ Настроена блокировка ненужных ресурсов")
+        if future is None:
+            return False
+        
+        try:
+            # Если резервный браузер ещё запускается, дождаться его всё равно быстрее, чем начинать заново
+            standby = future.result(timeout=self.config.etsy.page_load_timeout)
+        except Exception as e:
+            logging.warning(f"⚠️ Резервный браузер недоступен: {e}")
+            future.add_done_callback(self._close_standby_result)
+            return False
+        
+        if standby is None or not standby.driver:
+            return False
+        
+        self.driver = standby.driver
+        self.current_proxy = standby.current_proxy
+        self.proxy_extension_path = standby.proxy_extension_path
+        self.use_proxy = standby.use_proxy
+        self.captured_headers = {}
+        self._response_watcher = standby._response_watcher
+        self._response_watcher_driver = standby._response_watcher_driver
+        standby.driver = None
+        standby.proxy_extension_path = None
+        standby._response_watcher = None
+        standby._response_watcher_driver = None
+        return True
+    
+    @staticmethod
+    def _close_standby_result(future: Future):
+        """Закрывает резервный браузер из завершённой задачи запуска"""
+        try:
+            standby = future.result()
+        except Exception:
+            return
+        if standby is not None:
+            standby.close_browser()
+    
+    def _discard_standby(self):
+        """Закрывает резервный браузер (не дожидаясь окончания его запуска)"""
+        with self._standby_lock:
+            future = self._standby_future
+            self._standby_future = None
+        if future is not None:
+            future.add_done_callback(self._close_standby_result)
     
     def restart_browser(self, change_proxy: bool = True) -> bool:
-        """Перезапускает браузер (новый воркер) с возможностью смены прокси"""
+        """Перезапускает браузер (новый воркер) с возможностью смены прокси.
+        
+        Если готов резервный браузер, переключение происходит сразу, а новый резервный запускается в фоне.
+        """
         print("🔄 Перезапуск браузера...")
-        self.close_browser()
+        self.close_browser(keep_standby=True)
+        
+        # Резервный браузер запущен с другим прокси, поэтому подходит, только если прокси можно менять
+        if change_proxy or not self.use_proxy:
+            if self._take_standby():
+                print("⚡ Переключились на резервный браузер")
+                self._start_standby()
+                return True
+        else:
+            self._discard_standby()
+        
         time.sleep(3)
         
         # Если нужно сменить прокси, получаем новый
@@ -1098,7 +1313,7 @@ class BrowserService:
                 return False
             print(f"🌐 Новый случайный прокси: {self.current_proxy['host']}:{self.current_proxy['port']}")
         
-        return self.setup_driver(use_proxy=False)
+        return self.setup_driver(use_proxy=self.use_proxy, proxy=self.current_proxy)
     
     def __enter__(self):
         """Контекстный менеджер - вход"""
@@ -0,0 +1,116 @@
+"""
+Событийный перехват сетевых ответов браузера через CDP (Network.responseReceived)
+Заменяет опрос driver.get_log('performance') с разбором JSON каждой записи
+"""
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+try:
+    import trio
+    TRIO_AVAILABLE = True
+except ImportError:
+    TRIO_AVAILABLE = False
+
+
+class ResponseWatcher:
+    """Слушает Network.responseReceived в фоновом потоке и накапливает ответы на документы.
+
+    Ответы разбираются только для событий нужного типа (документ страницы),
+    ожидающий поток просыпается сразу при появлении ответа.
+    """
+
+    def __init__(self, driver, max_events: int = 200):
+        self.driver = driver
+        self.last_event_time = time.time()
+        self._events = deque(maxlen=max_events)
+        self._condition = threading.Condition()
+        self._ready = threading.Event()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        self._trio_token = None
+        self._cancel_scope = None
+
+    @property
+    def active(self) -> bool:
+        """Подписка установлена и поток слушателя работает"""
+        return (self._ready.is_set() and not self._stopped
+                and self._thread is not None and self._thread.is_alive())
+
+    def start(self, timeout: float = 10) -> bool:
+        """Запускает слушатель. Возвращает False, если CDP-подписка недоступна"""
+        if not TRIO_AVAILABLE or not hasattr(self.driver, 'bidi_connection'):
+            return False
+
+        self._thread = threading.Thread(target=self._run, name="cdp-network", daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout)
+        return self.active
+
+    def _run(self):
+        try:
+            trio.run(self._listen)
+        except Exception as e:
+            if not self._stopped:
+                logging.warning(f"⚠️ CDP-подписка на сетевые события остановлена: {e}")
+        finally:
+            self._stopped = True
+            with self._condition:
+                self._condition.notify_all()
+
+    async def _listen(self):
+        self._trio_token = trio.lowlevel.current_trio_token()
+        with trio.CancelScope() as scope:
+            self._cancel_scope = scope
+            async with self.driver.bidi_connection() as connection:
+                session, devtools = connection.session, connection.devtools
+                await session.execute(devtools.network.enable())
+                document_type = devtools.network.ResourceType.DOCUMENT
+                self._ready.set()
+
+                async for event in session.listen(devtools.network.ResponseReceived):
+                    self.last_event_time = time.time()
+                    if event.type_ != document_type:
+                        continue
+                    response = event.response
+                    with self._condition:
+                        self._events.append((
+                            response.url, response.status,
+                            dict(response.headers or {}), dict(response.request_headers or {})
+                        ))
+                        self._condition.notify_all()
+
+    def clear(self):
+        """Забывает накопленные ответы (вызывать перед новой навигацией, чтобы не принять
+        запоздавший ответ предыдущей загрузки за результат текущей)"""
+        with self._condition:
+            self._events.clear()
+
+    def next_response(self, target_url: str, timeout: float) -> Optional[Tuple[str, int, Dict[str, str], Dict[str, str]]]:
+        """Ждёт следующий ответ (url, status, headers, request_headers), URL которого содержит target_url.
+        None - по таймауту или при остановке"""
+        deadline = time.time() + timeout
+        with self._condition:
+            while True:
+                while self._events:
+                    event = self._events.popleft()
+                    if target_url in event[0]:
+                        return event
+
+                remaining = deadline - time.time()
+                if remaining <= 0 or not self.active:
+                    return None
+                self._condition.wait(remaining)
+
+    def stop(self):
+        """Останавливает слушатель"""
+        self._stopped = True
+        if self._trio_token is not None and self._cancel_scope is not None:
+            try:
+                trio.from_thread.run_sync(self._cancel_scope.cancel, trio_token=self._trio_token)
+            except Exception:
+                pass
+        with self._condition:
+            self._condition.notify_all()
@@ -11,13 +11,18 @@ import logging
 from datetime import datetime
 from typing import List, Optional, Dict
 from models.product import Product, ShopComparison
+from utils.shop_helpers import build_listing_shop_map, extract_shop_names_from_results
+
+SHOPS_SHEET_NAME = "Etsy Shops"
+SHOP_URLS_CACHE_FILE = "shop_urls_cache.json"
 
 class DataService:
     """Сервис для сохранения и загрузки данных"""
     
-    def __init__(self, config):
+    def __init__(self, config, everbee_client=None):
         self.config = config
         self.output_dir = config.output_dir
+        self._everbee_client = everbee_client
         
         self.parsing_dir = os.path.join(self.output_dir, "parsing")
         self.tops_dir = os.path.join(self.output_dir, "tops")
@@ -32,7 +37,10 @@ class DataService:
         logging.info(f"📁 Структура: parsing={self.parsing_dir}, tops={self.tops_dir}")
     
     def start_parsing_session(self) -> str:
-        """Создаёт папку для текущего сеанса парсинга"""
+        """Создаёт папку для текущего сеанса парсинга и сбрасывает кэш статистики EverBee"""
+        if self._everbee_client is not None:
+            self._everbee_client.clear_stats_cache()
+        
         self.current_parsing_folder = datetime.now().strftime("%d.%m.%Y_%H.%M")
         self.current_parsing_dir = os.path.join(self.parsing_dir, self.current_parsing_folder)
         os.makedirs(self.current_parsing_dir, exist_ok=True)
@@ -212,102 +220,60 @@ class DataService:
             print(f"Ошибка при загрузке файла {results_file}: {e}")
             return None
     
-    def get_previous_results_file(self) -> Optional[str]:
-        """Находит последний файл results.json"""
-        current_folder_name = self.current_parsing_folder if self.current_parsing_folder else datetime.now().strftime("%d.%m.%Y_%H.%M")
-        date_folders = []
-        
-        if os.path.exists(self.parsing_dir):
-            for item in os.listdir(self.parsing_dir):
-                item_path = os.path.join(self.parsing_dir, item)
-                if os.path.isdir(item_path) and item != current_folder_name:
-                    results_file = os.path.join(item_path, "results.json")
-                    if os.path.exists(results_file):
-                        try:
-                            folder_datetime = datetime.strptime(item, "%d.%m.%Y_%H.%M") if "_" in item else datetime.strptime(item, "%d.%m.%Y")
-                            date_folders.append((folder_datetime, results_file))
-                        except ValueError:
-                            continue
-        
-        if os.path.exists(self.output_dir):
-            for item in os.listdir(self.output_dir):
-                if item in ["parsing", "tops"]:
-                    continue
-                    
-                item_path = os.path.join(self.output_dir, item)
-                if os.path.isdir(item_path) and item != current_folder_name:
-                    results_file = os.path.join(item_path, "results.json")
-                    if os.path.exists(results_file):
-                        try:
-                            folder_datetime = datetime.strptime(item, "%d.%m.%Y_%H.%M") if "_" in item else datetime.strptime(item, "%d.%m.%Y")
-                            date_folders.append((folder_datetime, results_file))
-                        except ValueError:
-                            continue
-        
-        if not date_folders:
-            return None
-        
-        date_folders.sort(key=lambda x: x[0], reverse=True)
-        return date_folders[0][1]
+    @property
+    def seen_listings(self):
+        """Постоянный индекс всех листингов и магазинов, встречавшихся в прошлых циклах"""
+        from services.seen_listings import get_seen_listing_index
+        return get_seen_listing_index(self.output_dir)
     
     def compare_all_shops_results(self, current_results: Dict[str, Dict[str, str]]) -> Dict[str, str]:
-        """Сравнивает текущие результаты с предыдущими и находит новые товары"""
-        previous_results_file = self.get_previous_results_file()
-        
-        if not previous_results_file:
-            print("Нет предыдущих результатов для сравнения - все товары считаются новыми")
-            new_products = {}
-            for shop_name, shop_products in current_results.items():
-                new_products.update(shop_products)
-            return new_products
+        """Находит новые товары: листинги, которых нет в индексе за всю историю парсинга.
         
-        previous_results = self.load_results_from_json(previous_results_file)
+        Все текущие листинги после сравнения добавляются в индекс.
+        """
+        seen = self.seen_listings
         
-        if not previous_results:
-            print("Не удалось загрузить предыдущие результаты - все товары считаются новыми")
+        if seen.is_empty():
+            print("Нет предыдущих результатов для сравнения - все товары считаются новыми")
             new_products = {}
             for shop_name, shop_products in current_results.items():
                 new_products.update(shop_products)
+            seen.add(current_results)
             return new_products
         
         new_products = {}
         
-        # print(f"Сравниваем магазины:")
-        # print(f"  Текущие магазины: {list(current_results.keys())}")
-        # print(f"  Предыдущие магазины: {list(previous_results.keys())}")
-        
         for shop_name in current_results:
-            if shop_name in previous_results:
-                current_listings = set(current_results[shop_name].keys())
-                previous_listings = set(previous_results[shop_name].keys())
+            if seen.has_shop(shop_name):
+                current_listings = current_results[shop_name]
+                new_listing_ids = seen.filter_unseen(current_listings.keys())
                 
                 print(f"  Магазин {shop_name}:")
                 print(f"    Текущие товары: {len(current_listings)}")
-                print(f"    Предыдущие товары: {len(previous_listings)}")
-                
-                new_listing_ids = current_listings - previous_listings
+                print(f"    Известно листингов за всю историю: {len(seen)}")
                 
                 if new_listing_ids:
-                    print(f"    Новые товары: {list(new_listing_ids)}")
+                    print(f"    Новые товары: {new_listing_ids}")
                     for listing_id in new_listing_ids:
-                        new_products[listing_id] = current_results[shop_name][listing_id]
+                        new_products[listing_id] = current_listings[listing_id]
                     print(f"Магазин {shop_name}: найдено {len(new_listing_ids)} новых товаров")
                 else:
                     print(f"    Новых товаров не найдено")
             else:
                 print(f"Магазин {shop_name}: новый магазин, пропускаем сравнение")
         
+        seen.add(current_results)
         print(f"Всего найдено новых товаров: {len(new_products)}")
-        # if new_products:
-        #     print("Список новых товаров:")
-        #     for listing_id, url in new_products.items():
-        #         print(f"  - {listing_id}: {url}")
-
         
         return new_products
     
-    def save_results_with_new_products(self, all_shop_products: Dict[str, List[Product]], new_products: Dict[str, str], new_products_full_data: Dict[str, Product] = None) -> str:
-        """Сохраняет результаты с новыми товарами"""
+    def save_results_with_new_products(self, all_shop_products: Dict[str, List[Product]], new_products: Dict[str, str],
+                                       new_products_full_data: Dict[str, Product] = None,
+                                       shop_names: Optional[Dict[str, str]] = None) -> str:
+        """Сохраняет результаты с новыми товарами.
+        
+        shop_names - карта listing_id -> магазин для новинок (если не передана, строится один раз здесь)
+        """
         if not self.current_parsing_dir:
             self.start_parsing_session()
         
@@ -326,31 +292,30 @@ class DataService:
             json.dump(results, f, ensure_ascii=False, indent=2)
         
         print(f"Результаты с новыми товарами сохранены: {results_file}")
-        self.save_new_products_to_sheets(new_products, results)
+        if shop_names is None:
+            shop_names = build_listing_shop_map(shops_data, new_products)
+        self.save_new_products_to_sheets(new_products, results, shop_names)
         
-        # Сохраняем новые товары в new_perspective_listings.json
+        # Сохраняем новые товары в хранилище перспективных листингов
         if new_products:
             self.save_new_perspective_listings(new_products, new_products_full_data)
         
         return results_file
     
+    @property
+    def everbee_client(self):
+        """EverBee клиент (создаётся при первом обращении, использует общий пул соединений)"""
+        if self._everbee_client is None:
+            from utils.everbee_client import EverBeeClient
+            self._everbee_client = EverBeeClient()
+        return self._everbee_client
+    
     def save_new_perspective_listings(self, new_products: Dict[str, str], new_products_full_data: Dict[str, Product] = None):
-        """Сохраняет новые товары в new_perspective_listings.json с полными данными из EverBee"""
-        from utils.everbee_client import EverBeeClient
-        
-        new_listings_file = os.path.join(self.tops_dir, "new_perspective_listings.json")
-        
-        # Загружаем существующие данные
-        existing_data = {"listings": {}}
-        if os.path.exists(new_listings_file):
-            try:
-                with open(new_listings_file, 'r', encoding='utf-8') as f:
-                    existing_data = json.load(f)
-            except Exception as e:
-                logging.error(f"Ошибка загрузки {new_listings_file}: {e}")
+        """Сохраняет новые товары в хранилище листингов с полными данными из EverBee"""
+        from services.listing_store import get_listing_store
         
         # Получаем данные из EverBee пакетным запросом
-        everbee_client = EverBeeClient()
+        everbee_client = self.everbee_client
         current_session = self.current_parsing_folder or datetime.now().strftime("%d.%m.%Y_%H.%M")
         
         # Получаем все данные одним запросом
@@ -359,46 +324,40 @@ class DataService:
         
         try:
             if listing_ids:
-                batch_data = everbee_client.get_listings_batch(listing_ids)
-                if batch_data and 'results' in batch_data:
-                    for listing_info in batch_data['results']:
-                        listing_id = str(listing_info.get('listing_id', ''))
-                        everbee_data_batch[listing_id] = everbee_client.extract_listing_data(listing_info)
+                for listing_id, listing_info in everbee_client.get_listings_stats(listing_ids).items():
+                    everbee_data_batch[listing_id] = everbee_client.extract_listing_data(listing_info)
         except Exception as e:
             logging.error(f"Ошибка получения пакетных данных EverBee: {e}")
         
-        # Добавляем данные в структуру
-        for listing_id, url in new_products.items():
-            if listing_id not in existing_data["listings"]:
-                existing_data["listings"][listing_id] = {}
-            
-            # Используем данные из пакетного запроса или только URL
-            everbee_data = everbee_data_batch.get(listing_id, {"url": url})
-            existing_data["listings"][listing_id][current_session] = everbee_data
+        # Используем данные из пакетного запроса или только URL
+        snapshots = {
+            listing_id: everbee_data_batch.get(listing_id, {"url": url})
+            for listing_id, url in new_products.items()
+        }
         
-        # Сохраняем обновленные данные
-        with open(new_listings_file, 'w', encoding='utf-8') as f:
-            json.dump(existing_data, f, ensure_ascii=False, indent=2)
+        store = get_listing_store(self.tops_dir)
+        store.add_snapshots(current_session, snapshots)
         
-        logging.info(f"Новые листинги с EverBee данными сохранены в {new_listings_file}: {len(new_products)} товаров")
+        logging.info(f"Новые листинги с EverBee данными сохранены в {store.db_path}: {len(new_products)} товаров")
     
-    def save_new_products_to_sheets(self, new_products: Dict[str, str], results: Dict = None):
-        """Сохраняет новые товары в Google Sheets"""
+    def save_new_products_to_sheets(self, new_products: Dict[str, str], results: Dict = None,
+                                    shop_names: Optional[Dict[str, str]] = None):
+        """Ставит новые товары в очередь выгрузки в Google Sheets (выгрузка идёт в фоне)"""
         if not new_products:
             return
         
         if hasattr(self.config, 'google_sheets_enabled') and self.config.google_sheets_enabled:
             try:
-                from services.google_sheets_service import GoogleSheetsService
-                sheets_service = GoogleSheetsService(self.config)
+                from services.sheets_export_queue import get_sheets_export_queue
+                if shop_names is None:
+                    shop_names = extract_shop_names_from_results(results) if results else {}
                 
-                if sheets_service.enabled:
-                    sheets_service.add_new_products_to_sheets(
-                        self.config.google_sheets_spreadsheet_id,
-                        new_products,
-                        "Etsy Products",
-                        results
-                    )
+                get_sheets_export_queue(self.config).enqueue_new_products(
+                    self.config.google_sheets_spreadsheet_id,
+                    new_products,
+                    shop_names,
+                    "Etsy Products"
+                )
             except Exception as e:
                 print(f"⚠️ Ошибка Google Sheets: {e}")
     
@@ -445,21 +404,62 @@ class DataService:
             return False
     
     def load_shop_urls(self) -> List[str]:
-        """Загружает список URL магазинов из Google Sheets"""
-        if hasattr(self.config, 'google_sheets_enabled') and self.config.google_sheets_enabled:
-            try:
-                from services.google_sheets_service import GoogleSheetsService
-                sheets_service = GoogleSheetsService(self.config)
-                
-                if sheets_service.enabled:
-                    urls = sheets_service.load_shop_urls_from_sheets(
-                        self.config.google_sheets_spreadsheet_id,
-                        "Etsy Shops"
-                    )
-                    if urls:
-                        print(f"📊 Загружено {len(urls)} URL из Google Sheets")
-                        return urls
-            except Exception as e:
-                print(f"⚠️ Ошибка Google Sheets: {e}")
+        """Загружает список URL магазинов из Google Sheets.
+        
+        Последний удачно загруженный список сохраняется на диске и используется,
+        если Google Sheets недоступен.
+        """
+        if not (hasattr(self.config, 'google_sheets_enabled') and self.config.google_sheets_enabled):
+            return []
+        
+        spreadsheet_id = self.config.google_sheets_spreadsheet_id
+        cache = self._load_shop_urls_cache()
+        cached_urls = cache.get("urls", []) if cache.get("spreadsheet_id") == spreadsheet_id else []
+        
+        try:
+            from services.google_sheets_service import get_google_sheets_service
+            sheets_service = get_google_sheets_service(self.config)
+            
+            if sheets_service.enabled:
+                urls = sheets_service.load_shop_urls_from_sheets(spreadsheet_id, SHOPS_SHEET_NAME)
+                if urls:
+                    print(f"📊 Загружено {len(urls)} URL из Google Sheets")
+                    self._save_shop_urls_cache(spreadsheet_id, urls)
+                    return urls
+        except Exception as e:
+            print(f"⚠️ Ошибка Google Sheets: {e}")
+        
+        if cached_urls:
+            print(f"⚠️ Google Sheets недоступен, используем последний сохранённый список: {len(cached_urls)} URL "
+                  f"(от {cache.get('saved_at', '?')})")
+            return cached_urls
         
         return []
+    
+    @property
+    def shop_urls_cache_file(self) -> str:
+        return os.path.join(self.output_dir, SHOP_URLS_CACHE_FILE)
+    
+    def _load_shop_urls_cache(self) -> Dict:
+        try:
+            with open(self.shop_urls_cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logging.warning(f"⚠️ Не удалось прочитать кэш списка магазинов: {e}")
+            return {}
+    
+    def _save_shop_urls_cache(self, spreadsheet_id: str, urls: List[str]):
+        cache = {
+            "spreadsheet_id": spreadsheet_id,
+            "saved_at": datetime.now().isoformat(),
+            "urls": urls
+        }
+        tmp_file = self.shop_urls_cache_file + ".tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.shop_urls_cache_file)
+        except Exception as e:
+            logging.warning(f"⚠️ Не удалось сохранить кэш списка магазинов: {e}")
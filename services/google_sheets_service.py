@@ -1,16 +1,49 @@
+import time
+import threading
 import gspread
 from google.auth.exceptions import GoogleAuthError
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from utils.shop_helpers import get_shop_name_for_product, extract_shop_names_from_results
 
+# Через сколько секунд повторять неудавшуюся аутентификацию
+AUTH_RETRY_INTERVAL = 300
+
+
 class GoogleSheetsService:
+    """Клиент Google Sheets.
+    
+    Аутентификация выполняется лениво при первом обращении, открытые таблицы и листы
+    кэшируются. Токен сервисного аккаунта обновляется google-auth только по истечении срока.
+    Используйте get_google_sheets_service(config), чтобы получить общий на процесс экземпляр.
+    """
     
     def __init__(self, config):
         self.config = config
         self.credentials_file = config.google_sheets_credentials or "credentials.json"
         self.client = None
-        self.enabled = self._initialize_client()
+        self._lock = threading.RLock()
+        self._auth_failed_at: Optional[float] = None
+        self._spreadsheets: Dict[str, gspread.Spreadsheet] = {}
+        self._worksheets: Dict[Tuple[str, str], gspread.Worksheet] = {}
+    
+    @property
+    def enabled(self) -> bool:
+        """Клиент готов к работе (при первом обращении выполняет аутентификацию)"""
+        return self._ensure_client()
+    
+    def _ensure_client(self) -> bool:
+        with self._lock:
+            if self.client is not None:
+                return True
+            if self._auth_failed_at is not None and time.time() - self._auth_failed_at < AUTH_RETRY_INTERVAL:
+                return False
+            
+            if self._initialize_client():
+                self._auth_failed_at = None
+                return True
+            self._auth_failed_at = time.time()
+            return False
     
     def _initialize_client(self) -> bool:
         try:
@@ -27,6 +60,43 @@ class GoogleSheetsService:
             print(f"❌ Ошибка инициализации Google Sheets: {e}")
             return False
     
+    def _get_spreadsheet(self, spreadsheet_id: str) -> gspread.Spreadsheet:
+        """Таблица из кэша (open_by_key выполняется один раз)"""
+        with self._lock:
+            spreadsheet = self._spreadsheets.get(spreadsheet_id)
+            if spreadsheet is None:
+                spreadsheet = self.client.open_by_key(spreadsheet_id)
+                self._spreadsheets[spreadsheet_id] = spreadsheet
+            return spreadsheet
+    
+    def _get_worksheet(self, spreadsheet_id: str, sheet_name: str) -> gspread.Worksheet:
+        """Лист из кэша. Бросает gspread.WorksheetNotFound, если листа нет"""
+        key = (spreadsheet_id, sheet_name)
+        with self._lock:
+            worksheet = self._worksheets.get(key)
+            if worksheet is None:
+                worksheet = self._get_spreadsheet(spreadsheet_id).worksheet(sheet_name)
+                self._worksheets[key] = worksheet
+            return worksheet
+    
+    def _add_worksheet(self, spreadsheet_id: str, sheet_name: str, rows: int, cols: int) -> gspread.Worksheet:
+        """Создаёт лист и кладёт его в кэш"""
+        with self._lock:
+            worksheet = self._get_spreadsheet(spreadsheet_id).add_worksheet(title=sheet_name, rows=rows, cols=cols)
+            self._worksheets[(spreadsheet_id, sheet_name)] = worksheet
+            return worksheet
+    
+    def invalidate_cache(self, spreadsheet_id: Optional[str] = None):
+        """Сбрасывает кэш открытых таблиц и листов (после ошибки - лист могли удалить или переименовать)"""
+        with self._lock:
+            if spreadsheet_id is None:
+                self._spreadsheets.clear()
+                self._worksheets.clear()
+                return
+            self._spreadsheets.pop(spreadsheet_id, None)
+            for key in [key for key in self._worksheets if key[0] == spreadsheet_id]:
+                del self._worksheets[key]
+    
     def load_shop_urls_from_sheets(self, spreadsheet_id: str, sheet_name: str = "Etsy Shops") -> List[str]:
         if not self.enabled:
             print("⚠️ Google Sheets не настроен, используем локальный файл")
@@ -35,8 +105,7 @@ class GoogleSheetsService:
         try:
             print(f"📊 Загрузка URL магазинов из листа '{sheet_name}'...")
             
-            spreadsheet = self.client.open_by_key(spreadsheet_id)
-            worksheet = spreadsheet.worksheet(sheet_name)
+            worksheet = self._get_worksheet(spreadsheet_id, sheet_name)
             values = worksheet.col_values(1)
             
             urls = []
@@ -51,28 +120,30 @@ class GoogleSheetsService:
             print(f"❌ Лист '{sheet_name}' не найден в таблице")
             return []
         except Exception as e:
+            self.invalidate_cache(spreadsheet_id)
             print(f"❌ Ошибка при загрузке URL из Google Sheets: {e}")
             return []
     
-    def add_new_products_to_sheets(self, spreadsheet_id: str, new_products: Dict[str, str], sheet_name: str = "Etsy Products", results: Dict = None):
+    def add_new_products_to_sheets(self, spreadsheet_id: str, new_products: Dict[str, str], sheet_name: str = "Etsy Products",
+                                   results: Dict = None, shop_names: Optional[Dict[str, str]] = None) -> bool:
+        """Добавляет новинки сверху листа. shop_names - готовая карта listing_id -> магазин
+        (если не передана, строится один раз по results). False - если выгрузка не удалась"""
         if not self.enabled:
             print("⚠️ Google Sheets не настроен, пропускаем сохранение")
-            return
+            return False
         
         if not new_products:
             print("📊 Нет новых товаров для добавления в Google Sheets")
-            return
+            return True
         
         try:
             print(f"📊 Добавление {len(new_products)} новых товаров в лист '{sheet_name}'...")
             
-            spreadsheet = self.client.open_by_key(spreadsheet_id)
-            
             try:
-                worksheet = spreadsheet.worksheet(sheet_name)
+                worksheet = self._get_worksheet(spreadsheet_id, sheet_name)
             except gspread.WorksheetNotFound:
                 print(f"📊 Создание нового листа '{sheet_name}'...")
-                worksheet = spreadsheet.add_worksheet(title=sheet_name, rows=1000, cols=3)
+                worksheet = self._add_worksheet(spreadsheet_id, sheet_name, rows=1000, cols=3)
                 worksheet.update('A1:C1', [['Ссылки на товары', 'Время обнаружения', 'Название магазина']])
             
             current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -86,18 +157,21 @@ class GoogleSheetsService:
             except Exception:
                 existing_urls = set()
             
+            if shop_names is None:
+                shop_names = extract_shop_names_from_results(results) if results else {}
+            
             rows_to_add = []
             for listing_id, url in new_products.items():
                 if url in existing_urls:
                     continue
                 
-                shop_name = get_shop_name_for_product(listing_id, url, results)
+                shop_name = get_shop_name_for_product(listing_id, url, listing_to_shop=shop_names)
                 rows_to_add.append([url, current_time, shop_name])
                 existing_urls.add(url)
             
             if not rows_to_add:
                 print("📊 Все найденные новинки уже есть в Google Sheets")
-                return
+                return True
             
             chunk_size = 100
             for start in range(len(rows_to_add), 0, -chunk_size):
@@ -111,26 +185,30 @@ class GoogleSheetsService:
             print(f"✅ Добавлено {len(rows_to_add)} новых товаров в Google Sheets (сверху)")
             added_shops = {row[2] for row in rows_to_add}
             print(f"📊 Добавлены товары из магазинов: {', '.join(added_shops)}")
+            return True
             
         except Exception as e:
+            self.invalidate_cache(spreadsheet_id)
             print(f"❌ Ошибка при добавлении товаров в Google Sheets: {e}")
+            return False
     
-    def add_top_listings_to_sheets(self, spreadsheet_id: str, top_listings: Dict, sheet_name: str = "Top Listings"):
+    def add_top_listings_to_sheets(self, spreadsheet_id: str, top_listings: Dict, sheet_name: str = "Top Listings") -> bool:
+        """Upsert топ-листингов по ссылке: новые вставляются сверху, уже выгруженные обновляются на месте.
+        Объём записи пропорционален количеству переданных листингов, а не размеру листа.
+        False - если выгрузка не удалась"""
         if not self.enabled:
             print("⚠️ Google Sheets не настроен, пропускаем сохранение")
-            return
+            return False
         
         if not top_listings:
             print("📊 Нет топ-листингов для добавления в Google Sheets")
-            return
+            return True
         
         try:
             print(f"📊 Добавление {len(top_listings)} топ-хитов в лист '{sheet_name}'...")
             
-            spreadsheet = self.client.open_by_key(spreadsheet_id)
-            
             try:
-                worksheet = spreadsheet.worksheet(sheet_name)
+                worksheet = self._get_worksheet(spreadsheet_id, sheet_name)
                 # Ensure we have enough columns (10)
                 try:
                     if worksheet.col_count < 10:
@@ -139,7 +217,7 @@ class GoogleSheetsService:
                     pass
             except gspread.WorksheetNotFound:
                 print(f"📊 Создание нового листа '{sheet_name}'...")
-                worksheet = spreadsheet.add_worksheet(title=sheet_name, rows=1000, cols=10)
+                worksheet = self._add_worksheet(spreadsheet_id, sheet_name, rows=1000, cols=10)
                 worksheet.update('A1:J1', [[
                     'Ссылка на товар',
                     'Когда появился',
@@ -153,81 +231,91 @@ class GoogleSheetsService:
                     'Отзывы'
                 ]])
             
+            # Читаем только колонку ссылок: номер строки для каждого уже выгруженного листинга
+            existing_rows = {}
+            for row_number, value in enumerate(worksheet.col_values(1)[1:], start=2):
+                url = value.strip() if value else ''
+                if url and url not in existing_rows:
+                    existing_rows[url] = row_number
+            
+            updates = []
             rows_to_add = []
+            added_urls = set()
             for listing_id, data in top_listings.items():
-                # Конвертируем формат даты из "12.10.2025_15.29" в "2025-10-12 15:29"
-                def convert_date(date_str):
-                    try:
-                        dt = datetime.strptime(date_str, "%d.%m.%Y_%H.%M")
-                        return dt.strftime("%Y-%m-%d %H:%M")
-                    except:
-                        return date_str
-                
-                # Приводим к числовым типам для корректной сортировки в Google Sheets
-                try:
-                    views_start = int(data.get('views_start', 0))
-                    views_hit = int(data.get('views_hit', 0))
-                    views_daily = float(data.get('views_daily_growth', 0.0))
-                    
-                    likes_start = int(data.get('likes_start', 0))
-                    likes_hit = int(data.get('likes_hit', 0))
-                    likes_daily = float(data.get('likes_daily_growth', 0.0))
-                    
-                    reviews = int(data.get('reviews', 0))
-                except (ValueError, TypeError):
-                    # Fallback если вдруг пришли плохие данные
-                    views_start = data.get('views_start', 0)
-                    views_hit = data.get('views_hit', 0)
-                    views_daily = data.get('views_daily_growth', 0)
-                    likes_start = data.get('likes_start', 0)
-                    likes_hit = data.get('likes_hit', 0)
-                    likes_daily = data.get('likes_daily_growth', 0)
-                    reviews = data.get('reviews', 0)
-
-                rows_to_add.append([
-                    data['url'],
-                    convert_date(data['discovered_at']),
-                    convert_date(data['became_hit_at']),
-                    views_start,
-                    views_hit,
-                    views_daily,
-                    likes_start,
-                    likes_hit,
-                    likes_daily,
-                    reviews
-                ])
-            
-            # Get existing data and normalize to 10 columns
-            existing_data = worksheet.get_all_values()[1:]
-            normalized_existing = []
-            for row in existing_data:
-                if len(row) < 10:
-                    # Pad with 0 for missing columns
-                    row = row + [0] * (10 - len(row))
-                elif len(row) > 10:
-                    # Trim to 10 columns
-                    row = row[:10]
-                normalized_existing.append(row)
-            
-            all_data = rows_to_add + normalized_existing
-            
-            if all_data:
-                worksheet.batch_clear([f'A2:J{len(all_data) + 1}'])
-                range_name = f'A2:J{len(all_data) + 1}'
-                worksheet.update(range_name, all_data)
-                
-                print(f"✅ Добавлено {len(rows_to_add)} топ-хитов в Google Sheets (сверху)")
-                print(f"📊 Общее количество записей: {len(all_data)}")
+                row = self._top_listing_row(data)
+                row_number = existing_rows.get(row[0])
+                if row_number:
+                    updates.append({'range': f'A{row_number}:J{row_number}', 'values': [row]})
+                elif row[0] not in added_urls:
+                    rows_to_add.append(row)
+                    added_urls.add(row[0])
+            
+            # Сначала обновляем существующие строки (вставка сверху сдвинет их номера)
+            if updates:
+                worksheet.batch_update(updates, value_input_option='USER_ENTERED')
+            
+            if rows_to_add:
+                worksheet.insert_rows(rows_to_add, row=2, value_input_option='USER_ENTERED')
+            
+            print(f"✅ Топ-хиты в Google Sheets: добавлено {len(rows_to_add)} (сверху), обновлено {len(updates)}")
+            return True
             
         except Exception as e:
+            self.invalidate_cache(spreadsheet_id)
             print(f"❌ Ошибка при добавлении топ-хитов в Google Sheets: {e}")
+            return False
+    
+    @staticmethod
+    def _top_listing_row(data: Dict) -> List:
+        """Строка листа 'Top Listings' для топ-листинга"""
+        # Конвертируем формат даты из "12.10.2025_15.29" в "2025-10-12 15:29"
+        def convert_date(date_str):
+            try:
+                dt = datetime.strptime(date_str, "%d.%m.%Y_%H.%M")
+                return dt.strftime("%Y-%m-%d %H:%M")
+            except:
+                return date_str
+        
+        # Приводим к числовым типам для корректной сортировки в Google Sheets
+        try:
+            views_start = int(data.get('views_start', 0))
+            views_hit = int(data.get('views_hit', 0))
+            views_daily = float(data.get('views_daily_growth', 0.0))
+            
+            likes_start = int(data.get('likes_start', 0))
+            likes_hit = int(data.get('likes_hit', 0))
+            likes_daily = float(data.get('likes_daily_growth', 0.0))
+            
+            reviews = int(data.get('reviews', 0))
+        except (ValueError, TypeError):
+            # Fallback если вдруг пришли плохие данные
+            views_start = data.get('views_start', 0)
+            views_hit = data.get('views_hit', 0)
+            views_daily = data.get('views_daily_growth', 0)
+            likes_start = data.get('likes_start', 0)
+            likes_hit = data.get('likes_hit', 0)
+            likes_daily = data.get('likes_daily_growth', 0)
+            reviews = data.get('reviews', 0)
+        
+        return [
+            data['url'].strip(),
+            convert_date(data['discovered_at']),
+            convert_date(data['became_hit_at']),
+            views_start,
+            views_hit,
+            views_daily,
+            likes_start,
+            likes_hit,
+            likes_daily,
+            reviews
+        ]
     
     def test_connection(self, spreadsheet_id: str) -> bool:
         if not self.enabled:
             return False
         
         try:
-            spreadsheet = self.client.open_by_key(spreadsheet_id)
+            spreadsheet = self._get_spreadsheet(spreadsheet_id)
             print(f"✅ Подключение к таблице '{spreadsheet.title}' успешно")
             
             worksheets = spreadsheet.worksheets()
@@ -235,5 +323,21 @@ class GoogleSheetsService:
             
             return True
         except Exception as e:
+            self.invalidate_cache(spreadsheet_id)
             print(f"❌ Ошибка подключения к Google Sheets: {e}")
-            return False
\ No newline at end of file
+            return False
+
+
+_services: Dict[str, GoogleSheetsService] = {}
+_services_lock = threading.Lock()
+
+
+def get_google_sheets_service(config) -> GoogleSheetsService:
+    """Возвращает общий на процесс клиент Google Sheets для файла credentials из конфига"""
+    credentials_file = config.google_sheets_credentials or "credentials.json"
+    with _services_lock:
+        service = _services.get(credentials_file)
+        if service is None:
+            service = GoogleSheetsService(config)
+            _services[credentials_file] = service
+        return service
\ No newline at end of file
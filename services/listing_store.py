@@ -0,0 +1,303 @@
+"""
+SQLite-хранилище перспективных листингов, их снимков статистики и топов
+Заменяет new_perspective_listings.json и top-listings.json
+"""
+import os
+import json
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Set, Tuple, Iterable, Optional
+
+SNAPSHOT_KEY_FORMAT = "%d.%m.%Y_%H.%M"
+
+
+def snapshot_key_to_epoch(snapshot_key: str) -> Optional[int]:
+    """Переводит метку снимка "%d.%m.%Y_%H.%M" в unix-время (None для нераспознанных меток)"""
+    try:
+        return int(datetime.strptime(snapshot_key, SNAPSHOT_KEY_FORMAT).timestamp())
+    except (ValueError, TypeError):
+        return None
+
+
+def _taken_at(snapshot_key: str) -> int:
+    """Значение колонки taken_at: 0 для нераспознанных меток (такие снимки не попадают в индекс)"""
+    return snapshot_key_to_epoch(snapshot_key) or 0
+
+
+def build_snapshot_index(listings: Dict[str, Dict]) -> Dict[str, List[Tuple[int, str]]]:
+    """Строит индекс {listing_id: [(epoch, snapshot_key), ...]} по возрастанию времени
+    для данных, полученных не из хранилища. Нераспознанные метки пропускаются"""
+    index = {}
+    for listing_id, snapshots in listings.items():
+        timeline = sorted(
+            (epoch, key) for epoch, key in ((snapshot_key_to_epoch(key), key) for key in snapshots)
+            if epoch is not None
+        )
+        if timeline:
+            index[listing_id] = timeline
+    return index
+
+
+def get_snapshot_index(data: Dict) -> Dict[str, List[Tuple[int, str]]]:
+    """Возвращает индекс снимков из data (load_listings кладёт его в data["index"])"""
+    index = data.get("index")
+    if index is None:
+        index = build_snapshot_index(data.get("listings", {}))
+        data["index"] = index
+    return index
+
+
+class ListingStore:
+    """Потокобезопасное хранилище листингов в SQLite (один файл на папку tops/)"""
+
+    DB_FILENAME = "listings.db"
+    LEGACY_LISTINGS_FILE = "new_perspective_listings.json"
+    LEGACY_TOPS_FILE = "top-listings.json"
+
+    def __init__(self, tops_dir: str = "output/tops"):
+        self.tops_dir = tops_dir
+        os.makedirs(self.tops_dir, exist_ok=True)
+        self.db_path = os.path.join(self.tops_dir, self.DB_FILENAME)
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._init_schema()
+        self.import_legacy_json()
+
+    def _init_schema(self):
+        """Создаёт таблицы и индексы"""
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS snapshots (
+                    listing_id TEXT NOT NULL,
+                    snapshot_key TEXT NOT NULL,
+                    taken_at INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (listing_id, snapshot_key)
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_snapshots_listing_time ON snapshots (listing_id, taken_at)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_snapshots_time ON snapshots (taken_at)"
+            )
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS tops (
+                    listing_id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+    def import_legacy_json(self) -> bool:
+        """Однократно импортирует данные из new_perspective_listings.json и top-listings.json.
+
+        После успешного импорта файлы переименовываются в *.imported.
+        """
+        listings_file = os.path.join(self.tops_dir, self.LEGACY_LISTINGS_FILE)
+        tops_file = os.path.join(self.tops_dir, self.LEGACY_TOPS_FILE)
+        legacy_files = [f for f in (listings_file, tops_file) if os.path.exists(f)]
+
+        if not legacy_files:
+            return False
+
+        try:
+            listings = {}
+            tops = {}
+            if os.path.exists(listings_file):
+                with open(listings_file, 'r', encoding='utf-8') as f:
+                    listings = json.load(f).get("listings", {})
+            if os.path.exists(tops_file):
+                with open(tops_file, 'r', encoding='utf-8') as f:
+                    tops = json.load(f).get("listings", {})
+
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO snapshots (listing_id, snapshot_key, taken_at, data) VALUES (?, ?, ?, ?)",
+                    (
+                        (listing_id, key, _taken_at(key), json.dumps(stats, ensure_ascii=False))
+                        for listing_id, snapshots in listings.items()
+                        for key, stats in snapshots.items()
+                    )
+                )
+                self._upsert_top_rows(tops)
+
+            for path in legacy_files:
+                os.replace(path, path + ".imported")
+
+            logging.info(f"Импорт JSON в {self.db_path}: {len(listings)} листингов, {len(tops)} топов")
+            return True
+
+        except Exception as e:
+            logging.error(f"Ошибка импорта JSON в хранилище листингов: {e}")
+            return False
+
+    # ===== Снимки перспективных листингов =====
+    def load_listings(self) -> Dict:
+        """Возвращает все снимки в формате {"listings": {listing_id: {snapshot_key: stats}}}.
+
+        В data["index"] кладётся отсортированный индекс {listing_id: [(epoch, snapshot_key), ...]}:
+        первый, последний и предыдущий снимки доступны за O(1) без разбора строковых меток.
+        Снимки с нераспознанной меткой в индекс не попадают.
+        """
+        listings: Dict[str, Dict] = {}
+        index: Dict[str, List[Tuple[int, str]]] = {}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT listing_id, snapshot_key, taken_at, data FROM snapshots ORDER BY listing_id, taken_at"
+            ).fetchall()
+
+        for listing_id, key, taken_at, data in rows:
+            listings.setdefault(listing_id, {})[key] = json.loads(data)
+            if taken_at > 0:
+                index.setdefault(listing_id, []).append((taken_at, key))
+        return {"listings": listings, "index": index}
+
+    def get_listing_ids(self) -> List[str]:
+        """Возвращает ID всех отслеживаемых листингов"""
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT listing_id FROM snapshots").fetchall()
+        return [row[0] for row in rows]
+
+    def get_listing_snapshots(self, listing_id: str) -> Dict[str, Dict]:
+        """Возвращает снимки одного листинга {snapshot_key: stats} по возрастанию времени"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT snapshot_key, data FROM snapshots WHERE listing_id = ? ORDER BY taken_at",
+                (listing_id,)
+            ).fetchall()
+        return {key: json.loads(data) for key, data in rows}
+
+    def load_latest_snapshot_pairs(self) -> List[Tuple[str, str, Dict, str, Dict]]:
+        """Возвращает для каждого листинга с 2+ снимками (listing_id, prev_key, prev_stats, last_key, last_stats)
+        одним запросом"""
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT listing_id, snapshot_key, data FROM (
+                    SELECT listing_id, snapshot_key, data,
+                           ROW_NUMBER() OVER (PARTITION BY listing_id ORDER BY taken_at DESC) AS rn
+                    FROM snapshots
+                    WHERE taken_at > 0
+                )
+                WHERE rn <= 2
+                ORDER BY listing_id, rn DESC
+            """).fetchall()
+
+        pairs = []
+        for i in range(1, len(rows)):
+            prev_row, last_row = rows[i - 1], rows[i]
+            if prev_row[0] == last_row[0]:
+                pairs.append((
+                    last_row[0],
+                    prev_row[1], json.loads(prev_row[2]),
+                    last_row[1], json.loads(last_row[2])
+                ))
+        return pairs
+
+    def add_snapshots(self, snapshot_key: str, stats: Dict[str, Dict],
+                      delete: Optional[Iterable[Tuple[str, str]]] = None):
+        """Добавляет снимки с меткой snapshot_key и (в той же транзакции) удаляет пары (listing_id, snapshot_key)"""
+        taken_at = _taken_at(snapshot_key)
+        with self._lock, self._conn:
+            if delete:
+                self._conn.executemany(
+                    "DELETE FROM snapshots WHERE listing_id = ? AND snapshot_key = ?", list(delete)
+                )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO snapshots (listing_id, snapshot_key, taken_at, data) VALUES (?, ?, ?, ?)",
+                (
+                    (listing_id, snapshot_key, taken_at, json.dumps(listing_stats, ensure_ascii=False))
+                    for listing_id, listing_stats in stats.items()
+                )
+            )
+
+    def delete_intermediate_snapshots(self) -> int:
+        """Удаляет все снимки, кроме первого и последнего у каждого листинга. Возвращает количество.
+
+        Снимки с нераспознанной меткой (taken_at = 0) не участвуют в выборе первого и последнего
+        и не удаляются.
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute("""
+                DELETE FROM snapshots WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid,
+                               ROW_NUMBER() OVER (PARTITION BY listing_id ORDER BY taken_at) AS rn,
+                               COUNT(*) OVER (PARTITION BY listing_id) AS cnt
+                        FROM snapshots
+                        WHERE taken_at > 0
+                    )
+                    WHERE rn > 1 AND rn < cnt
+                )
+            """)
+        return cursor.rowcount
+
+    def _delete_listing_rows(self, listing_ids: List[str]):
+        self._conn.executemany("DELETE FROM snapshots WHERE listing_id = ?", [(i,) for i in listing_ids])
+
+    def remove_listings_in_tops(self) -> int:
+        """Удаляет из перспективных листинги, которые уже есть в топах. Возвращает количество листингов"""
+        with self._lock, self._conn:
+            count = self._conn.execute(
+                "SELECT COUNT(DISTINCT listing_id) FROM snapshots WHERE listing_id IN (SELECT listing_id FROM tops)"
+            ).fetchone()[0]
+            if count:
+                self._conn.execute("DELETE FROM snapshots WHERE listing_id IN (SELECT listing_id FROM tops)")
+        return count
+
+    # ===== Топ-листинги =====
+    def load_tops(self) -> Dict:
+        """Возвращает топы в формате {"listings": {listing_id: summary}}"""
+        with self._lock:
+            rows = self._conn.execute("SELECT listing_id, data FROM tops ORDER BY rowid").fetchall()
+        return {"listings": {listing_id: json.loads(data) for listing_id, data in rows}}
+
+    def get_top_ids(self) -> Set[str]:
+        """Возвращает ID всех топ-листингов"""
+        with self._lock:
+            rows = self._conn.execute("SELECT listing_id FROM tops").fetchall()
+        return {row[0] for row in rows}
+
+    def save_tops(self, summaries: Dict[str, Dict]):
+        """Добавляет или обновляет топ-листинги"""
+        with self._lock, self._conn:
+            self._upsert_top_rows(summaries)
+
+    def _upsert_top_rows(self, summaries: Dict[str, Dict]):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO tops (listing_id, data) VALUES (?, ?)",
+            ((listing_id, json.dumps(summary, ensure_ascii=False)) for listing_id, summary in summaries.items())
+        )
+
+    def promote_to_tops(self, summaries: Dict[str, Dict]):
+        """Переносит листинги в топы: сохраняет сводки и удаляет их снимки одной транзакцией"""
+        if not summaries:
+            return
+        with self._lock, self._conn:
+            self._upsert_top_rows(summaries)
+            self._delete_listing_rows(list(summaries.keys()))
+
+    def close(self):
+        """Закрывает соединение с базой"""
+        with self._lock:
+            self._conn.close()
+
+
+_stores: Dict[str, ListingStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_listing_store(tops_dir: str = "output/tops") -> ListingStore:
+    """Возвращает общее на процесс хранилище для папки tops_dir"""
+    key = os.path.abspath(tops_dir)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = ListingStore(tops_dir)
+            _stores[key] = store
+        return store
@@ -0,0 +1,196 @@
+"""
+Постоянный индекс всех когда-либо виденных листингов
+Хранится как отсортированный массив int64 (seen_listings.npy), открывается через mmap
+"""
+import os
+import glob
+import json
+import logging
+import threading
+from typing import Dict, Iterable, List, Set
+
+import numpy as np
+
+INDEX_FILE = "seen_listings.npy"
+SHOPS_FILE = "seen_shops.json"
+# Нечисловые ID листингов (не помещаются в массив int64)
+OTHER_IDS_FILE = "seen_other_ids.json"
+
+
+def _is_numeric_id(listing_id) -> bool:
+    try:
+        int(listing_id)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _to_ids(listing_ids: Iterable) -> np.ndarray:
+    """Переводит ID листингов в массив int64 (нечисловые ID пропускаются)"""
+    ids = []
+    for listing_id in listing_ids:
+        try:
+            ids.append(int(listing_id))
+        except (TypeError, ValueError):
+            continue
+    return np.asarray(ids, dtype=np.int64)
+
+
+class SeenListingIndex:
+    """Индекс ID листингов и магазинов, встречавшихся в любом цикле парсинга.
+
+    Проверка принадлежности - бинарный поиск по отсортированному массиву,
+    файл индекса отображается в память и не читается целиком.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.shops_path = os.path.join(directory, SHOPS_FILE)
+        self.other_ids_path = os.path.join(directory, OTHER_IDS_FILE)
+        self._lock = threading.Lock()
+        self._ids = np.empty(0, dtype=np.int64)
+        self._shops: Set[str] = set()
+        self._other_ids: Set[str] = set()
+
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.index_path) or os.path.exists(self.shops_path):
+            self._open()
+        else:
+            self._import_legacy_results()
+
+    def _open(self):
+        """Открывает индекс с диска"""
+        try:
+            if os.path.exists(self.index_path) and os.path.getsize(self.index_path) > 0:
+                self._ids = np.load(self.index_path, mmap_mode='r')
+        except Exception as e:
+            logging.error(f"❌ Не удалось открыть индекс листингов {self.index_path}: {e}")
+            self._ids = np.empty(0, dtype=np.int64)
+
+        self._shops = self._load_json_set(self.shops_path)
+        self._other_ids = self._load_json_set(self.other_ids_path)
+    
+    @staticmethod
+    def _load_json_set(path: str) -> Set[str]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return set(json.load(f))
+        except FileNotFoundError:
+            return set()
+        except Exception as e:
+            logging.error(f"❌ Не удалось прочитать {path}: {e}")
+            return set()
+    
+    @staticmethod
+    def _write_json_set(path: str, values: Set[str]):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(sorted(values), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _legacy_results_files(self) -> List[str]:
+        """Все results.json прошлых циклов (output/*/ и output/parsing/*/)"""
+        return (glob.glob(os.path.join(self.directory, "*", "results.json")) +
+                glob.glob(os.path.join(self.directory, "parsing", "*", "results.json")))
+
+    def _import_legacy_results(self):
+        """Однократно заполняет индекс из всех сохранённых results.json"""
+        shop_listings: Dict[str, Set[str]] = {}
+        files = self._legacy_results_files()
+
+        for results_file in files:
+            try:
+                with open(results_file, 'r', encoding='utf-8') as f:
+                    shops = json.load(f).get("shops", {})
+            except Exception as e:
+                logging.warning(f"⚠️ Пропускаем {results_file}: {e}")
+                continue
+            for shop_name, listings in shops.items():
+                shop_listings.setdefault(shop_name, set()).update(listings.keys())
+
+        if shop_listings:
+            self.add(shop_listings)
+            logging.info(f"📦 Индекс листингов заполнен из {len(files)} файлов results.json: {len(self)} листингов")
+
+    def __len__(self) -> int:
+        return len(self._ids) + len(self._other_ids)
+
+    def __contains__(self, listing_id) -> bool:
+        try:
+            value = int(listing_id)
+        except (TypeError, ValueError):
+            return listing_id in self._other_ids
+        ids = self._ids
+        position = int(np.searchsorted(ids, value))
+        return position < len(ids) and ids[position] == value
+
+    def is_empty(self) -> bool:
+        """True, если ещё не было ни одного цикла парсинга"""
+        return len(self._ids) == 0 and not self._shops and not self._other_ids
+
+    def has_shop(self, shop_name: str) -> bool:
+        """Встречался ли магазин раньше"""
+        return shop_name in self._shops
+
+    def filter_unseen(self, listing_ids: Iterable[str]) -> List[str]:
+        """Возвращает ID, которых нет в индексе (одним векторизованным поиском)"""
+        candidates = [listing_id for listing_id in listing_ids]
+        if not candidates:
+            return []
+
+        ids = self._ids
+        values = _to_ids(candidates)
+        if len(values) != len(candidates):
+            # Нечисловые ID проверяем по одному
+            return [listing_id for listing_id in candidates if listing_id not in self]
+
+        positions = np.searchsorted(ids, values)
+        found = np.zeros(len(values), dtype=bool)
+        in_range = positions < len(ids)
+        found[in_range] = ids[positions[in_range]] == values[in_range]
+        return [listing_id for listing_id, seen in zip(candidates, found) if not seen]
+
+    def add(self, shop_listings: Dict[str, Iterable[str]]):
+        """Добавляет листинги (по магазинам) в индекс и сохраняет его на диск"""
+        all_ids = [listing_id for listings in shop_listings.values() for listing_id in listings]
+        new_ids = _to_ids(all_ids)
+        other_ids = {str(listing_id) for listing_id in all_ids if not _is_numeric_id(listing_id)}
+
+        with self._lock:
+            merged = np.union1d(self._ids, new_ids).astype(np.int64)
+            shops = self._shops | set(shop_listings.keys())
+            merged_other_ids = self._other_ids | other_ids
+
+            if shops != self._shops:
+                self._write_json_set(self.shops_path, shops)
+                self._shops = shops
+            if merged_other_ids != self._other_ids:
+                self._write_json_set(self.other_ids_path, merged_other_ids)
+                self._other_ids = merged_other_ids
+
+            if len(merged) == len(self._ids):
+                return
+
+            tmp_index = self.index_path + ".tmp.npy"
+            np.save(tmp_index, merged)
+
+            # Освобождаем mmap старого файла перед заменой (иначе Windows не даст его перезаписать)
+            self._ids = merged
+            os.replace(tmp_index, self.index_path)
+            self._ids = np.load(self.index_path, mmap_mode='r')
+
+
+_indexes: Dict[str, SeenListingIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_seen_listing_index(directory: str) -> SeenListingIndex:
+    """Возвращает общий на процесс индекс для указанной папки"""
+    key = os.path.abspath(directory)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = SeenListingIndex(directory)
+            _indexes[key] = index
+        return index
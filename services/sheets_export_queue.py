@@ -0,0 +1,318 @@
+"""
+Очередь отложенной выгрузки в Google Sheets (write-behind)
+Задания пишутся в журнал на диске и выгружаются фоновым потоком пачками,
+поэтому цикл мониторинга не ждёт ответа Google и не теряет данные при перезапуске
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+JOURNAL_FILE = "sheets_export_queue.jsonl"
+# Задания, которые так и не удалось выгрузить (или выгружать некуда)
+DEAD_LETTER_FILE = "sheets_export_dead.jsonl"
+
+KIND_NEW_PRODUCTS = "new_products"
+KIND_TOP_LISTINGS = "top_listings"
+
+# Пауза перед выгрузкой, чтобы собрать в одну пачку задания, пришедшие подряд
+FLUSH_DELAY = 5
+# Максимум строк в одном вызове Google Sheets
+MAX_BATCH_ROWS = 500
+# Повтор при ошибке: 10с, 20с, 40с ... но не реже, чем раз в 10 минут
+RETRY_BASE_DELAY = 10
+RETRY_MAX_DELAY = 600
+# После стольких неудачных попыток задание переносится в DEAD_LETTER_FILE
+MAX_ATTEMPTS = 8
+
+# Результат выгрузки пачки
+EXPORT_OK = "ok"
+EXPORT_RETRY = "retry"    # временная ошибка - повторить позже
+EXPORT_DROP = "drop"      # повтор бессмысленен (Google Sheets не настроен и т.п.)
+
+
+class SheetsExportQueue:
+    """Журнал заданий выгрузки и фоновый поток, который их отправляет.
+
+    Задания с одной целью (тип, таблица, лист) объединяются: строки с одинаковым ключом
+    (listing_id) схлопываются, последняя версия побеждает. Задание удаляется из журнала
+    только после успешной выгрузки. Backoff ведётся отдельно для каждой цели, поэтому
+    сломанный лист не задерживает остальные; после MAX_ATTEMPTS неудач задание уходит
+    в DEAD_LETTER_FILE.
+    """
+
+    def __init__(self, directory: str, config):
+        self.config = config
+        self.journal_path = os.path.join(directory, JOURNAL_FILE)
+        self.dead_letter_path = os.path.join(directory, DEAD_LETTER_FILE)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._entries: List[Dict] = []
+        self._in_flight: set = set()
+        # Цель -> время, раньше которого её не выгружаем (после ошибки)
+        self._retry_at: Dict[Tuple[str, str, str], float] = {}
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._entries = self._read_journal()
+        if self._entries:
+            logging.info(f"📤 В очереди выгрузки в Google Sheets {len(self._entries)} заданий с прошлого запуска")
+            self._ensure_worker()
+
+    def _read_journal(self) -> List[Dict]:
+        entries = []
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # Недописанная строка после аварийного завершения
+                        logging.warning("⚠️ Пропущена повреждённая запись журнала выгрузки")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.error(f"❌ Не удалось прочитать журнал выгрузки {self.journal_path}: {e}")
+        return entries
+
+    def _rewrite_journal(self):
+        """Перезаписывает журнал оставшимися заданиями (вызывается под блокировкой)"""
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in self._entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def enqueue(self, kind: str, spreadsheet_id: str, sheet_name: str, rows: Dict, extra: Optional[Dict] = None):
+        """Добавляет задание: rows - строки по ключу (listing_id), extra - доп. данные (карта магазинов и т.п.)"""
+        if not rows:
+            return
+
+        entry = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "spreadsheet_id": spreadsheet_id,
+            "sheet_name": sheet_name,
+            "rows": rows,
+            "extra": extra or {},
+            "attempts": 0,
+            "created_at": time.time()
+        }
+
+        with self._lock:
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._entries.append(entry)
+            self._wakeup.notify_all()
+
+        self._ensure_worker()
+        logging.info(f"📤 В очередь выгрузки в Google Sheets добавлено {len(rows)} строк ({kind})")
+
+    def enqueue_new_products(self, spreadsheet_id: str, new_products: Dict[str, str],
+                             shop_names: Optional[Dict[str, str]] = None, sheet_name: str = "Etsy Products"):
+        self.enqueue(KIND_NEW_PRODUCTS, spreadsheet_id, sheet_name, new_products,
+                     {"shop_names": {listing_id: shop_names[listing_id]
+                                     for listing_id in new_products if shop_names and listing_id in shop_names}})
+
+    def enqueue_top_listings(self, spreadsheet_id: str, top_listings: Dict, sheet_name: str = "Top Listings"):
+        self.enqueue(KIND_TOP_LISTINGS, spreadsheet_id, sheet_name, top_listings)
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._stopped or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._run, name="sheets-export", daemon=True)
+            self._thread.start()
+
+    @staticmethod
+    def _target(entry: Dict) -> Tuple[str, str, str]:
+        return entry["kind"], entry["spreadsheet_id"], entry["sheet_name"]
+
+    def _ready_at(self, entry: Dict) -> float:
+        return self._retry_at.get(self._target(entry), 0.0)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._stopped:
+                    pending = [entry for entry in self._entries if entry["id"] not in self._in_flight]
+                    if pending:
+                        wait = min(self._ready_at(entry) for entry in pending) - time.time()
+                        if wait <= 0:
+                            break
+                        self._wakeup.wait(wait)
+                    else:
+                        self._wakeup.wait()
+                if self._stopped:
+                    return
+
+            # Даём накопиться заданиям, пришедшим следом
+            time.sleep(FLUSH_DELAY)
+            while self.flush_once() is not None:
+                pass
+
+    def _next_batch(self) -> Optional[Tuple[Tuple[str, str, str], List[Dict], Dict, Dict]]:
+        """Объединяет задания первой готовой к выгрузке цели в одну пачку (под блокировкой)"""
+        now = time.time()
+        pending = [entry for entry in self._entries
+                   if entry["id"] not in self._in_flight and self._ready_at(entry) <= now]
+        if not pending:
+            return None
+
+        target = self._target(pending[0])
+        batch, rows, extra_shops = [], {}, {}
+        for entry in pending:
+            if self._target(entry) != target:
+                continue
+            new_keys = len(set(entry["rows"]) - set(rows))
+            if batch and len(rows) + new_keys > MAX_BATCH_ROWS:
+                break
+            batch.append(entry)
+            rows.update(entry["rows"])
+            extra_shops.update(entry.get("extra", {}).get("shop_names", {}))
+
+        for entry in batch:
+            self._in_flight.add(entry["id"])
+        return target, batch, rows, extra_shops
+
+    def flush_once(self) -> Optional[str]:
+        """Выгружает одну готовую пачку. Возвращает результат (EXPORT_*) или None, если выгружать нечего"""
+        with self._lock:
+            batch_data = self._next_batch()
+        if batch_data is None:
+            return None
+
+        target, batch, rows, shop_names = batch_data
+        batch_ids = {entry["id"] for entry in batch}
+        result = EXPORT_RETRY
+        try:
+            result = self._export(*target, rows, shop_names)
+        except Exception as e:
+            logging.error(f"❌ Ошибка выгрузки в Google Sheets: {e}")
+
+        with self._lock:
+            self._in_flight -= batch_ids
+            dead = []
+            if result == EXPORT_OK:
+                self._retry_at.pop(target, None)
+            elif result == EXPORT_DROP:
+                dead = batch
+            else:
+                for entry in batch:
+                    entry["attempts"] = entry.get("attempts", 0) + 1
+                dead = [entry for entry in batch if entry["attempts"] >= MAX_ATTEMPTS]
+                failures = max(entry["attempts"] for entry in batch)
+                delay = min(RETRY_BASE_DELAY * 2 ** (failures - 1), RETRY_MAX_DELAY)
+                self._retry_at[target] = time.time() + delay
+                logging.warning(f"⚠️ Выгрузка в Google Sheets не удалась ({target[0]} -> '{target[2]}', "
+                                f"{len(rows)} строк), повтор через {delay} с")
+
+            if dead:
+                self._move_to_dead_letter(dead)
+            if result == EXPORT_OK:
+                self._entries = [entry for entry in self._entries if entry["id"] not in batch_ids]
+            try:
+                self._rewrite_journal()
+            except Exception as e:
+                logging.error(f"❌ Не удалось обновить журнал выгрузки: {e}")
+        return result
+
+    def _move_to_dead_letter(self, entries: List[Dict]):
+        """Переносит задания из очереди в DEAD_LETTER_FILE (вызывается под блокировкой)"""
+        dead_ids = {entry["id"] for entry in entries}
+        try:
+            with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except Exception as e:
+            logging.error(f"❌ Не удалось записать {self.dead_letter_path}: {e}")
+        self._entries = [entry for entry in self._entries if entry["id"] not in dead_ids]
+        rows = sum(len(entry["rows"]) for entry in entries)
+        logging.error(f"❌ Выгрузка в Google Sheets отменена для {len(entries)} заданий ({rows} строк), "
+                      f"сохранены в {self.dead_letter_path}")
+
+    def _export(self, kind: str, spreadsheet_id: str, sheet_name: str, rows: Dict, shop_names: Dict) -> str:
+        # Google Sheets не настроен - повторять бессмысленно
+        if not getattr(self.config, 'google_sheets_enabled', False) or not spreadsheet_id:
+            return EXPORT_DROP
+        credentials_file = getattr(self.config, 'google_sheets_credentials', None) or "credentials.json"
+        if not os.path.exists(credentials_file):
+            logging.error(f"❌ Файл credentials не найден: {credentials_file}")
+            return EXPORT_DROP
+
+        from services.google_sheets_service import get_google_sheets_service
+        sheets_service = get_google_sheets_service(self.config)
+        # Аутентификация не прошла (сеть, Google недоступен) - попробуем позже
+        if not sheets_service.enabled:
+            return EXPORT_RETRY
+
+        if kind == KIND_NEW_PRODUCTS:
+            success = sheets_service.add_new_products_to_sheets(spreadsheet_id, rows, sheet_name, shop_names=shop_names)
+        elif kind == KIND_TOP_LISTINGS:
+            success = sheets_service.add_top_listings_to_sheets(spreadsheet_id, rows, sheet_name)
+        else:
+            logging.error(f"❌ Неизвестный тип задания выгрузки: {kind}")
+            return EXPORT_DROP
+        return EXPORT_OK if success else EXPORT_RETRY
+
+    def flush(self, timeout: float = 60) -> bool:
+        """Синхронно выгружает все готовые задания (для скриптов и остановки). True - очередь пуста.
+        Цели, ожидающие повтора после ошибки, пропускаются - они останутся в журнале"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.flush_once() is None:
+                break
+        remaining = len(self)
+        if remaining:
+            logging.warning(f"⚠️ В очереди выгрузки в Google Sheets осталось {remaining} заданий, "
+                            f"они будут отправлены при следующем запуске")
+        return remaining == 0
+
+    def stop(self):
+        """Останавливает фоновый поток. Невыгруженные задания остаются в журнале"""
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify_all()
+
+
+_queues: Dict[str, SheetsExportQueue] = {}
+_queues_lock = threading.Lock()
+
+
+def get_sheets_export_queue(config) -> SheetsExportQueue:
+    """Возвращает общую на процесс очередь выгрузки (журнал в config.output_dir)"""
+    key = os.path.abspath(config.output_dir)
+    with _queues_lock:
+        queue = _queues.get(key)
+        if queue is None:
+            queue = SheetsExportQueue(config.output_dir, config)
+            _queues[key] = queue
+        return queue
+
+
+def flush_sheets_exports(timeout: float = 30) -> bool:
+    """Синхронно выгружает задания всех очередей (перед завершением процесса или остановкой бота).
+    Фоновые потоки не останавливаются, поэтому после перезапуска планировщика очередь работает дальше.
+    True - все очереди пусты"""
+    with _queues_lock:
+        queues = list(_queues.values())
+
+    flushed = True
+    for queue in queues:
+        flushed = queue.flush(timeout) and flushed
+    return flushed
@@ -0,0 +1,55 @@
+"""
+Расчёт изменений между снимками статистики листингов
+Пары снимков берутся из ListingStore.load_latest_snapshot_pairs (один запрос), сравнение - один проход
+"""
+from typing import Dict, List, Sequence
+
+# Числовые поля, изменения которых попадают в отчёт (в порядке вывода)
+NUMERIC_FIELDS = [
+    "est_total_sales", "est_mo_sales", "listing_age_in_months",
+    "est_reviews", "est_reviews_in_months", "views", "num_favorers"
+]
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and value == value  # NaN не считается числом
+
+
+def _field_change(old_stats: Dict, new_stats: Dict, field: str):
+    """(old, new, diff) для изменившегося поля или None (отсутствующее поле = 0, нечисловые значения пропускаются)"""
+    old_val = old_stats.get(field, 0)
+    new_val = new_stats.get(field, 0)
+    if not (_is_number(old_val) and _is_number(new_val)):
+        return None
+    diff = new_val - old_val
+    if diff == 0 or diff != diff:
+        return None
+    return old_val, new_val, diff
+
+
+def diff_snapshot_pair(old_stats: Dict, new_stats: Dict) -> Dict:
+    """Изменения между двумя снимками: {field: {"old": ..., "new": ..., "diff": ...}} (пустой, если изменений нет)"""
+    changes = {}
+    for field in NUMERIC_FIELDS:
+        change = _field_change(old_stats, new_stats, field)
+        if change:
+            old_val, new_val, diff = change
+            changes[field] = {"old": old_val, "new": new_val, "diff": diff}
+
+    change = _field_change(old_stats, new_stats, "conversion_rate")
+    if change:
+        old_val, new_val, diff = change
+        changes["conversion_rate"] = {"old": old_val, "new": new_val, "diff": round(diff, 2)}
+
+    return changes
+
+
+def diff_snapshots(old_snapshots: Sequence[Dict], new_snapshots: Sequence[Dict]) -> List[Dict]:
+    """Сравнивает пары снимков (old_snapshots[i], new_snapshots[i]).
+
+    Возвращает для каждой пары словарь изменений в формате diff_snapshot_pair.
+    Значения old/new берутся из исходных снимков, поэтому типы (int/float) сохраняются.
+    """
+    if len(old_snapshots) != len(new_snapshots):
+        raise ValueError("Количество старых и новых снимков должно совпадать")
+    return [diff_snapshot_pair(old_stats, new_stats) for old_stats, new_stats in zip(old_snapshots, new_snapshots)]
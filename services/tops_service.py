@@ -2,65 +2,32 @@
 Сервис для работы с топ товарами
 """
 import os
-import json
 import logging
 from datetime import datetime
 from typing import Dict, List, Tuple, Optional, Callable
 from utils.everbee_client import EverBeeClient
+from services.listing_store import get_listing_store, get_snapshot_index, SNAPSHOT_KEY_FORMAT
 
 
 class TopsService:
     """Сервис для анализа и сохранения топ товаров"""
     
-    def __init__(self, tops_dir: str = "output/tops"):
+    def __init__(self, tops_dir: str = "output/tops", everbee_client: Optional[EverBeeClient] = None):
         self.tops_dir = tops_dir
-        self.everbee_client = EverBeeClient()
-        self.listings_file = os.path.join(self.tops_dir, "new_perspective_listings.json")
-        self.top_listings_file = os.path.join(self.tops_dir, "top-listings.json")
+        self.everbee_client = everbee_client or EverBeeClient()
         self.notifier: Optional[Callable[[Dict], None]] = None
         os.makedirs(self.tops_dir, exist_ok=True)
+        # Перспективные листинги и топы хранятся в SQLite (tops/listings.db)
+        self.store = get_listing_store(self.tops_dir)
     
     def _load_existing_listings(self) -> Dict:
         """Загружает существующие данные листингов"""
-        if os.path.exists(self.listings_file):
-            try:
-                with open(self.listings_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                logging.error(f"Ошибка загрузки существующих данных: {e}")
-        
-        return {"listings": {}}
-    
-    def _save_listings(self, data: Dict):
-        """Сохраняет данные листингов"""
-        try:
-            with open(self.listings_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            logging.info(f"Данные сохранены: {self.listings_file}")
-        except Exception as e:
-            logging.error(f"Ошибка сохранения данных: {e}")
+        return self.store.load_listings()
 
     # ===== Вспомогательные методы для топов/архива =====
     def _load_top_listings(self) -> Dict:
         """Загружает топ-листинги"""
-        if os.path.exists(self.top_listings_file):
-            try:
-                with open(self.top_listings_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                logging.error(f"Ошибка загрузки топ-листингов: {e}")
-        return {"listings": {}}
-
-    def _save_top_listings(self, data: Dict):
-        """Сохраняет топ-листинги"""
-        try:
-            with open(self.top_listings_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            logging.info(f"Топ-листинги сохранены: {self.top_listings_file}")
-        except Exception as e:
-            logging.error(f"Ошибка сохранения топ-листингов: {e}")
-
-
+        return self.store.load_tops()
 
     def set_notifier(self, notifier: Callable[[Dict], None]):
         """Устанавливает колбэк для уведомлений о топах"""
@@ -70,19 +37,23 @@ class TopsService:
         """Проверяет возраст листингов и находит потенциальные топы"""
         potential_tops = []
         try:
-            current_dt = datetime.strptime(current_date, "%d.%m.%Y_%H.%M")
-            top_json = self._load_top_listings()
+            current_dt = datetime.strptime(current_date, SNAPSHOT_KEY_FORMAT)
+            index = get_snapshot_index(data)
+            new_tops = {}
             
             for listing_id, snapshots in data.get("listings", {}).items():
                 if not snapshots:
                     continue
                 
-                timestamps = sorted(snapshots.keys(), key=lambda x: datetime.strptime(x, "%d.%m.%Y_%H.%M"))
-                first_ts = timestamps[0]
-                last_ts = timestamps[-1]
+                # Индекс уже отсортирован по времени: первый и последний снимки за O(1)
+                timeline = index.get(listing_id)
+                if not timeline:
+                    continue
+                first_epoch, first_ts = timeline[0]
+                last_ts = timeline[-1][1]
                 
                 try:
-                    first_dt = datetime.strptime(first_ts, "%d.%m.%Y_%H.%M")
+                    first_dt = datetime.fromtimestamp(first_epoch)
                     
                     # Вычисляем разницу в месяцах и днях
                     months_diff = (current_dt.year - first_dt.year) * 12 + (current_dt.month - first_dt.month)
@@ -142,8 +113,7 @@ class TopsService:
                                 "days_observed": days_diff
                             }
                             
-                            top_json.setdefault("listings", {})
-                            top_json["listings"][listing_id] = summary
+                            new_tops[listing_id] = summary
                             potential_tops.append(listing_id)
                             
                             print(
@@ -156,14 +126,13 @@ class TopsService:
             
             # Сохраняем топы и удаляем их из перспективных
             if potential_tops:
-                self._save_top_listings(top_json)
-                # Удаляем топы из перспективных листингов
+                # Одной транзакцией сохраняем топы и удаляем их из перспективных
+                self.store.promote_to_tops(new_tops)
                 for lid in potential_tops:
                     data["listings"].pop(lid, None)
-                self._save_listings(data)
                 
-                # Отправляем топы в Google Sheets
-                self._send_tops_to_sheets(top_json["listings"])
+                # Отправляем в Google Sheets только новые топы (остальные там уже есть)
+                self._send_tops_to_sheets(new_tops)
                     
         except Exception as e:
             logging.error(f"Ошибка проверки возраста листингов: {e}")
@@ -171,10 +140,13 @@ class TopsService:
         return potential_tops
     
     def _send_tops_to_sheets(self, top_listings: Dict):
-        """Отправляет топ-листинги в Google Sheets"""
+        """Ставит топ-листинги в очередь выгрузки в Google Sheets (выгрузка идёт в фоне)"""
         try:
             from config.settings import config
-            from services.google_sheets_service import GoogleSheetsService
+            from services.sheets_export_queue import get_sheets_export_queue
+            
+            if not config.google_sheets_enabled:
+                return
             
             spreadsheet_id = config.google_sheets_spreadsheet_id
             
@@ -182,8 +154,7 @@ class TopsService:
                 logging.warning("Не указан google_sheets_spreadsheet_id в конфиге")
                 return
             
-            sheets_service = GoogleSheetsService(config)
-            sheets_service.add_top_listings_to_sheets(spreadsheet_id, top_listings)
+            get_sheets_export_queue(config).enqueue_top_listings(spreadsheet_id, top_listings)
             
         except Exception as e:
             logging.error(f"Ошибка отправки топов в Google Sheets: {e}")
@@ -205,23 +176,11 @@ class TopsService:
         
 
     def cleanup_perspective_from_tops(self) -> int:
-        """Удаляет из new_perspective_listings.json листинги, которые уже есть в топах.
+        """Удаляет из перспективных листингов те, что уже есть в топах.
         Возвращает количество удаленных.
         """
-        data = self._load_existing_listings()
-        tops = self._load_top_listings()
-        perspective = data.get("listings", {})
-        top_ids = set(tops.get("listings", {}).keys())
-        if not perspective or not top_ids:
-            return 0
-        removed = 0
-        for lid in list(perspective.keys()):
-            if lid in top_ids:
-                perspective.pop(lid, None)
-                removed += 1
+        removed = self.store.remove_listings_in_tops()
         if removed:
-            data["listings"] = perspective
-            self._save_listings(data)
             logging.info(f"Очистка перспективных: удалено {removed} уже-топ листингов")
             print(f"🧹 Очистка: удалено {removed} листингов, уже попавших в топ")
         return removed
@@ -236,22 +195,22 @@ class TopsService:
         logging.info(f"Анализ {len(new_products)} новых листингов через EverBee...")
         
         # Исключаем уже зафиксированные топ-листинги из анализа
-        top_existing = set(self._load_top_listings().get("listings", {}).keys())
+        top_existing = self.store.get_top_ids()
         listing_ids = [lid for lid in new_products.keys() if lid not in top_existing]
+        if not listing_ids:
+            print("Все новые товары уже в топе - анализ не нужен")
+            return {}
+
+        raw_listings = self.everbee_client.get_listings_stats(listing_ids)
         
-        response = self.everbee_client.get_listings_batch(listing_ids)
-        
-        if not response or "results" not in response:
+        if not raw_listings:
             print("❌ Не удалось получить данные от EverBee")
             logging.error("Не удалось получить данные от EverBee")
             return {}
         
         results = {}
-        for listing in response.get("results", []):
-            listing_id = str(listing.get("listing_id"))
-            if listing_id:
-                extracted_data = self.everbee_client.extract_listing_data(listing)
-                results[listing_id] = extracted_data
+        for listing_id, listing in raw_listings.items():
+            results[listing_id] = self.everbee_client.extract_listing_data(listing)
         
         print(f"✅ Получено данных для {len(results)} листингов от EverBee")
         logging.info(f"Получено данных для {len(results)} листингов")
@@ -259,33 +218,23 @@ class TopsService:
     
     def update_listings_data(self, new_listings_data: Dict[str, Dict], checked_date: str):
         """Обновляет данные листингов с новой датой проверки"""
-        existing_data = self._load_existing_listings()
-        top_ids = set(self._load_top_listings().get("listings", {}).keys())
+        top_ids = self.store.get_top_ids()
 
-        saved_count = 0
-        skipped_top = 0
-        
-        for listing_id, listing_data in new_listings_data.items():
-            # Пропускаем уже попавшие в топ
-            if listing_id in top_ids:
-                skipped_top += 1
-                continue
-            if listing_id not in existing_data["listings"]:
-                existing_data["listings"][listing_id] = {}
-            existing_data["listings"][listing_id][checked_date] = listing_data
-            saved_count += 1
+        # Пропускаем уже попавшие в топ
+        to_save = {
+            listing_id: listing_data
+            for listing_id, listing_data in new_listings_data.items()
+            if listing_id not in top_ids
+        }
+        saved_count = len(to_save)
+        skipped_top = len(new_listings_data) - saved_count
         
-        self._save_listings(existing_data)
+        self.store.add_snapshots(checked_date, to_save)
         
-        # Проверяем листинги старше 1 дня и находим топы
+        # Проверяем листинги старше 1 дня и находим топы (новые топы удаляются из перспективных)
+        existing_data = self._load_existing_listings()
         potential_tops = self._check_listings_age(existing_data, checked_date)
         
-        # Удаляем новые топы из перспективных
-        if potential_tops:
-            for lid in potential_tops:
-                existing_data["listings"].pop(lid, None)
-            self._save_listings(existing_data)
-        
         logging.info(f"Обновлено {saved_count} листингов с датой {checked_date} (пропущено как топ: {skipped_top})")
         print(f"💎 Сохранено {saved_count} перспективных листингов в tops/ (пропущено как топ: {skipped_top})")
         
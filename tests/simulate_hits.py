@@ -1,6 +1,5 @@
 import sys
 import os
-import json
 import random
 import logging
 from datetime import datetime, timedelta
@@ -9,6 +8,7 @@ from datetime import datetime, timedelta
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from services.tops_service import TopsService
+from services.sheets_export_queue import flush_sheets_exports
 from config.settings import config
 
 # Setup logging
@@ -17,15 +17,8 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 def simulate_hits():
     print("🚀 Starting simulation of hits...")
     
-    tops_service = TopsService()
-    listings_file = os.path.join(config.output_dir, "tops", "new_perspective_listings.json")
-    
-    if not os.path.exists(listings_file):
-        print(f"❌ File not found: {listings_file}")
-        return
-
-    with open(listings_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    tops_service = TopsService(os.path.join(config.output_dir, "tops"))
+    data = tops_service._load_existing_listings()
     
     listings = data.get("listings", {})
     
@@ -107,6 +100,8 @@ def simulate_hits():
     # Run the check
     # Note: This will call _send_tops_to_sheets internally if hits are found
     potential_tops = tops_service._check_listings_age(modified_data, future_date_str)
+    # Топы выгружаются фоновой очередью - дожидаемся отправки перед выходом
+    flush_sheets_exports()
     
     print(f"\n✅ Simulation complete.")
     print(f"🔥 Found {len(potential_tops)} potential tops (should match selected count).")
@@ -0,0 +1,67 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("requests")
+pytest.importorskip("selenium")
+
+from utils.everbee_client import EverBeeClient
+
+
+class FakeFetch:
+    """Подменяет запрос к EverBee: первые fail_times вызовов падают (None)"""
+
+    def __init__(self, fail_times=0):
+        self.fail_times = fail_times
+        self.calls = []
+
+    def __call__(self, listing_ids):
+        self.calls.append(list(listing_ids))
+        if len(self.calls) <= self.fail_times:
+            return None
+        return [{"listing_id": listing_id, "views": 1} for listing_id in listing_ids]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    client = EverBeeClient(config_path=str(tmp_path / "config-main.txt"), session=object())
+    client.batch_chunk_size = 3
+    client.batch_max_workers = 1
+    client.batch_chunk_retries = 2
+    client.backoff_base = 0
+    client.backoff_max = 0
+    monkeypatch.setattr("utils.everbee_client.time.sleep", lambda seconds: None)
+    return client
+
+
+def test_cache_hit_does_not_hide_failed_fetch(client):
+    client.stats_cache.put_many([{"listing_id": "1"}])
+    client._fetch_listings_batch = FakeFetch(fail_times=1)
+
+    assert client.get_listings_batch(["1", "2"]) is None
+
+
+def test_partly_cached_chunk_is_retried_after_failed_fetch(client):
+    client.stats_cache.put_many([{"listing_id": "1"}, {"listing_id": "4"}])
+    fetch = FakeFetch(fail_times=1)
+    client._fetch_listings_batch = fetch
+
+    results = client.get_listings_stats(["1", "2", "3", "4", "5"])
+
+    assert sorted(results) == ["1", "2", "3", "4", "5"]
+    # Из кэша берутся только уже полученные ID, повторяется лишь упавший пакет
+    assert fetch.calls == [["2", "3"], ["5"], ["2", "3"]]
+
+
+def test_fully_cached_chunk_skips_request(client):
+    client.stats_cache.put_many([{"listing_id": "1"}, {"listing_id": "2"}])
+    fetch = FakeFetch()
+    client._fetch_listings_batch = fetch
+
+    assert client.get_listings_batch(["1", "2"]) == {
+        "results": [{"listing_id": "1"}, {"listing_id": "2"}],
+    }
+    assert fetch.calls == []
@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.listing_store import ListingStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ListingStore(str(tmp_path))
+    yield store
+    store.close()
+
+
+def test_intermediate_snapshots_keep_first_and_last(store):
+    for key in ("01.03.2025_10.00", "02.03.2025_10.00", "03.03.2025_10.00"):
+        store.add_snapshots(key, {"1": {"views": key}})
+
+    assert store.delete_intermediate_snapshots() == 1
+    assert sorted(store.get_listing_snapshots("1")) == ["01.03.2025_10.00", "03.03.2025_10.00"]
+
+
+def test_unparseable_snapshot_key_does_not_displace_first_snapshot(store):
+    store.add_snapshots("broken", {"1": {"views": 0}})
+    for key in ("01.03.2025_10.00", "02.03.2025_10.00", "03.03.2025_10.00"):
+        store.add_snapshots(key, {"1": {"views": key}})
+
+    assert store.delete_intermediate_snapshots() == 1
+    assert sorted(store.get_listing_snapshots("1")) == ["01.03.2025_10.00", "03.03.2025_10.00", "broken"]
+
+    pairs = store.load_latest_snapshot_pairs()
+    assert [(listing_id, prev_key, last_key) for listing_id, prev_key, _, last_key, _ in pairs] == [
+        ("1", "01.03.2025_10.00", "03.03.2025_10.00"),
+    ]
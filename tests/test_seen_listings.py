@@ -0,0 +1,98 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+
+from services import seen_listings
+from services.seen_listings import SeenListingIndex
+from services.data_service import DataService
+
+
+class Config:
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+
+
+@pytest.fixture
+def data_service(tmp_path, monkeypatch):
+    # Отдельный реестр индексов на тест: папка результатов у каждого теста своя
+    monkeypatch.setattr(seen_listings, "_indexes", {})
+    return DataService(Config(str(tmp_path)))
+
+
+def test_first_run_treats_everything_as_new(data_service):
+    current = {
+        "ShopA": {"1": "u1", "2": "u2"},
+        "ShopB": {"3": "u3"},
+    }
+
+    assert data_service.compare_all_shops_results(current) == {"1": "u1", "2": "u2", "3": "u3"}
+    assert data_service.compare_all_shops_results(current) == {}
+
+
+def test_only_unseen_listings_of_known_shops_are_new(data_service):
+    data_service.compare_all_shops_results({"ShopA": {"1": "u1", "2": "u2"}})
+
+    new_products = data_service.compare_all_shops_results({
+        "ShopA": {"1": "u1", "2": "u2", "5": "u5"},
+    })
+
+    assert new_products == {"5": "u5"}
+
+
+def test_new_shop_is_skipped_but_remembered(data_service):
+    data_service.compare_all_shops_results({"ShopA": {"1": "u1"}})
+
+    # Первое появление магазина - его товары не считаются новыми
+    assert data_service.compare_all_shops_results({
+        "ShopA": {"1": "u1"},
+        "ShopB": {"10": "u10", "11": "u11"},
+    }) == {}
+
+    assert data_service.compare_all_shops_results({
+        "ShopB": {"10": "u10", "11": "u11", "12": "u12"},
+    }) == {"12": "u12"}
+
+
+def test_listing_moved_between_shops_is_not_new(data_service):
+    data_service.compare_all_shops_results({"ShopA": {"1": "u1"}, "ShopB": {"2": "u2"}})
+
+    assert data_service.compare_all_shops_results({"ShopB": {"1": "u1", "2": "u2"}}) == {}
+
+
+def test_non_numeric_ids_are_new_only_once(data_service):
+    data_service.compare_all_shops_results({"ShopA": {"1": "u1"}})
+
+    assert data_service.compare_all_shops_results({
+        "ShopA": {"1": "u1", "abc": "u-abc", "7": "u7"},
+    }) == {"abc": "u-abc", "7": "u7"}
+    assert data_service.compare_all_shops_results({
+        "ShopA": {"1": "u1", "abc": "u-abc", "7": "u7"},
+    }) == {}
+
+
+def test_index_is_reloaded_from_disk(tmp_path):
+    index = SeenListingIndex(str(tmp_path))
+    index.add({"ShopA": ["3", "1", "abc"], "ShopB": ["2"]})
+
+    reloaded = SeenListingIndex(str(tmp_path))
+
+    assert len(reloaded) == 4
+    assert reloaded.has_shop("ShopA") and reloaded.has_shop("ShopB")
+    assert not reloaded.has_shop("ShopC")
+    assert reloaded.filter_unseen(["1", "2", "3", "4"]) == ["4"]
+    assert reloaded.filter_unseen(["abc", "xyz", "1"]) == ["xyz"]
+
+
+def test_index_with_only_shops_is_reloaded_from_disk(tmp_path):
+    SeenListingIndex(str(tmp_path)).add({"ShopA": []})
+
+    reloaded = SeenListingIndex(str(tmp_path))
+
+    assert not reloaded.is_empty()
+    assert reloaded.has_shop("ShopA")
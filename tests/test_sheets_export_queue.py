@@ -0,0 +1,132 @@
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import sheets_export_queue as export_queue
+from services.sheets_export_queue import SheetsExportQueue, EXPORT_OK, EXPORT_RETRY, EXPORT_DROP
+
+
+class Config:
+    google_sheets_enabled = True
+    google_sheets_credentials = "credentials.json"
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+
+
+class FakeExport:
+    """Подменяет выгрузку: запоминает пачки, для целей из failing возвращает EXPORT_RETRY"""
+
+    def __init__(self):
+        self.calls = []
+        self.failing = set()
+
+    def __call__(self, kind, spreadsheet_id, sheet_name, rows, shop_names):
+        self.calls.append((kind, sheet_name, dict(rows), dict(shop_names)))
+        return EXPORT_RETRY if sheet_name in self.failing else EXPORT_OK
+
+
+@pytest.fixture
+def make_queue(tmp_path, monkeypatch):
+    # Без фонового потока: выгрузка вызывается из теста через flush_once/flush
+    monkeypatch.setattr(SheetsExportQueue, "_ensure_worker", lambda self: None)
+
+    def factory():
+        queue = SheetsExportQueue(str(tmp_path), Config(str(tmp_path)))
+        exporter = FakeExport()
+        queue._export = exporter
+        return queue, exporter
+
+    return factory
+
+
+def test_jobs_for_same_target_are_coalesced(make_queue):
+    queue, exporter = make_queue()
+    queue.enqueue_new_products("sheet-id", {"1": "u1", "2": "u2"}, {"1": "a", "2": "b", "9": "x"})
+    queue.enqueue_new_products("sheet-id", {"2": "u2-new", "3": "u3"}, {"3": "c"})
+    queue.enqueue_top_listings("sheet-id", {"7": {"url": "t7"}})
+
+    assert queue.flush()
+
+    assert exporter.calls == [
+        ("new_products", "Etsy Products", {"1": "u1", "2": "u2-new", "3": "u3"}, {"1": "a", "2": "b", "3": "c"}),
+        ("top_listings", "Top Listings", {"7": {"url": "t7"}}, {}),
+    ]
+    assert len(queue) == 0
+
+
+def test_failing_target_backs_off_without_blocking_others(make_queue):
+    queue, exporter = make_queue()
+    exporter.failing.add("Etsy Products")
+    queue.enqueue_new_products("sheet-id", {"1": "u1"})
+    queue.enqueue_top_listings("sheet-id", {"7": {"url": "t7"}})
+
+    assert queue.flush_once() == EXPORT_RETRY
+    assert queue.flush_once() == EXPORT_OK
+    # Упавшая цель ждёт своего времени повтора
+    assert queue.flush_once() is None
+    assert len(queue) == 1
+
+    target = ("new_products", "sheet-id", "Etsy Products")
+    assert queue._retry_at[target] > 0
+    first_delay = queue._retry_at[target]
+
+    queue._retry_at[target] = 0
+    assert queue.flush_once() == EXPORT_RETRY
+    # Второй неудаче соответствует вдвое большая задержка
+    assert queue._retry_at[target] - first_delay >= export_queue.RETRY_BASE_DELAY - 1
+
+
+def test_job_goes_to_dead_letter_after_max_attempts(make_queue, monkeypatch):
+    monkeypatch.setattr(export_queue, "MAX_ATTEMPTS", 2)
+    queue, exporter = make_queue()
+    exporter.failing.add("Etsy Products")
+    queue.enqueue_new_products("sheet-id", {"1": "u1"})
+
+    for _ in range(2):
+        queue._retry_at.clear()
+        queue.flush_once()
+
+    assert len(queue) == 0
+    with open(queue.dead_letter_path, encoding="utf-8") as f:
+        dead = [json.loads(line) for line in f]
+    assert [entry["rows"] for entry in dead] == [{"1": "u1"}]
+    assert dead[0]["attempts"] == 2
+
+
+def test_disabled_sheets_drop_jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(SheetsExportQueue, "_ensure_worker", lambda self: None)
+    config = Config(str(tmp_path))
+    config.google_sheets_enabled = False
+    queue = SheetsExportQueue(str(tmp_path), config)
+    queue.enqueue_top_listings("sheet-id", {"7": {"url": "t7"}})
+
+    assert queue.flush_once() == EXPORT_DROP
+    assert len(queue) == 0
+    assert os.path.exists(queue.dead_letter_path)
+
+
+def test_pending_jobs_survive_restart(make_queue):
+    queue, exporter = make_queue()
+    exporter.failing.add("Etsy Products")
+    queue.enqueue_new_products("sheet-id", {"1": "u1"}, {"1": "a"})
+    queue.enqueue_top_listings("sheet-id", {"7": {"url": "t7"}})
+    queue.flush()
+    assert len(queue) == 1
+
+    # Недописанная строка после аварийного завершения игнорируется
+    with open(queue.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"id": "broken"')
+
+    restarted, restarted_exporter = make_queue()
+    assert len(restarted) == 1
+    assert restarted.flush()
+    assert restarted_exporter.calls == [
+        ("new_products", "Etsy Products", {"1": "u1"}, {"1": "a"}),
+    ]
+    with open(restarted.journal_path, encoding="utf-8") as f:
+        assert f.read() == ""
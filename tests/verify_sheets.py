@@ -1,6 +1,5 @@
 import sys
 import os
-import json
 import logging
 
 # Add project root to path
@@ -8,6 +7,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from services.tops_service import TopsService
 from services.google_sheets_service import GoogleSheetsService
+from services.listing_store import get_listing_store
 from config.settings import config
 
 # Setup logging
@@ -16,17 +16,10 @@ logging.basicConfig(level=logging.INFO)
 def test_export():
     print("🚀 Testing Google Sheets export...")
     
-    tops_file = os.path.join(config.output_dir, "tops", "top-listings.json")
-    if not os.path.exists(tops_file):
-        print(f"❌ File not found: {tops_file}")
-        return
-
-    with open(tops_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    listings = data.get("listings", {})
+    store = get_listing_store(os.path.join(config.output_dir, "tops"))
+    listings = store.load_tops().get("listings", {})
     if not listings:
-        print("❌ No listings found in top-listings.json")
+        print(f"❌ No top listings found in {store.db_path}")
         return
     
     print(f"📋 Found {len(listings)} top listings. Sending to Sheets...")
@@ -118,6 +118,8 @@ class ConfigLoader:
                 for key, value in existing_data.items():
                     f.write(f"{key}={value}\n")
             
+            from config.settings import invalidate_config_cache
+            invalidate_config_cache(str(config_path))
             logger.info(f"Конфигурация обновлена в {config_path}")
             self.reload()
             
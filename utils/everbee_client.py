@@ -1,9 +1,14 @@
 """
 EverBee API клиент для получения аналитики по листингам
 """
+import os
 import json
+import time
+import base64
 import logging
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Dict, List
 from selenium import webdriver  # Обычный Selenium БЕЗ wire
 from selenium.webdriver.common.by import By
@@ -12,6 +17,55 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 from utils.driver_path import get_chromedriver_path
+from utils.http_session import get_shared_session
+from utils.rate_limiter import get_shared_limiter, backoff_delay, parse_retry_after
+from config.settings import config as app_config, read_config_file, invalidate_config_cache
+
+
+class ListingStatsCache:
+    """Потокобезопасный кэш статистики листингов EverBee (по listing_id) на один цикл.
+    
+    Кэш только экономит запросы: попадание в кэш не заменяет ответ EverBee
+    на остальные ID пакета (см. EverBeeClient.get_listings_batch).
+    """
+    
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = ttl
+        self._items: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+    
+    def get_many(self, listing_ids: List[str]) -> Dict[str, Dict]:
+        """Возвращает закэшированные (и не устаревшие) листинги из переданного списка"""
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for listing_id in listing_ids:
+                item = self._items.get(listing_id)
+                if item is None:
+                    continue
+                stored_at, listing = item
+                if self.ttl is not None and now - stored_at > self.ttl:
+                    del self._items[listing_id]
+                    continue
+                found[listing_id] = listing
+        return found
+    
+    def put_many(self, listings: List[Dict]):
+        """Сохраняет сырые данные листингов из ответа EverBee"""
+        now = time.monotonic()
+        with self._lock:
+            for listing in listings:
+                listing_id = str(listing.get('listing_id', ''))
+                if listing_id:
+                    self._items[listing_id] = (now, listing)
+    
+    def clear(self):
+        """Очищает кэш (в начале нового цикла)"""
+        with self._lock:
+            self._items.clear()
+    
+    def __len__(self) -> int:
+        return len(self._items)
 
 
 class EverBeeClient:
@@ -24,27 +78,52 @@ class EverBeeClient:
     LISTINGS_BATCH_URL = "https://api.everbee.com/etsy_apis/listing"
     SHOP_ANALYZE_URL = "https://api.everbee.com/shops/analyze_shop"
     
-    def __init__(self, config_path: str = "config-main.txt"):
+    # За сколько секунд до истечения токена запускать фоновое обновление
+    TOKEN_REFRESH_MARGIN = 600
+    
+    # Статусы, при которых запрос повторяется с backoff
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+    
+    def __init__(self, config_path: str = "config-main.txt", session: Optional[requests.Session] = None):
         self.config_path = config_path
+        # Общий пул keep-alive соединений для всех экземпляров клиента
+        everbee_config = app_config.everbee
+        self.session = session or get_shared_session("everbee", everbee_config.pool_size)
+        self.timeout = (everbee_config.connect_timeout, everbee_config.read_timeout)
+        # Общий на процесс лимит запросов к EverBee
+        self.limiter = get_shared_limiter("everbee", everbee_config.requests_per_second, everbee_config.burst)
+        self.max_retries = everbee_config.max_retries
+        self.backoff_base = everbee_config.backoff_base
+        self.backoff_max = everbee_config.backoff_max
+        # Статистика листингов, уже полученная в текущем цикле
+        self.stats_cache = ListingStatsCache(everbee_config.stats_cache_ttl)
+        self.batch_chunk_size = everbee_config.batch_chunk_size
+        self.batch_max_workers = everbee_config.batch_max_workers
+        self.batch_chunk_retries = everbee_config.batch_chunk_retries
         self.token = None
         self.username = None
         self.password = None
+        # Блокировка получения токена: при параллельном парсинге браузер авторизации запускается один раз
+        self._token_lock = threading.Lock()
+        # Кэш валидности токена: проверенный токен считается рабочим до 401 или истечения exp
+        self._token_verified = False
+        self._token_expires_at: Optional[float] = None
+        self._background_refresh: Optional[threading.Thread] = None
+        self._refresh_state_lock = threading.Lock()
+        self._next_background_refresh_at = 0.0
         self._load_config()
+        self._token_expires_at = self._decode_token_expiry(self.token)
     
     def _load_config(self):
-        """Загружает конфигурацию из файла"""
-        try:
-            with open(self.config_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line.startswith('EVERBEE_TOKEN='):
-                        self.token = line.replace('EVERBEE_TOKEN=', '')
-                    elif line.startswith('EVERBEE_USERNAME='):
-                        self.username = line.replace('EVERBEE_USERNAME=', '')
-                    elif line.startswith('EVERBEE_PASSWORD='):
-                        self.password = line.replace('EVERBEE_PASSWORD=', '')
-        except FileNotFoundError:
+        """Загружает конфигурацию из файла (через общий кэш read_config_file)"""
+        config_data = read_config_file(self.config_path)
+        if not config_data and not os.path.exists(self.config_path):
             logging.warning(f"Конфиг файл {self.config_path} не найден")
+            return
+        
+        self.token = config_data.get('EVERBEE_TOKEN', self.token)
+        self.username = config_data.get('EVERBEE_USERNAME', self.username)
+        self.password = config_data.get('EVERBEE_PASSWORD', self.password)
     
     def _save_token(self, token: str):
         """Сохраняет токен в конфиг файл"""
@@ -69,11 +148,47 @@ class EverBeeClient:
                 if not token_exists:
                     f.write(f'EVERBEE_TOKEN={token}\n')
             
-            self.token = token
+            invalidate_config_cache(self.config_path)
             logging.info("Токен EverBee сохранен")
             
         except Exception as e:
             logging.error(f"Ошибка сохранения токена: {e}")
+        
+        self._set_token(token)
+    
+    def _set_token(self, token: str):
+        """Устанавливает свежеполученный токен как проверенный"""
+        self.token = token
+        self._token_verified = True
+        self._token_expires_at = self._decode_token_expiry(token)
+    
+    def invalidate_token(self, token: Optional[str] = None):
+        """Сбрасывает кэш валидности (например, после ответа 401)"""
+        if token is None or token == self.token:
+            self._token_verified = False
+    
+    @staticmethod
+    def _decode_token_expiry(token: Optional[str]) -> Optional[float]:
+        """Возвращает время истечения JWT токена (поле exp) или None, если его нельзя прочитать"""
+        if not token or token.count('.') != 2:
+            return None
+        
+        try:
+            payload = token.split('.')[1]
+            payload += '=' * (-len(payload) % 4)
+            data = json.loads(base64.urlsafe_b64decode(payload).decode('utf-8'))
+            exp = data.get('exp')
+            return float(exp) if exp else None
+        except Exception:
+            return None
+    
+    def _is_token_fresh(self) -> bool:
+        """Проверяет по кэшу, можно ли использовать токен без сетевой проверки"""
+        if not self.token:
+            return False
+        if self._token_expires_at is not None and time.time() >= self._token_expires_at:
+            return False
+        return self._token_verified
     
     def check_token_valid(self, token: Optional[str] = None) -> bool:
         """Проверяет валидность токена"""
@@ -85,7 +200,8 @@ class EverBeeClient:
         headers = {'x-access-token': check_token}
         
         try:
-            response = requests.get(self.SHOW_USER_URL, headers=headers, timeout=10)
+            self.limiter.acquire()
+            response = self.session.get(self.SHOW_USER_URL, headers=headers, timeout=self.timeout)
             is_valid = response.status_code == 200
             
             if is_valid:
@@ -262,51 +378,200 @@ class EverBeeClient:
                     logging.error(f"Ошибка закрытия драйвера: {e}")
     
     def ensure_token(self) -> bool:
-        """Проверяет токен и получает новый при необходимости"""
-        if self.token and self.check_token_valid():
+        """Проверяет токен и получает новый при необходимости.
+        
+        Сетевая проверка выполняется только для токена, который ещё не
+        проверялся; дальше он считается валидным до 401 или истечения exp.
+        """
+        if self._is_token_fresh():
+            self._schedule_background_refresh()
             return True
         
-        logging.info("Получение нового токена EverBee...")
-        new_token = self._authorize_and_get_token()
+        with self._token_lock:
+            if self._is_token_fresh():
+                return True
+            
+            token_expired = self._token_expires_at is not None and time.time() >= self._token_expires_at
+            if self.token and not token_expired and self.check_token_valid():
+                self._token_verified = True
+                return True
+            
+            logging.info("Получение нового токена EverBee...")
+            new_token = self._authorize_and_get_token()
+            
+            if new_token:
+                self._save_token(new_token)
+                return True
+            
+            return False
+    
+    def _schedule_background_refresh(self):
+        """Запускает фоновое обновление токена незадолго до истечения exp"""
+        if self._token_expires_at is None:
+            return
+        if time.time() < self._token_expires_at - self.TOKEN_REFRESH_MARGIN:
+            return
         
-        if new_token:
-            self._save_token(new_token)
-            return True
+        with self._refresh_state_lock:
+            if time.time() < self._next_background_refresh_at:
+                return
+            if self._background_refresh and self._background_refresh.is_alive():
+                return
+            # Не повторяем неудачную фоновую авторизацию чаще раза в минуту
+            self._next_background_refresh_at = time.time() + 60
+            
+            stale_token = self.token
+            
+            def refresh():
+                logging.info("Токен EverBee скоро истечёт, обновляем в фоне...")
+                self.refresh_token(stale_token, invalidate=False)
+            
+            self._background_refresh = threading.Thread(target=refresh, name="everbee-token-refresh", daemon=True)
+            self._background_refresh.start()
+    
+    def _request(self, method: str, url: str, description: str, **kwargs) -> Optional[requests.Response]:
+        """Выполняет запрос к EverBee через общий лимитер.
+        
+        401 - один раз обновляет токен и повторяет запрос.
+        429/5xx и сетевые ошибки - повторяет с экспоненциальным backoff
+        и джиттером, учитывая Retry-After; 429 также снижает общий лимит.
+        Возвращает последний ответ или None, если токен обновить не удалось.
+        """
+        token_refreshed = False
+        attempt = 0
         
-        return False
+        while True:
+            used_token = self.token
+            headers = {'x-access-token': used_token}
+            self.limiter.acquire()
+            
+            try:
+                response = self.session.request(method, url, headers=headers, timeout=self.timeout, **kwargs)
+            except requests.RequestException as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                logging.warning(f"Сетевая ошибка EverBee ({description}): {e}. Повтор через {delay:.1f} сек")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            
+            status = response.status_code
+            
+            if status == 401 and not token_refreshed:
+                logging.warning(f"Токен недействителен ({description}), получаем новый...")
+                if not self.refresh_token(used_token):
+                    logging.error("Не удалось обновить токен")
+                    return None
+                token_refreshed = True
+                continue
+            
+            if status in self.RETRY_STATUS_CODES and attempt < self.max_retries:
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                if status == 429:
+                    self.limiter.on_throttled(retry_after)
+                delay = max(retry_after or 0, backoff_delay(attempt, self.backoff_base, self.backoff_max))
+                logging.warning(f"EverBee ответил {status} ({description}). Повтор {attempt + 1}/{self.max_retries} через {delay:.1f} сек")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            
+            if status == 200:
+                self.limiter.on_success()
+            return response
+    
+    def clear_stats_cache(self):
+        """Сбрасывает кэш статистики листингов (вызывается в начале цикла)"""
+        self.stats_cache.clear()
     
     def get_listings_batch(self, listing_ids: List[str]) -> Optional[Dict]:
-        """Получает данные нескольких листингов одним запросом"""
+        """Получает данные нескольких листингов одним запросом.
+        
+        Листинги, уже полученные в текущем цикле, берутся из stats_cache,
+        в EverBee запрашиваются только недостающие. Если запрос недостающих
+        не удался, возвращает None, даже когда часть пакета есть в кэше -
+        иначе get_listings_stats не повторил бы пакет.
+        """
+        listing_ids = [str(listing_id) for listing_id in listing_ids]
+        cached = self.stats_cache.get_many(listing_ids)
+        missing_ids = [listing_id for listing_id in listing_ids if listing_id not in cached]
+        
+        if missing_ids:
+            fetched = self._fetch_listings_batch(missing_ids)
+            if fetched is None:
+                return None
+            if fetched:
+                self.stats_cache.put_many(fetched)
+                cached = self.stats_cache.get_many(listing_ids)
+            logging.info(f"EverBee: {len(listing_ids) - len(missing_ids)} листингов из кэша, {len(missing_ids)} запрошено")
+        
+        return {"results": [cached[listing_id] for listing_id in listing_ids if listing_id in cached]}
+    
+    def get_listings_stats(self, listing_ids: List[str]) -> Dict[str, Dict]:
+        """Получает данные любого количества листингов пакетами.
+        
+        ID разбиваются на пакеты по batch_chunk_size, пакеты отправляются
+        параллельно (до batch_max_workers), неудавшиеся пакеты повторяются
+        до batch_chunk_retries раз. Возвращает {listing_id: сырые данные}
+        по всем пакетам, которые удалось получить.
+        """
+        unique_ids = list(dict.fromkeys(str(listing_id) for listing_id in listing_ids))
+        if not unique_ids:
+            return {}
+        
+        chunk_size = max(1, self.batch_chunk_size)
+        pending = [unique_ids[i:i + chunk_size] for i in range(0, len(unique_ids), chunk_size)]
+        total_chunks = len(pending)
+        results: Dict[str, Dict] = {}
+        
+        for attempt in range(self.batch_chunk_retries + 1):
+            if attempt > 0:
+                delay = backoff_delay(attempt - 1, self.backoff_base, self.backoff_max)
+                logging.warning(f"Повтор {len(pending)} неудавшихся пакетов ({attempt}/{self.batch_chunk_retries}) через {delay:.1f} сек")
+                time.sleep(delay)
+            
+            workers = max(1, min(self.batch_max_workers, len(pending)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="everbee-batch") as executor:
+                responses = list(executor.map(self.get_listings_batch, pending))
+            
+            failed = []
+            for chunk, response in zip(pending, responses):
+                if not response or "results" not in response:
+                    failed.append(chunk)
+                    continue
+                for listing in response["results"]:
+                    listing_id = str(listing.get("listing_id", ""))
+                    if listing_id:
+                        results[listing_id] = listing
+            
+            pending = failed
+            if not pending:
+                break
+        
+        if pending:
+            logging.error(f"Не удалось получить {len(pending)} из {total_chunks} пакетов листингов EverBee")
+        
+        return results
+    
+    def _fetch_listings_batch(self, listing_ids: List[str]) -> Optional[List[Dict]]:
+        """Запрашивает данные листингов у EverBee (без кэша)"""
         if not self.ensure_token():
             logging.error("Не удалось получить валидный токен")
             return None
         
-        headers = {'x-access-token': self.token}
-        
         try:
-            response = requests.post(
-                self.LISTINGS_BATCH_URL, 
-                headers=headers, 
-                json={"listing_ids": listing_ids},
-                timeout=30
+            response = self._request(
+                'POST',
+                self.LISTINGS_BATCH_URL,
+                f"пакет из {len(listing_ids)} листингов",
+                json={"listing_ids": listing_ids}
             )
             
-            if response.status_code == 401:
-                logging.warning("Токен недействителен, получаем новый...")
-                if self.refresh_token():
-                    headers = {'x-access-token': self.token}
-                    response = requests.post(
-                        self.LISTINGS_BATCH_URL, 
-                        headers=headers, 
-                        json={"listing_ids": listing_ids},
-                        timeout=30
-                    )
-                else:
-                    logging.error("Не удалось обновить токен")
-                    return None
+            if response is None:
+                return None
             
             if response.status_code == 200:
-                return response.json()
+                return response.json().get("results", [])
             else:
                 logging.error(f"Ошибка получения данных листингов: {response.status_code}")
                 return None
@@ -338,7 +603,6 @@ class EverBeeClient:
             logging.error("Не удалось получить валидный токен")
             return None
         
-        headers = {'x-access-token': self.token}
         params = {
             'shop_name': shop_name,
             'order_by': order_by,
@@ -349,26 +613,10 @@ class EverBeeClient:
         }
         
         try:
-            response = requests.get(
-                self.SHOP_ANALYZE_URL, 
-                headers=headers, 
-                params=params,
-                timeout=30
-            )
+            response = self._request('GET', self.SHOP_ANALYZE_URL, f"магазин {shop_name}", params=params)
             
-            if response.status_code == 401:
-                logging.warning(f"Токен недействителен для магазина {shop_name}, получаем новый...")
-                if self.refresh_token():
-                    headers = {'x-access-token': self.token}
-                    response = requests.get(
-                        self.SHOP_ANALYZE_URL, 
-                        headers=headers, 
-                        params=params,
-                        timeout=30
-                    )
-                else:
-                    logging.error("Не удалось обновить токен")
-                    return None
+            if response is None:
+                return None
             
             if response.status_code == 200:
                 return response.json()
@@ -380,13 +628,24 @@ class EverBeeClient:
             logging.error(f"Ошибка запроса к EverBee для магазина {shop_name}: {e}")
             return None
     
-    def refresh_token(self) -> bool:
-        """Принудительно обновляет токен"""
-        logging.info("Принудительное обновление токена EverBee...")
-        new_token = self._authorize_and_get_token()
-        
-        if new_token:
-            self._save_token(new_token)
-            return True
+    def refresh_token(self, stale_token: Optional[str] = None, invalidate: bool = True) -> bool:
+        """Принудительно обновляет токен.
         
-        return False
\ No newline at end of file
+        stale_token - токен, получивший 401. Если другой поток уже успел его
+        заменить, повторная авторизация не выполняется. При invalidate=False
+        (фоновое обновление) старый токен остаётся в работе до получения нового.
+        """
+        if invalidate:
+            self.invalidate_token(stale_token)
+        with self._token_lock:
+            if stale_token and self.token and self.token != stale_token:
+                return True
+            
+            logging.info("Принудительное обновление токена EverBee...")
+            new_token = self._authorize_and_get_token()
+            
+            if new_token:
+                self._save_token(new_token)
+                return True
+            
+            return False
@@ -0,0 +1,40 @@
+"""
+Общие HTTP-сессии с пулом keep-alive соединений
+"""
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from typing import Dict
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def create_pooled_session(pool_size: int = 10) -> requests.Session:
+    """Создаёт requests.Session с пулом соединений заданного размера"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_shared_session(name: str, pool_size: int = 10) -> requests.Session:
+    """Возвращает общую на процесс сессию с указанным именем (создаётся при первом обращении)"""
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = create_pooled_session(pool_size)
+            _sessions[name] = session
+        return session
+
+
+def close_shared_sessions():
+    """Закрывает все общие сессии и их соединения"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            try:
+                session.close()
+            except Exception:
+                pass
+        _sessions.clear()
@@ -1,20 +1,188 @@
 """
 Менеджер для работы с резидентскими прокси
 """
+import os
+import sys
+import json
+import time
+import stat
+import atexit
 import random
+import shutil
+import hashlib
 import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict, Optional, Tuple
 
+# Сколько секунд не выдавать прокси после блокировки / сетевой ошибки
+BLOCK_COOLDOWN = 600
+FAILURE_COOLDOWN = 60
+# Вес нового замера в скользящей средней задержки
+LATENCY_ALPHA = 0.3
+# Как часто (сек) сохранять статистику прокси на диск; блокировки сохраняются сразу
+STATS_SAVE_INTERVAL = 30
+STATS_FILE = "proxy_stats.json"
+
+# Кэш собранных расширений авторизации прокси (папка и сколько последних расширений хранить)
+EXTENSION_CACHE_DIR = "proxy_extensions"
+EXTENSION_CACHE_SIZE = 50
+
+# Расширения из кэша, загруженные в запущенные браузеры: путь -> количество браузеров.
+# Такие папки не вытесняются из кэша (общий счётчик на процесс - воркеры могут иметь разные ProxyManager)
+_extensions_in_use: Dict[str, int] = {}
+_extensions_in_use_lock = threading.Lock()
+
+
+def _acquire_extension(extension_dir: str) -> None:
+    with _extensions_in_use_lock:
+        key = os.path.abspath(extension_dir)
+        _extensions_in_use[key] = _extensions_in_use.get(key, 0) + 1
+
+
+def _release_extension(extension_dir: str) -> None:
+    with _extensions_in_use_lock:
+        key = os.path.abspath(extension_dir)
+        count = _extensions_in_use.get(key, 0) - 1
+        if count > 0:
+            _extensions_in_use[key] = count
+        else:
+            _extensions_in_use.pop(key, None)
+
+
+def _project_dir() -> str:
+    """Папка проекта (или папка exe в собранной версии)"""
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def proxy_key(proxy_data: Dict[str, str]) -> str:
+    """Ключ прокси для статистики"""
+    return f"{proxy_data['host']}:{proxy_data['port']}:{proxy_data['username']}"
+
+
 class ProxyManager:
-    """Менеджер для работы с прокси из файла proxies.txt"""
+    """Менеджер для работы с прокси из файла proxies.txt.
+    
+    Для каждого прокси ведётся статистика (успехи, ошибки, блокировки, задержка),
+    она сохраняется в proxy_stats.json (в папке проекта) не чаще раза в STATS_SAVE_INTERVAL
+    и при завершении процесса, и используется при выборе прокси.
     
-    def __init__(self, proxy_file_path: str = "proxies.txt"):
+    Файл статистики пишет целиком один экземпляр, поэтому в приложении
+    используется общий менеджер из get_shared_proxy_manager().
+    """
+    
+    def __init__(self, proxy_file_path: str = "proxies.txt", stats_file_path: Optional[str] = None):
         self.proxy_file_path = proxy_file_path
+        self.stats_file_path = stats_file_path or os.path.join(_project_dir(), STATS_FILE)
         self.proxies = []
         self.current_proxy_index = 0
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Dict] = {}
+        self._stats_dirty = False
+        self._stats_saved_at = time.monotonic()
         # Очищаем старые временные файлы при запуске
         self.cleanup_all_proxy_extensions()
         self.load_proxies()
+        self.load_stats()
+    
+    def load_stats(self) -> None:
+        """Загружает сохранённую статистику прокси"""
+        try:
+            with open(self.stats_file_path, 'r', encoding='utf-8') as f:
+                self.stats = json.load(f)
+            logging.info(f"📊 Загружена статистика для {len(self.stats)} прокси")
+        except FileNotFoundError:
+            self.stats = {}
+        except Exception as e:
+            logging.warning(f"⚠️ Не удалось загрузить статистику прокси: {e}")
+            self.stats = {}
+    
+    def _save_stats(self) -> None:
+        """Сохраняет статистику прокси (вызывается под self._lock)"""
+        try:
+            tmp_path = self.stats_file_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.stats, f, ensure_ascii=False)
+            os.replace(tmp_path, self.stats_file_path)
+            self._stats_dirty = False
+            self._stats_saved_at = time.monotonic()
+        except Exception as e:
+            logging.warning(f"⚠️ Не удалось сохранить статистику прокси: {e}")
+    
+    def _stats_changed(self, save_now: bool = False) -> None:
+        """Отмечает изменение статистики; на диск - не чаще STATS_SAVE_INTERVAL (вызывается под self._lock)"""
+        self._stats_dirty = True
+        if save_now or time.monotonic() - self._stats_saved_at >= STATS_SAVE_INTERVAL:
+            self._save_stats()
+    
+    def flush_stats(self) -> None:
+        """Сохраняет несохранённую статистику (при закрытии браузеров и завершении процесса)"""
+        with self._lock:
+            if self._stats_dirty:
+                self._save_stats()
+    
+    def _stats_for(self, proxy_data: Dict[str, str]) -> Dict:
+        return self.stats.setdefault(proxy_key(proxy_data), {
+            'successes': 0, 'failures': 0, 'blocks': 0,
+            'latency': None, 'cooldown_until': 0
+        })
+    
+    def report_success(self, proxy_data: Optional[Dict[str, str]], latency: Optional[float] = None) -> None:
+        """Отмечает успешный запрос через прокси (latency - время ответа в секундах)"""
+        if not proxy_data:
+            return
+        with self._lock:
+            stats = self._stats_for(proxy_data)
+            stats['successes'] += 1
+            if latency is not None:
+                previous = stats['latency']
+                stats['latency'] = latency if previous is None else previous + LATENCY_ALPHA * (latency - previous)
+            self._stats_changed()
+    
+    def report_failure(self, proxy_data: Optional[Dict[str, str]]) -> None:
+        """Отмечает сетевую ошибку прокси (короткий cooldown)"""
+        if not proxy_data:
+            return
+        with self._lock:
+            stats = self._stats_for(proxy_data)
+            stats['failures'] += 1
+            stats['cooldown_until'] = max(stats['cooldown_until'], time.time() + FAILURE_COOLDOWN)
+            self._stats_changed()
+    
+    def report_blocked(self, proxy_data: Optional[Dict[str, str]]) -> None:
+        """Отмечает блокировку (403/капча) на прокси (длинный cooldown)"""
+        if not proxy_data:
+            return
+        with self._lock:
+            stats = self._stats_for(proxy_data)
+            stats['blocks'] += 1
+            stats['cooldown_until'] = max(stats['cooldown_until'], time.time() + BLOCK_COOLDOWN)
+            # Пауза после блокировки должна пережить перезапуск - сохраняем сразу
+            self._stats_changed(save_now=True)
+        logging.info(f"🧊 Прокси {proxy_data['host']}:{proxy_data['port']} на паузе {BLOCK_COOLDOWN} сек после блокировки")
+    
+    def proxy_score(self, proxy_data: Dict[str, str]) -> float:
+        """Рейтинг прокси: доля успешных запросов (блокировки весят вдвое), делённая на задержку"""
+        stats = self.stats.get(proxy_key(proxy_data))
+        if not stats:
+            return 0.5  # Непроверенный прокси - средний рейтинг
+        
+        attempts = stats['successes'] + stats['failures'] + 2 * stats['blocks']
+        success_rate = (stats['successes'] + 1) / (attempts + 2)
+        latency = stats['latency'] or 2.0
+        return success_rate / (1 + latency / 2.0)
+    
+    def _available_proxies(self) -> List[Dict[str, str]]:
+        """Прокси не на паузе (если на паузе все - все)"""
+        now = time.time()
+        available = [
+            proxy for proxy in self.proxies
+            if self.stats.get(proxy_key(proxy), {}).get('cooldown_until', 0) <= now
+        ]
+        return available or list(self.proxies)
     
     def load_proxies(self) -> None:
         """Загружает прокси из файла"""
@@ -70,13 +238,17 @@ class ProxyManager:
             return None
     
     def get_random_proxy(self) -> Optional[Dict[str, str]]:
-        """Возвращает случайный прокси"""
+        """Возвращает прокси случайно, но с учётом рейтинга (быстрые и не заблокированные - чаще)"""
         if not self.proxies:
             logging.error("❌ Нет доступных прокси!")
             return None
         
-        proxy = random.choice(self.proxies)
-        logging.info(f"🔄 Выбран случайный прокси: {proxy['host']}:{proxy['port']}")
+        with self._lock:
+            candidates = self._available_proxies()
+            weights = [self.proxy_score(proxy) ** 2 for proxy in candidates]
+        
+        proxy = random.choices(candidates, weights=weights, k=1)[0]
+        logging.info(f"🔄 Выбран прокси: {proxy['host']}:{proxy['port']} (рейтинг {self.proxy_score(proxy):.2f})")
         return proxy
     
     def get_next_proxy(self) -> Optional[Dict[str, str]]:
@@ -85,8 +257,14 @@ class ProxyManager:
             logging.error("❌ Нет доступных прокси!")
             return None
         
-        proxy = self.proxies[self.current_proxy_index]
-        self.current_proxy_index = (self.current_proxy_index + 1) % len(self.proxies)
+        with self._lock:
+            # Пропускаем прокси на паузе после блокировки (если на паузе все - берём по порядку)
+            now = time.time()
+            for _ in range(len(self.proxies)):
+                proxy = self.proxies[self.current_proxy_index]
+                self.current_proxy_index = (self.current_proxy_index + 1) % len(self.proxies)
+                if self.stats.get(proxy_key(proxy), {}).get('cooldown_until', 0) <= now:
+                    break
         
         logging.info(f"🔄 Выбран прокси #{self.current_proxy_index}: {proxy['host']}:{proxy['port']} (user: {proxy['username']})")
         return proxy
@@ -111,57 +289,10 @@ class ProxyManager:
     
     def get_proxy_auth_extension(self, proxy_data: Dict[str, str]) -> str:
         """
-        Создает Chrome extension для аутентификации прокси
-        Возвращает путь к папке расширения (не zip)
+        Возвращает Chrome extension для аутентификации прокси (путь к папке, не zip).
+        Расширения кэшируются по хэшу содержимого и переиспользуются между перезапусками браузера.
+        Папка считается занятой до вызова cleanup_proxy_extension (после закрытия браузера)
         """
-        import os
-        import tempfile
-        import json
-        import stat
-        import uuid
-        import shutil
-        
-        # Пробуем создать папку в разных местах
-        extension_dir = None
-        attempts = [
-            # 1. В текущей рабочей директории
-            lambda: os.path.join(os.getcwd(), f"proxy_auth_{uuid.uuid4().hex[:8]}"),
-            # 2. В папке temp проекта
-            lambda: os.path.join(os.getcwd(), "temp", f"proxy_auth_{uuid.uuid4().hex[:8]}"),
-            # 3. В системной temp (если доступна)
-            lambda: tempfile.mkdtemp(prefix="proxy_auth_")
-        ]
-        
-        for i, create_dir in enumerate(attempts):
-            try:
-                extension_dir = create_dir()
-                
-                # Создаем папку если её нет
-                if not os.path.exists(extension_dir):
-                    os.makedirs(extension_dir, exist_ok=True)
-                
-                # Проверяем права на запись
-                test_file = os.path.join(extension_dir, "test_write.tmp")
-                with open(test_file, "w") as f:
-                    f.write("test")
-                os.remove(test_file)
-                
-                logging.info(f"✅ Создана папка расширения (попытка {i+1}): {extension_dir}")
-                break
-                
-            except Exception as e:
-                logging.warning(f"⚠️ Попытка {i+1} создания папки не удалась: {e}")
-                if extension_dir and os.path.exists(extension_dir):
-                    try:
-                        shutil.rmtree(extension_dir, ignore_errors=True)
-                    except:
-                        pass
-                extension_dir = None
-                continue
-        
-        if not extension_dir:
-            raise Exception("Не удалось создать папку для расширения прокси")
-        
         # Экранируем специальные символы в пароле для JavaScript
         escaped_password = proxy_data['password'].replace('\\', '\\\\').replace('"', '\\"').replace("'", "\\'")
         escaped_username = proxy_data['username'].replace('\\', '\\\\').replace('"', '\\"').replace("'", "\\'")
@@ -310,13 +441,60 @@ chrome.webRequest.onCompleted.addListener(
 console.log("🎯 Расширение готово к работе!");
 """
         
-        # Записываем файлы
+        # Расширение однозначно определяется своим содержимым: одинаковые прокси - одна папка в кэше
+        manifest_json = json.dumps(manifest_content, indent=2, ensure_ascii=False)
+        content_hash = hashlib.sha256((manifest_json + background_content).encode('utf-8')).hexdigest()[:16]
+        
+        last_error = None
+        for cache_root in self._extension_cache_roots():
+            extension_dir = os.path.join(cache_root, content_hash)
+            try:
+                _acquire_extension(extension_dir)
+                try:
+                    if self._is_extension_ready(extension_dir):
+                        # Обновляем время использования для LRU
+                        os.utime(extension_dir, None)
+                        logging.info(f"♻️ Используем расширение прокси из кэша: {extension_dir}")
+                        return extension_dir
+                    
+                    self._write_extension(cache_root, extension_dir, manifest_json, background_content)
+                except Exception:
+                    _release_extension(extension_dir)
+                    raise
+                logging.info(f"✅ Создано расширение для прокси: {extension_dir}")
+                self._evict_cached_extensions(cache_root, keep=extension_dir)
+                return extension_dir
+                
+            except Exception as e:
+                logging.warning(f"⚠️ Не удалось подготовить расширение в {cache_root}: {e}")
+                last_error = e
+        
+        raise Exception(f"Не удалось создать папку для расширения прокси: {last_error}")
+    
+    @staticmethod
+    def _extension_cache_roots() -> List[str]:
+        """Папки кэша расширений по приоритету: temp проекта, затем системная temp"""
+        return [
+            os.path.join(os.getcwd(), "temp", EXTENSION_CACHE_DIR),
+            os.path.join(tempfile.gettempdir(), EXTENSION_CACHE_DIR)
+        ]
+    
+    @staticmethod
+    def _is_extension_ready(extension_dir: str) -> bool:
+        return (os.path.isfile(os.path.join(extension_dir, "manifest.json")) and
+                os.path.isfile(os.path.join(extension_dir, "background.js")))
+    
+    @staticmethod
+    def _write_extension(cache_root: str, extension_dir: str, manifest_json: str, background_content: str) -> None:
+        """Записывает расширение во временную папку и атомарно переименовывает её в extension_dir"""
+        os.makedirs(cache_root, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=".building_", dir=cache_root)
         try:
-            manifest_path = os.path.join(extension_dir, "manifest.json")
+            manifest_path = os.path.join(tmp_dir, "manifest.json")
             with open(manifest_path, "w", encoding='utf-8') as f:
-                json.dump(manifest_content, f, indent=2, ensure_ascii=False)
+                f.write(manifest_json)
             
-            background_path = os.path.join(extension_dir, "background.js")
+            background_path = os.path.join(tmp_dir, "background.js")
             with open(background_path, "w", encoding='utf-8') as f:
                 f.write(background_content)
             
@@ -324,22 +502,40 @@ console.log("🎯 Расширение готово к работе!");
             try:
                 os.chmod(manifest_path, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
                 os.chmod(background_path, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
-            except:
+            except Exception:
                 pass  # Игнорируем ошибки chmod на Windows
             
-            logging.info(f"✅ Создано расширение для прокси: {extension_dir}")
-            logging.info(f"📁 Путь к расширению: {extension_dir}")
-            
-            return extension_dir
-            
-        except Exception as e:
-            logging.error(f"❌ Ошибка записи файлов расширения: {e}")
-            # Очищаем папку при ошибке
             try:
-                shutil.rmtree(extension_dir, ignore_errors=True)
-            except:
-                pass
-            raise e
+                os.rename(tmp_dir, extension_dir)
+            except OSError:
+                # Другой поток уже собрал такое же расширение
+                if not ProxyManager._is_extension_ready(extension_dir):
+                    raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    
+    @staticmethod
+    def _evict_cached_extensions(cache_root: str, keep: str, max_entries: int = None) -> None:
+        """Удаляет давно не использованные расширения, оставляя max_entries последних (LRU).
+        Расширения, загруженные в работающие браузеры, не удаляются"""
+        max_entries = max_entries or EXTENSION_CACHE_SIZE
+        try:
+            entries = [
+                os.path.join(cache_root, name) for name in os.listdir(cache_root)
+                if not name.startswith('.')
+            ]
+            with _extensions_in_use_lock:
+                in_use = set(_extensions_in_use)
+            entries = [
+                path for path in entries
+                if os.path.isdir(path) and path != keep and os.path.abspath(path) not in in_use
+            ]
+            entries.sort(key=os.path.getmtime, reverse=True)
+            for path in entries[max(0, max_entries - 1):]:
+                shutil.rmtree(path, ignore_errors=True)
+                logging.info(f"🧹 Удалено неиспользуемое расширение прокси: {path}")
+        except Exception as e:
+            logging.warning(f"⚠️ Ошибка при очистке кэша расширений прокси: {e}")
     
     def get_chrome_args_with_proxy(self, proxy_data: Dict[str, str]) -> List[str]:
         """
@@ -439,39 +635,49 @@ console.log("🎯 Расширение готово к работе!");
             proxy_dict = self.format_proxy_for_requests(proxy_data)
             
             # Тестируем прокси
+            started = time.monotonic()
             response = requests.get(
                 'https://ip.decodo.com/json',
                 proxies=proxy_dict,
                 timeout=10
             )
+            latency = time.monotonic() - started
             
             if response.status_code == 200:
                 result = response.json()
-                logging.info(f"✅ Прокси работает. IP: {result.get('ip', 'unknown')}")
+                logging.info(f"✅ Прокси работает. IP: {result.get('ip', 'unknown')} ({latency:.2f} сек)")
+                self.report_success(proxy_data, latency)
                 return True
             else:
                 logging.error(f"❌ Прокси не работает. Статус: {response.status_code}")
+                self.report_failure(proxy_data)
                 return False
                 
         except Exception as e:
             logging.error(f"❌ Ошибка при тестировании прокси: {e}")
+            self.report_failure(proxy_data)
             return False
     
     def get_working_proxy(self) -> Optional[Dict[str, str]]:
         """
-        Возвращает первый рабочий прокси из списка
+        Возвращает рабочий прокси: до 5 лучших по рейтингу проверяются параллельно,
+        выбирается первый ответивший
         """
         if not self.proxies:
             return None
         
-        # Перемешиваем прокси для случайного выбора
-        shuffled_proxies = self.proxies.copy()
-        random.shuffle(shuffled_proxies)
+        with self._lock:
+            candidates = sorted(self._available_proxies(), key=self.proxy_score, reverse=True)[:5]
         
-        for proxy in shuffled_proxies[:5]:  # Тестируем максимум 5 прокси
-            logging.info(f"🧪 Тестируем прокси: {proxy['host']}:{proxy['port']}")
-            if self.test_proxy(proxy):
-                return proxy
+        executor = ThreadPoolExecutor(max_workers=len(candidates), thread_name_prefix="proxy-probe")
+        try:
+            futures = {executor.submit(self.test_proxy, proxy): proxy for proxy in candidates}
+            for future in as_completed(futures):
+                if future.result():
+                    return futures[future]
+        finally:
+            # Не ждём остальные проверки - их результаты всё равно попадут в статистику
+            executor.shutdown(wait=False)
         
         logging.error("❌ Не найдено рабочих прокси!")
         return None
@@ -498,14 +704,17 @@ console.log("🎯 Расширение готово к работе!");
         return True
     
     def cleanup_proxy_extension(self, extension_path: str) -> None:
-        """Очищает временные файлы расширения прокси"""
+        """Очищает временные файлы расширения прокси.
+        Расширения из кэша не удаляются (их вытесняет LRU) - только освобождаются"""
         try:
-            import os
-            import shutil
+            cache_roots = [os.path.abspath(root) for root in self._extension_cache_roots()]
+            if os.path.dirname(os.path.abspath(extension_path)) in cache_roots:
+                _release_extension(extension_path)
+                return
+            
             if os.path.exists(extension_path):
                 # Сначала пытаемся изменить права доступа для удаления
                 try:
-                    import stat
                     for root, dirs, files in os.walk(extension_path):
                         for d in dirs:
                             os.chmod(os.path.join(root, d), stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
@@ -520,11 +729,8 @@ console.log("🎯 Расширение готово к работе!");
             logging.warning(f"⚠️ Ошибка при удалении расширения прокси: {e}")
     
     def cleanup_all_proxy_extensions(self) -> None:
-        """Очищает все временные папки расширений прокси"""
+        """Очищает старые одноразовые папки расширений прокси (кэш proxy_extensions не трогает)"""
         try:
-            import os
-            import shutil
-            import tempfile
             import glob
             
             # Очищаем в текущей директории
@@ -562,7 +768,38 @@ console.log("🎯 Расширение готово к работе!");
     
     def get_proxy_stats(self) -> Dict[str, int]:
         """Возвращает статистику по прокси"""
+        now = time.time()
         return {
             'total_proxies': len(self.proxies),
-            'current_index': self.current_proxy_index
-        }
\ No newline at end of file
+            'current_index': self.current_proxy_index,
+            'cooling_down': sum(
+                1 for proxy in self.proxies
+                if self.stats.get(proxy_key(proxy), {}).get('cooldown_until', 0) > now
+            )
+        }
+
+
+_managers: Dict[str, ProxyManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_shared_proxy_manager(proxy_file_path: str = "proxies.txt") -> ProxyManager:
+    """Возвращает общий на процесс ProxyManager для файла прокси"""
+    key = os.path.abspath(proxy_file_path)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = ProxyManager(proxy_file_path)
+            _managers[key] = manager
+        return manager
+
+
+def _flush_shared_managers() -> None:
+    """Сохраняет статистику общих менеджеров при завершении процесса"""
+    with _managers_lock:
+        managers = list(_managers.values())
+    for manager in managers:
+        manager.flush_stats()
+
+
+atexit.register(_flush_shared_managers)
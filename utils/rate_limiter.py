@@ -0,0 +1,120 @@
+"""
+Общий ограничитель частоты запросов для параллельных потоков
+"""
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+
+class RateLimiter:
+    """Потокобезопасный ограничитель: не чаще одного запроса за min_interval секунд"""
+
+    def __init__(self, min_interval: float = 0.0):
+        self.min_interval = max(0.0, float(min_interval or 0))
+        self._lock = threading.Lock()
+        self._next_allowed = 0.0
+
+    def acquire(self):
+        """Блокирует поток до момента, когда следующий запрос разрешён"""
+        if self.min_interval <= 0:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_allowed - now
+            self._next_allowed = max(now, self._next_allowed) + self.min_interval
+
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+class TokenBucketLimiter:
+    """Потокобезопасный token bucket с адаптивным снижением скорости.
+    
+    При 429 скорость уменьшается вдвое (и учитывается Retry-After), после
+    успешных ответов постепенно возвращается к исходной.
+    """
+
+    def __init__(self, rate: float, burst: int = 1, min_rate: float = 0.2):
+        self.max_rate = max(float(rate), min_rate)
+        self.min_rate = min_rate
+        self.rate = self.max_rate
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Блокирует поток до получения токена"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._blocked_until:
+                    wait_time = self._blocked_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                else:
+                    wait_time = (1 - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+    def on_throttled(self, retry_after: Optional[float] = None):
+        """Сообщает об ответе 429: снижает скорость и при необходимости ставит паузу"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0.0
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+
+    def on_success(self):
+        """Сообщает об успешном ответе: плавно восстанавливает скорость"""
+        if self.rate >= self.max_rate:
+            return
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Экспоненциальная задержка с полным джиттером для попытки attempt (с 0)"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Разбирает заголовок Retry-After (секунды или HTTP-дата) в секунды ожидания"""
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except Exception:
+        return None
+
+
+_limiters: Dict[str, TokenBucketLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_shared_limiter(name: str, rate: float, burst: int = 1) -> TokenBucketLimiter:
+    """Возвращает общий на процесс ограничитель с указанным именем"""
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = TokenBucketLimiter(rate, burst)
+            _limiters[name] = limiter
+        return limiter
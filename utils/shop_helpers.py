@@ -39,17 +39,12 @@ def extract_shop_names_from_results(results: Dict) -> Dict[str, str]:
                     listing_to_shop[listing_id] = shop_name
         
         if 'new_products' in results:
+            # Магазин первого листинга со ссылкой вида shop_home_active (ищем один раз, а не для каждого товара)
+            shop_home_shop = _first_shop_home_active_shop(results.get('shops', {}))
+            
             for listing_id, url in results['new_products'].items():
                 if listing_id not in listing_to_shop:
-                    found_shop = None
-                    if 'shops' in results:
-                        for shop_name, products in results['shops'].items():
-                            for existing_listing_id, existing_url in products.items():
-                                if _urls_from_same_shop(url, existing_url):
-                                    found_shop = shop_name
-                                    break
-                            if found_shop:
-                                break
+                    found_shop = shop_home_shop if shop_home_shop and _is_shop_home_active_url(url) else None
                     
                     if found_shop:
                         listing_to_shop[listing_id] = found_shop
@@ -67,33 +62,43 @@ def extract_shop_names_from_results(results: Dict) -> Dict[str, str]:
         return {}
 
 
-def _urls_from_same_shop(url1: str, url2: str) -> bool:
+def _is_shop_home_active_url(url: str) -> bool:
     try:
         from urllib.parse import urlparse, parse_qs
         
-        parsed1 = urlparse(url1)
-        parsed2 = urlparse(url2)
-        
-        query1 = parse_qs(parsed1.query)
-        query2 = parse_qs(parsed2.query)
-        
-        ref1 = query1.get('ref', [''])[0]
-        ref2 = query2.get('ref', [''])[0]
-        
-        if ref1 and ref2 and 'shop_home_active' in ref1 and 'shop_home_active' in ref2:
-            return True
-            
-        return False
+        ref = parse_qs(urlparse(url).query).get('ref', [''])[0]
+        return bool(ref) and 'shop_home_active' in ref
         
     except Exception:
         return False
 
 
-def get_shop_name_for_product(listing_id: str, url: str, results: Dict = None) -> str:
-    if results:
+def _first_shop_home_active_shop(shops: Dict[str, Dict[str, str]]) -> Optional[str]:
+    for shop_name, products in shops.items():
+        for url in products.values():
+            if _is_shop_home_active_url(url):
+                return shop_name
+    return None
+
+
+def build_listing_shop_map(shop_listings: Dict[str, Dict[str, str]], listing_ids=None) -> Dict[str, str]:
+    """Карта listing_id -> магазин за один проход (только для listing_ids, если они заданы)"""
+    wanted = set(listing_ids) if listing_ids is not None else None
+    return {
+        listing_id: shop_name
+        for shop_name, listings in shop_listings.items()
+        for listing_id in listings
+        if wanted is None or listing_id in wanted
+    }
+
+
+def get_shop_name_for_product(listing_id: str, url: str, results: Dict = None,
+                              listing_to_shop: Optional[Dict[str, str]] = None) -> str:
+    """Магазин товара. listing_to_shop - заранее построенная карта (иначе строится по results)"""
+    if listing_to_shop is None and results:
         listing_to_shop = extract_shop_names_from_results(results)
-        if listing_id in listing_to_shop:
-            return listing_to_shop[listing_id]
+    if listing_to_shop and listing_id in listing_to_shop:
+        return listing_to_shop[listing_id]
     
     shop_name = extract_shop_name_from_url(url)
     return shop_name if shop_name else "Unknown"
\ No newline at end of file
@@ -1,16 +1,16 @@
 """
 Тестовый скрипт для проверки экспорта в Google Sheets
-Использует несколько реальных записей из top-listings.json
+Использует несколько реальных записей из хранилища топ-листингов
 """
 import sys
 import os
-import json
 import logging
 
 # Add project root to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from services.google_sheets_service import GoogleSheetsService
+from services.listing_store import get_listing_store
 from config.settings import config
 
 # Setup logging
@@ -19,18 +19,11 @@ logging.basicConfig(level=logging.INFO)
 def test_sheets_export():
     print("🚀 Тестирование экспорта в Google Sheets...")
     
-    tops_file = os.path.join(config.output_dir, "tops", "top-listings.json")
-    if not os.path.exists(tops_file):
-        print(f"❌ Файл не найден: {tops_file}")
-        return
-    
     # Загружаем данные
-    with open(tops_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    all_listings = data.get("listings", {})
+    store = get_listing_store(os.path.join(config.output_dir, "tops"))
+    all_listings = store.load_tops().get("listings", {})
     if not all_listings:
-        print("❌ Нет данных в top-listings.json")
+        print(f"❌ Нет топ-листингов в {store.db_path}")
         return
     
     # Берем первые 5 записей для теста